@@ -2,6 +2,7 @@ import traceback
 import datetime
 import os
 import pathlib
+import multiprocessing
 
 """
 The main entry point.
@@ -29,6 +30,8 @@ def _generate_readme(name_of_game):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # zones get pregenerated in a worker process
+
     version_string = "?"
     try:
         import src.game.debug as debug
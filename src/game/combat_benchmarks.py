@@ -0,0 +1,152 @@
+import src.game.simulation as simulation  # must be imported before pygame is initialized
+
+import random
+import time
+
+import src.game.gameengine as gameengine
+import src.game.statuseffects as statuseffects
+import src.game.stats as stats
+from src.game.stats import StatTypes
+from src.game.inventory import InventoryState
+
+
+"""
+Benchmarks for combat: a player and an enemy trading blows (and status effects, and equipment swaps) for
+a bunch of turns, with every stat lookup that the game does per turn along the way.
+
+Run with: python -m src.game.combat_benchmarks
+"""
+
+
+class _ReferenceActorState(gameengine.ActorState):
+    """the old ActorState.stat_value, which re-adds every equipped item and status effect on each lookup."""
+
+    def stat_value(self, stat_type, local=False):
+        res = self.base_stats.stat_value(stat_type, local=local)
+        for item in self.inventory().all_equipped_items():
+            res += item.stat_value(stat_type, local=local)
+
+        for status_effect in self.status_effects:
+            res += status_effect.stat_value(stat_type, local=local)
+
+        return res
+
+
+_EFFECTS = (statuseffects.StatusEffectTypes.POISON,
+            statuseffects.StatusEffectTypes.SLOWNESS,
+            statuseffects.StatusEffectTypes.SPEED,
+            statuseffects.StatusEffectTypes.PLUS_DEFENSES,
+            statuseffects.StatusEffectTypes.CONFUSION,
+            statuseffects.StatusEffectTypes.HP_REGEN_1)
+
+
+def _gen_items(level, n, rand):
+    """returns: n random items"""
+    from src.items.itemgen import ItemFactory
+
+    random.seed(rand.random())
+    res = []
+    while len(res) < n:
+        item = ItemFactory.gen_item(level)
+        if item is not None:
+            res.append(item)
+    return res
+
+
+def _build_fighters(level, n_items, rand, reference):
+    """returns: (player ActorState, enemy ActorState, list of spare items for the player to swap in)"""
+    import src.game.enemies as enemies
+
+    player_items = _gen_items(level, n_items * 2, rand)
+    player_inv = InventoryState()
+    for it in player_items[:n_items]:
+        player_inv.add_to_equipment(it)
+
+    random.seed(rand.random())
+    enemy_state = enemies.EnemyFactory.gen_enemy(None, level).get_actor_state()
+
+    player_state = gameengine.ActorState("player", level, stats.default_player_stats(), player_inv, 0, True)
+    if reference:
+        player_state.__class__ = _ReferenceActorState
+        enemy_state.__class__ = _ReferenceActorState
+
+    return player_state, enemy_state, player_items[n_items:]
+
+
+def _fight(player_state, enemy_state, spare_items, n_turns, seed):
+    """returns: a log of everything that happened (which should be the same for both kinds of ActorState)."""
+    rand = random.Random(seed)
+    random.seed(seed)
+    log = []
+
+    for turn in range(0, n_turns):
+        for (attacker, defender) in ((player_state, enemy_state), (enemy_state, player_state)):
+            # the per-turn lookups that every actor does
+            log.append((attacker.speed(), attacker.intelligence(), attacker.unarmed_range(),
+                        attacker.unarmed_is_projectile(), attacker.light_level(), attacker.is_confused(),
+                        attacker.is_grasped(), attacker.is_flinched(), attacker.is_nullified()))
+
+            dmg = gameengine.determine_damage_dealt(attacker, defender)
+            if dmg >= defender.hp():
+                defender.set_hp(defender.max_hp())  # no one's allowed to die (kills need entities)
+                dmg = min(dmg, defender.hp() - 1)
+            gameengine.apply_damage_and_hit_effects(dmg, attacker, defender, item_used=None)
+            log.append((dmg, defender.hp(), defender.max_hp()))
+
+        if turn % 3 == 0:
+            target = rand.choice((player_state, enemy_state))
+            target.try_to_add_status_effect(rand.choice(_EFFECTS), rand.randint(1, 5))
+
+        if turn % 10 == 0 and len(spare_items) > 0:
+            equip_grid = player_state.inventory().get_equip_grid()
+            equipped = list(equip_grid.all_items())
+            if len(equipped) > 0:
+                to_swap = rand.choice(equipped)
+                to_equip = spare_items.pop(0)
+                equip_grid.remove(to_swap)
+                if player_state.inventory().add_to_equipment(to_equip):
+                    spare_items.append(to_swap)
+                else:
+                    player_state.inventory().add_to_equipment(to_swap)
+                    spare_items.append(to_equip)
+
+        for a_state in (player_state, enemy_state):
+            a_state.countdown_status_effects()
+
+        log.append(tuple(player_state.stat_value(s) for s in StatTypes.all_types()))
+        log.append(tuple(enemy_state.stat_value(s) for s in StatTypes.all_types()))
+
+    return log
+
+
+def bench_fight(levels=(2, 6, 12), n_items=6, n_turns=100, n_trials=10, seed=707):
+    for level in levels:
+        old_time = 0
+        new_time = 0
+
+        for trial in range(0, n_trials):
+            fight_seed = seed + trial * 31 + level
+
+            old_fighters = _build_fighters(level, n_items, random.Random(fight_seed), True)
+            start = time.perf_counter()
+            expected = _fight(*old_fighters, n_turns, fight_seed)
+            old_time += time.perf_counter() - start
+
+            new_fighters = _build_fighters(level, n_items, random.Random(fight_seed), False)
+            start = time.perf_counter()
+            actual = _fight(*new_fighters, n_turns, fight_seed)
+            new_time += time.perf_counter() - start
+
+            if expected != actual:
+                idx = min(i for i in range(0, len(expected)) if expected[i] != actual[i])
+                raise ValueError("fight mismatch (level={}, seed={}) at log entry {}:\nexpected: {}\ngot: {}".format(
+                    level, fight_seed, idx, expected[idx], actual[idx]))
+
+        print("INFO: {}-turn fight at level {} ({} items equipped):\told={:.3f}ms\tcached={:.3f}ms\t({:.1f}x)".format(
+            n_turns, level, n_items, old_time * 1000 / n_trials, new_time * 1000 / n_trials,
+            old_time / max(new_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    simulation.init()
+    bench_fight()
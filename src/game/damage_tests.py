@@ -0,0 +1,116 @@
+import argparse
+import itertools
+import math
+import random
+
+import src.game.damagetables as damagetables
+import src.game.gameengine as gameengine
+from src.game.stats import StatTypes, BasicStatLookup
+
+
+def check_exact_odds(max_dice=8):
+    """
+        rolls every possible combination of dice (for small enough ATT and DEF) and checks that the damage
+        tables give exactly the same odds.
+
+        returns: a description of the first mismatch, or None if they all match.
+    """
+    for att in range(0, max_dice + 1):
+        for defense in range(0, max_dice + 1 - att):
+            counts = [0] * (att + 1)
+            for atts in itertools.product(range(1, 7), repeat=att):
+                for defs in itertools.product(range(1, 5), repeat=defense):
+                    counts[gameengine.resolve_damage_dice(list(atts), list(defs))] += 1
+
+            total = 6 ** att * 4 ** defense
+            expected = damagetables.damage_distribution(att, defense)
+            for dmg in range(0, att + 1):
+                if abs(counts[dmg] / total - expected[dmg]) > 1e-12:
+                    return "att={}, def={}: P(dmg={}) should be {}, but the table says {}".format(
+                        att, defense, dmg, counts[dmg] / total, expected[dmg])
+    return None
+
+
+def _chi_squared_p_value(observed, expected_probs):
+    """
+        pearson's chi-squared test, with outcomes that are expected less than 5 times lumped together.
+        returns: the (approximate) p-value
+    """
+    n = sum(observed)
+    bins = []  # (observed, expected)
+    cur_obs, cur_exp = 0, 0
+    for (obs, p) in zip(observed, expected_probs):
+        cur_obs += obs
+        cur_exp += p * n
+        if cur_exp >= 5:
+            bins.append((cur_obs, cur_exp))
+            cur_obs, cur_exp = 0, 0
+    if len(bins) > 0:
+        bins[-1] = (bins[-1][0] + cur_obs, bins[-1][1] + cur_exp)
+
+    dof = len(bins) - 1
+    if dof < 1:
+        return 1.0
+
+    stat = sum((obs - exp) ** 2 / exp for (obs, exp) in bins)
+
+    # wilson-hilferty: (stat / dof)^(1/3) is roughly normal
+    z = ((stat / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _damage_samples(att, defense, n, sampling):
+    attacker = BasicStatLookup({StatTypes.ATT: att})
+    defender = BasicStatLookup({StatTypes.DEF: defense})
+
+    was_enabled = damagetables.is_sampling_enabled()
+    damagetables.set_sampling_enabled(sampling)
+    try:
+        counts = [0] * (att + 1)
+        for _ in range(0, n):
+            counts[gameengine.determine_damage_dealt(attacker, defender)] += 1
+        return counts
+    finally:
+        damagetables.set_sampling_enabled(was_enabled)
+
+
+def test_sampling_matches_rolls(pairs, n, seed=0, alpha=1e-4):
+    """
+        draws n damage values for each (ATT, DEF) pair, both by rolling dice and by sampling from the tables,
+        and checks that both look like they came from the exact distribution.
+
+        returns: a description of the first failure, or None if they all pass.
+    """
+    random.seed(seed)
+    for (att, defense) in pairs:
+        expected = damagetables.damage_distribution(att, defense)
+        for sampling in (False, True):
+            counts = _damage_samples(att, defense, n, sampling)
+            p_value = _chi_squared_p_value(counts, expected)
+            print("INFO: att={},\tdef={},\t{}:\tp={:.4f}".format(att, defense, "sampled" if sampling else "rolled",
+                                                               p_value))
+            if p_value < alpha:
+                return "att={}, def={}: {} damage doesn't match the table (p={}):\ncounts={}\nexpected={}".format(
+                    att, defense, "sampled" if sampling else "rolled", p_value, counts,
+                    [round(p * n, 1) for p in expected])
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the damage tables against actual dice rolls.")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the statistical tests")
+    parser.add_argument("--samples", type=int, default=20000, help="number of damage rolls per (ATT, DEF) pair")
+    args = parser.parse_args()
+
+    problem = check_exact_odds()
+    if problem is not None:
+        print("FAIL: {}".format(problem))
+        quit(1)
+    print("INFO: exact odds match every roll for up to 8 dice")
+
+    test_pairs = [(1, 0), (3, 1), (4, 4), (6, 2), (8, 8), (12, 5), (20, 12), (32, 32)]
+    problem = test_sampling_matches_rolls(test_pairs, args.samples, seed=args.seed)
+    if problem is not None:
+        print("FAIL: {}".format(problem))
+        quit(1)
+    print("INFO: sampled and rolled damage both match the tables")
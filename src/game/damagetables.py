@@ -0,0 +1,197 @@
+import math
+import random
+
+import numpy
+
+
+"""
+Exact odds for gameengine.determine_damage_dealt, which rolls a D6 for each point of ATT and a D4 for each point of
+DEF, and then lets each defense die (lowest first) block the lowest remaining attack die that's no higher than it.
+
+Scanning the die values from low to high, the attack dice showing a value become available to be blocked, and
+then each defense die showing that value blocks one of the available ones (if there are any). so the damage only
+depends on how many dice of each side land on each value, which makes it possible to find the whole distribution
+with a single dynamic program over (unblocked attack dice, attack dice so far, defense dice so far) for every
+(ATT, DEF) pair at once.
+"""
+
+# the table starts out this big, and grows (up to the max) when something asks about bigger values
+DEFAULT_MAX_ATT = 32
+DEFAULT_MAX_DEF = 32
+
+# past this, the float math in the dynamic program stops being trustworthy
+HARD_MAX = 128
+
+_ATT_SIDES = 6
+_DEF_SIDES = 4
+
+_table = None
+_sampling_enabled = False
+
+
+def is_sampling_enabled():
+    return _sampling_enabled
+
+
+def set_sampling_enabled(val):
+    """
+        whether determine_damage_dealt should draw from the table instead of rolling dice. the odds are exactly the
+        same either way, but sampling uses fewer random numbers, so it'll change what happens with a given seed.
+    """
+    global _sampling_enabled
+    _sampling_enabled = val
+
+
+def get_table(max_att=DEFAULT_MAX_ATT, max_def=DEFAULT_MAX_DEF):
+    """returns: a DamageTable covering at least the given ATT and DEF values."""
+    global _table
+    if max_att > HARD_MAX or max_def > HARD_MAX:
+        raise ValueError("damage table can't go past {}: att={}, def={}".format(HARD_MAX, max_att, max_def))
+
+    if _table is None or _table.max_att < max_att or _table.max_def < max_def:
+        if _table is None:
+            max_att = max(max_att, DEFAULT_MAX_ATT)
+            max_def = max(max_def, DEFAULT_MAX_DEF)
+        else:
+            max_att = min(HARD_MAX, max(max_att, 2 * _table.max_att))
+            max_def = min(HARD_MAX, max(max_def, 2 * _table.max_def))
+        _table = DamageTable(max_att, max_def)
+
+    return _table
+
+
+def damage_distribution(att, defense):
+    """returns: 1D array of the chance of dealing 0, 1, ..., att damage."""
+    att, defense = max(0, att), max(0, defense)
+    return get_table(att, defense).distribution(att, defense)
+
+
+def expected_damage(att, defense):
+    att, defense = max(0, att), max(0, defense)
+    return get_table(att, defense).expected_damage(att, defense)
+
+
+def chance_to_hit(att, defense):
+    """returns: the chance of dealing at least 1 damage."""
+    att, defense = max(0, att), max(0, defense)
+    return 1 - get_table(att, defense).distribution(att, defense)[0]
+
+
+def can_sample(att, defense):
+    """returns: whether sample_damage can be used for these values, without building a bigger table."""
+    return (_sampling_enabled and att <= DEFAULT_MAX_ATT and defense <= DEFAULT_MAX_DEF
+            and (_table is None or (att <= _table.max_att and defense <= _table.max_def)))
+
+
+def sample_damage(att, defense, rand=random):
+    att, defense = max(0, att), max(0, defense)
+    return get_table(att, defense).sample(att, defense, rand=rand)
+
+
+class DamageTable:
+    """
+        probs: (max_att + 1) x (max_def + 1) x (max_att + 1) array, where probs[att, def, dmg] is the chance of
+               dealing exactly dmg damage.
+        alias_probs, aliases: the same shape as probs, for sampling with the alias method. for each (att, def),
+                              only the first att + 1 entries are used.
+    """
+
+    def __init__(self, max_att, max_def):
+        self.max_att = max_att
+        self.max_def = max_def
+
+        self.probs = DamageTable._compute_probs(max_att, max_def)
+        self.alias_probs, self.aliases = DamageTable._compute_aliases(self.probs)
+
+        # expected[att, def]
+        self.expected = (self.probs * numpy.arange(0, max_att + 1)).sum(axis=2)
+
+    def distribution(self, att, defense):
+        return self.probs[att, defense, :att + 1]
+
+    def expected_damage(self, att, defense):
+        return float(self.expected[att, defense])
+
+    def sample(self, att, defense, rand=random):
+        """uses exactly one random number."""
+        x = rand.random() * (att + 1)
+        idx = int(x)
+        if x - idx < self.alias_probs[att, defense, idx]:
+            return idx
+        else:
+            return int(self.aliases[att, defense, idx])
+
+    @staticmethod
+    def _compute_probs(max_att, max_def):
+        n_a = max_att + 1
+        n_d = max_def + 1
+
+        inv_fact = numpy.array([1 / math.factorial(n) for n in range(0, max(n_a, n_d))])
+
+        # w[u, a, d]: sum over the ways to roll a attack dice and d defense dice at or below the current value
+        # (with u attack dice left unblocked) of 1 / (product of the factorials of how many dice show each value).
+        # that's the multinomial coefficient without the a! and d! (which get put back at the end).
+        w = numpy.zeros((n_a, n_a, n_d))
+        w[0, 0, 0] = 1
+
+        for _ in range(0, _DEF_SIDES):
+            # attack dice showing this value
+            new_w = numpy.zeros_like(w)
+            for n in range(0, n_a):
+                new_w[n:, n:, :] += w[:n_a - n, :n_a - n, :] * inv_fact[n]
+            w = new_w
+
+            # defense dice showing this value, each blocking one unblocked attack die (if there are any)
+            new_w = numpy.zeros_like(w)
+            for m in range(0, n_d):
+                shifted = w[:, :, :n_d - m] * inv_fact[m]
+                if m < n_a:
+                    new_w[:n_a - m, :, m:] += shifted[m:]
+                new_w[0, :, m:] += shifted[:m].sum(axis=0)
+            w = new_w
+
+        # the attack dice above the highest defense value are never blocked
+        high_sides = _ATT_SIDES - _DEF_SIDES
+        probs = numpy.zeros((n_a, n_d, n_a))
+        for att in range(0, n_a):
+            for a in range(0, att + 1):
+                n_high = att - a
+                weight = high_sides ** n_high * inv_fact[n_high]
+                probs[att, :, n_high:n_high + a + 1] += weight * w[:a + 1, a, :].T
+
+        att_norm = numpy.array([math.factorial(a) / _ATT_SIDES ** a for a in range(0, n_a)])
+        def_norm = numpy.array([math.factorial(d) / _DEF_SIDES ** d for d in range(0, n_d)])
+        probs *= att_norm[:, None, None] * def_norm[None, :, None]
+
+        return probs
+
+    @staticmethod
+    def _compute_aliases(probs):
+        """Vose's alias method, for each (att, def)."""
+        alias_probs = numpy.ones(probs.shape)
+        aliases = numpy.zeros(probs.shape, dtype=numpy.uint8 if probs.shape[2] <= 256 else numpy.int32)
+
+        for att in range(0, probs.shape[0]):
+            n = att + 1
+            for defense in range(0, probs.shape[1]):
+                scaled = [p * n for p in probs[att, defense, :n].tolist()]
+                small = [i for i in range(0, n) if scaled[i] < 1]
+                large = [i for i in range(0, n) if scaled[i] >= 1]
+                row_probs = alias_probs[att, defense]
+                row_aliases = aliases[att, defense]
+
+                while len(small) > 0 and len(large) > 0:
+                    s = small.pop()
+                    big = large[-1]
+                    row_probs[s] = scaled[s]
+                    row_aliases[s] = big
+                    scaled[big] = scaled[big] + scaled[s] - 1
+                    if scaled[big] < 1:
+                        small.append(large.pop())
+
+                # whatever's left is (up to rounding) exactly 1
+                for i in small + large:
+                    row_probs[i] = 1
+                    row_aliases[i] = i
+
+        return alias_probs, aliases
@@ -5,8 +5,9 @@ import src.game.spriteref as spriteref
 from src.game.stats import StatTypes
 import src.utils.colors as colors
 import src.game.statuseffects as statuseffects
+import src.game.damagetables as damagetables
 import src.game.balance as balance
-from src.game.stats import StatProvider
+from src.game.stats import StatProvider, add_stat_vectors
 import src.game.debug as debug
 import src.game.events as events
 import src.game.sound_effects as sound_effects
@@ -30,6 +31,10 @@ class ActorState(StatProvider):
 
         self.status_effects = {}  # StatusEffectType -> turns remaining
 
+        # (equipment grid's change count, local -> summed stat vector of the equipped items and status effects).
+        # set to None whenever the set of status effects changes.
+        self._bonus_stats_cache = None
+
         self.current_hp = self.max_hp()
         self.current_energy = 0
 
@@ -47,15 +52,29 @@ class ActorState(StatProvider):
                 if action_provider.is_mappable() and not action_provider.needs_to_be_equipped:
                     yield ItemActionProvider(item, action_provider)
 
+    def _bonus_stat_vector(self, local):
+        """returns: stat vector of everything equipped and every status effect, summed."""
+        change_count = self.inventory().get_equip_grid().get_change_count()
+        if self._bonus_stats_cache is None or self._bonus_stats_cache[0] != change_count:
+            self._bonus_stats_cache = (change_count, {})
+
+        vectors = self._bonus_stats_cache[1]
+        if local not in vectors:
+            res = [0] * StatTypes.count()
+            for item in self.inventory().all_equipped_items():
+                add_stat_vectors(res, item.stat_vector(local=local))
+            for status_effect in self.status_effects:
+                add_stat_vectors(res, status_effect.stat_vector(local=local))
+            vectors[local] = res
+
+        return vectors[local]
+
     def stat_value(self, stat_type, local=False):
+        # base stats aren't cached, since they can be changed from outside
         res = self.base_stats.stat_value(stat_type, local=local)
-        for item in self.inventory().all_equipped_items():
-            res += item.stat_value(stat_type, local=local)
-
-        for status_effect in self.status_effects:
-            res += status_effect.stat_value(stat_type, local=local)
+        res += self._bonus_stat_vector(local)[stat_type.get_index()]
 
-        if self.is_player() and debug.insta_kill() and stat_type == StatTypes.ATT:
+        if self.is_player() and stat_type == StatTypes.ATT and debug.insta_kill():
             res += 99
 
         return res
@@ -217,6 +236,7 @@ class ActorState(StatProvider):
                 del self.status_effects[eff]
 
             self.status_effects[effect] = duration
+            self._bonus_stats_cache = None
             return True
 
     def get_turns_remaining(self, status_effect):
@@ -240,6 +260,7 @@ class ActorState(StatProvider):
 
             if expired:
                 del self.status_effects[e]
+                self._bonus_stats_cache = None
 
                 if e == statuseffects.StatusEffectTypes.FLINCHED:
                     add_flinch_recovery = True
@@ -253,6 +274,7 @@ class ActorState(StatProvider):
 
     def clear_all_status_effects(self):
         self.status_effects.clear()
+        self._bonus_stats_cache = None
 
 
 class ActorController:
@@ -430,18 +452,19 @@ class EnemyController(ActorController):
         skilled_enough = random.random() < balance.ENEMY_PATHING_SKILL[actor.get_actor_state().intelligence() - 1]
 
         if not world.get_hidden(*pos) and skilled_enough:
-            p = world.get_player()
-            if p is not None:
-                p_pos = world.to_grid_coords(*p.center())
-                path = world.get_path_between(pos, p_pos, max_length=balance.ENEMY_SMART_PATHING_RANGE,
-                                              cond=lambda xy: (xy == p_pos or xy == pos
-                                                               or not world.is_solid(*xy, including_entities=True)))
-                if path is not None and len(path) >= 2:
-                    res = MoveToAction(actor, path[1])
+            # every enemy shares the same field, so this is just a lookup after the first one per turn
+            dist_field = world.get_distance_field_to_player(balance.ENEMY_SMART_PATHING_RANGE)
+            if dist_field is not None:
+                next_steps = dist_field.get_next_steps(pos, max_dist=balance.ENEMY_SMART_PATHING_RANGE - 1,
+                                                       salt=actor.get_uid())
+                for n in next_steps:
+                    if n == dist_field.target:
+                        break  # already adjacent to the player
+                    res = MoveToAction(actor, n)
                     if res.is_possible(world):
                         return res
                     else:
-                        print("WARN: world gave {} an impossible path? {}".format(actor, path))
+                        print("WARN: world gave {} an impossible step? {} -> {}".format(actor, pos, n))
 
         # if hidden, avoid stepping next to doors
         # (so that the player can't get instagibbed as they open a door)
@@ -824,12 +847,25 @@ def determine_damage_dealt(attacker, defender, item_used=None, is_thrown=False):
     #   defender uses each of their die to 'block' as many attacker dice as possible.
     #       a die can only block a die with value less than or equal to it's own.
     #   the number of unblocked attackers is the amount of damage dealt.
+    # (see damagetables for the exact odds of each outcome).
+
+    if damagetables.can_sample(a_att, t_def):
+        return damagetables.sample_damage(a_att, t_def)
 
     atts = [random.randint(1, 6) for _ in range(0, a_att)]
     defs = [random.randint(1, 4) for _ in range(0, t_def)]
 
-    atts.sort()
-    defs.sort()
+    return resolve_damage_dice(atts, defs)
+
+
+def resolve_damage_dice(atts, defs):
+    """
+        atts: list of the attacker's D6 rolls.
+        defs: list of the defender's D4 rolls.
+        returns: the number of attack dice that don't get blocked.
+    """
+    atts = sorted(atts)
+    defs = sorted(defs)
 
     while len(atts) > 0 and len(defs) > 0:
         defender = defs.pop(0)
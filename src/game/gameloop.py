@@ -1,3 +1,5 @@
+import time
+
 import pygame
 
 import src.game.spriteref as spriteref
@@ -134,15 +136,24 @@ def run():
     import src.worldgen.zones as zones
     from src.game.windowstate import WindowState
     from src.game.inputs import InputState
+    import src.utils.profiling as profiling
+    import src.worldgen.pregen as pregen
 
     world_view = None
 
+    # builds the next zone in the background, so exit doors don't cause a hitch
+    pregen.get_instance().set_enabled(True)
+
+    frame_timer = profiling.get_frame_timer()
+    frame_timer_overlay = profiling.FrameTimerOverlay(frame_timer)
+
     clock = pygame.time.Clock()
     running = True
 
     ignore_resize_events_next_tick = False
 
     while running:
+        frame_timer.start_frame()
 
         # processing "global" events
         gs.get_instance().global_event_queue().flip()
@@ -169,6 +180,7 @@ def run():
                 world_view = None
 
             elif global_event.get_type() == events.GlobalEventType.NEW_ZONE:
+                transition_start_time = time.perf_counter()
                 RenderEngine.get_instance().clear_all_sprites()
 
                 active_menu = gs.get_instance().menu_manager().get_active_menu()
@@ -192,6 +204,8 @@ def run():
                 world_view = WorldView(world)
 
                 gs.get_instance().set_world(world)
+                print("INFO: zone transition to {} took {:.1f}ms".format(
+                    zone_id, (time.perf_counter() - transition_start_time) * 1000))
 
         # processing in-world events
         if not gs.get_instance().menu_manager().pause_world_updates():
@@ -314,6 +328,8 @@ def run():
         input_state.update(gs.get_instance().tick_counter)
         sound_effects.update()
 
+        frame_timer.lap("events")
+
         world_active = gs.get_instance().menu_manager().should_draw_world()
 
         if world_active and gs.get_instance().get_world() is None:
@@ -335,8 +351,11 @@ def run():
             world_view = WorldView(world)
 
         if debug.is_dev() and input_state.was_pressed(pygame.K_F1):
+            # shows how long each part of the frame is taking
+            frame_timer.toggle()
+
+        if debug.is_dev() and input_state.was_pressed(pygame.K_F2):
             # used to help find performance bottlenecks
-            import src.utils.profiling as profiling
             profiling.get_instance().toggle()
 
         if debug.is_dev() and world_active and input_state.was_pressed(pygame.K_F6):
@@ -362,8 +381,10 @@ def run():
             if world_active:
                 RenderEngine.get_instance().set_clear_color(*world.get_bg_color())
 
-                world.update_all()
-                world_view.update_all()
+                with frame_timer.section("world.update_all"):
+                    world.update_all()
+                with frame_timer.section("world_view.update_all"):
+                    world_view.update_all()
 
                 gs.get_instance().dialog_manager().update(world)
 
@@ -375,11 +396,20 @@ def run():
             elif world_view is not None:
                 world_view.cleanup_active_bundles()
 
-        gs.get_instance().menu_manager().update()
+        with frame_timer.section("menu_manager.update"):
+            gs.get_instance().menu_manager().update()
+
+        frame_timer_overlay.update()
 
         RenderEngine.get_instance().render_layers()
+        if frame_timer.is_enabled():
+            for layer_name, secs in RenderEngine.get_instance().get_render_times().items():
+                frame_timer.add_time("render:" + layer_name, secs)
+
+        with frame_timer.section("display.flip"):
+            pygame.display.flip()
 
-        pygame.display.flip()
+        frame_timer.end_frame()
 
         slo_mo_mode = debug.is_dev() and input_state.is_held(pygame.K_TAB)
         if slo_mo_mode:
@@ -400,5 +430,13 @@ def run():
     print("INFO: saving settings before exit...")
     gs.get_instance().save_settings_to_disk()
 
+    if frame_timer.num_frames() > 0:
+        import src.game.pathutils as pathutils
+        print("INFO: saving frame times before exit...")
+        frame_timer.export(pathutils.get_save_data_path(with_subpath="logs/frame_times.json"))
+        frame_timer.export(pathutils.get_save_data_path(with_subpath="logs/frame_times.csv"))
+
+    pregen.get_instance().shutdown()
+
     print("INFO: quitting skeletris")
     pygame.quit()
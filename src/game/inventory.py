@@ -1,6 +1,20 @@
 import collections
 
 
+_SHAPE_MASKS = {}  # cubes -> tuple of row masks, see _shape_masks
+
+
+def _shape_masks(item):
+    """returns: tuple with an int for each row of the item, where bit x is set if the item has a cube at (x, row)."""
+    cubes = item.cubes
+    if cubes not in _SHAPE_MASKS:
+        masks = [0] * (max(c[1] for c in cubes) + 1)
+        for (x, y) in cubes:
+            masks[y] |= 1 << x
+        _SHAPE_MASKS[cubes] = tuple(masks)
+    return _SHAPE_MASKS[cubes]
+
+
 class ItemGridType:
 
     INVENTORY = "INVENTORY"
@@ -16,28 +30,53 @@ class ItemGrid:
         self._grid_type = grid_type
 
         self._dirty = False
+        self._change_count = 0
+
+        # kept in sync with self.items
+        self._cells = [[None] * size[0] for _ in range(0, size[1])]  # [y][x] -> item covering that cell
+        self._row_masks = [0] * size[1]  # bit x of row y is set if cell (x, y) is covered
     
     def can_place(self, item, pos, allow_replace=False):
         if item in self.items:
             print("WARN: Attempting to place into a grid it's already inside? item={}".format(item))
             return False
-        if (item.w() + pos[0] > self.w() or
+        if (pos[0] < 0 or pos[1] < 0 or
+                item.w() + pos[0] > self.w() or
                 item.h() + pos[1] > self.h()):
             return False
 
+        if not allow_replace:
+            return self._fits(_shape_masks(item), pos[0], pos[1])
+
         hit_item = None
         for cell in self._cells_occupied(item, pos):
-            item_in_cell = self.item_at_position(cell)
+            item_in_cell = self._cells[cell[1]][cell[0]]
             if item_in_cell is not None:
-                if not allow_replace:
-                    return False
-                elif hit_item is None:
+                if hit_item is None:
                     hit_item = item_in_cell
                 elif hit_item is not item_in_cell:
                     return False  # overlapping two items
                 
         return True
 
+    def _fits(self, shape_masks, x, y):
+        """returns: whether a shape could go at (x, y) without hitting anything. assumes it's in bounds."""
+        row_masks = self._row_masks
+        for i in range(0, len(shape_masks)):
+            if (shape_masks[i] << x) & row_masks[y + i]:
+                return False
+        return True
+
+    def _set_cells(self, item, pos, val):
+        for (x, y) in self._cells_occupied(item, pos):
+            self._cells[y][x] = val
+        shape_masks = _shape_masks(item)
+        for i in range(0, len(shape_masks)):
+            if val is None:
+                self._row_masks[pos[1] + i] &= ~(shape_masks[i] << pos[0])
+            else:
+                self._row_masks[pos[1] + i] |= shape_masks[i] << pos[0]
+
     def is_inventory(self):
         return self._grid_type == ItemGridType.INVENTORY
 
@@ -61,18 +100,24 @@ class ItemGrid:
 
     def set_clean(self):
         self._dirty = False
+
+    def get_change_count(self):
+        """returns: the number of times the grid's contents have changed. unlike the dirty flag, it's never reset."""
+        return self._change_count
         
     def place(self, item, pos):
         if self.can_place(item, pos, allow_replace=False):
             self.items[item] = pos
+            self._set_cells(item, pos, item)
             self._dirty = True
+            self._change_count += 1
             return True
         return False
             
     def try_to_replace(self, item, pos):
-        if item.w() + pos[0] > self.w() or item.h() + pos[1] > self.h():
+        if pos[0] < 0 or pos[1] < 0 or item.w() + pos[0] > self.w() or item.h() + pos[1] > self.h():
             return None
-        
+
         hit_item = None    
         for cell in self._cells_occupied(item, pos):
             item_at_cell = self.item_at_position(cell)
@@ -93,8 +138,10 @@ class ItemGrid:
 
     def remove(self, item):
         if item in self.items:
+            self._set_cells(item, self.items[item], None)
             del self.items[item]
             self._dirty = True
+            self._change_count += 1
             return True
         return False
 
@@ -107,11 +154,8 @@ class ItemGrid:
         return res
         
     def item_at_position(self, pos):
-        for item in self.items:
-            origin = self.items[item]
-            for cell in self._cells_occupied(item, origin):
-                if cell == pos:
-                    return item
+        if 0 <= pos[0] < self.w() and 0 <= pos[1] < self.h():
+            return self._cells[pos[1]][pos[0]]
         return None
         
     def _cells_occupied(self, item, pos):
@@ -129,9 +173,14 @@ class ItemGrid:
             return None
 
     def search_for_valid_position_to_place(self, item):
-        for y in range(0, self.h()):
-            for x in range(0, self.w()):
-                if self.can_place(item, (x, y), allow_replace=False):
+        if item in self.items:
+            print("WARN: Attempting to place into a grid it's already inside? item={}".format(item))
+            return None
+
+        shape_masks = _shape_masks(item)
+        for y in range(0, self.h() - item.h() + 1):
+            for x in range(0, self.w() - item.w() + 1):
+                if self._fits(shape_masks, x, y):
                     return (x, y)
         return None
         
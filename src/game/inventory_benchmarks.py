@@ -0,0 +1,140 @@
+import src.game.simulation as simulation  # must be imported before pygame is initialized
+
+import random
+import time
+
+from src.game.inventory import ItemGrid, ItemGridType, InventoryState
+
+
+"""
+Benchmarks for ItemGrid placement queries, on inventories that get filled up with random items (the way picking
+things up auto-places them), and then poked at every cell and position.
+
+Run with: python -m src.game.inventory_benchmarks
+"""
+
+
+class _LinearItemGrid(ItemGrid):
+    """the old placement queries, which check every cube of every item in the grid."""
+
+    def can_place(self, item, pos, allow_replace=False):
+        if item in self.items:
+            return False
+        if item.w() + pos[0] > self.w() or item.h() + pos[1] > self.h():
+            return False
+
+        hit_item = None
+        for cell in self._cells_occupied(item, pos):
+            item_in_cell = self.item_at_position(cell)
+            if item_in_cell is not None:
+                if not allow_replace:
+                    return False
+                elif hit_item is None:
+                    hit_item = item_in_cell
+                elif hit_item is not item_in_cell:
+                    return False
+        return True
+
+    def item_at_position(self, pos):
+        for item in self.items:
+            origin = self.items[item]
+            for cell in self._cells_occupied(item, origin):
+                if cell == pos:
+                    return item
+        return None
+
+    def search_for_valid_position_to_place(self, item):
+        for y in range(0, self.h()):
+            for x in range(0, self.w()):
+                if self.can_place(item, (x, y), allow_replace=False):
+                    return (x, y)
+        return None
+
+
+def _gen_items(level, n, seed):
+    from src.items.itemgen import ItemFactory
+
+    random.seed(seed)
+    res = []
+    while len(res) < n:
+        item = ItemFactory.gen_item(level)
+        if item is not None:
+            res.append(item)
+    return res
+
+
+def _fill(grid, items):
+    """auto-places items until one doesn't fit. returns: list of (item, pos) for each item placed."""
+    res = []
+    for it in items:
+        pos = grid.search_for_valid_position_to_place(it)
+        if pos is None or not grid.place(it, pos):
+            break
+        res.append((it, pos))
+    return res
+
+
+def _poke(grid, probes):
+    """returns: the results of every query on every cell and position."""
+    res = []
+    for y in range(0, grid.h()):
+        for x in range(0, grid.w()):
+            res.append(grid.item_at_position((x, y)))
+            for probe in probes:
+                res.append(grid.can_place(probe, (x, y), allow_replace=False))
+                res.append(grid.can_place(probe, (x, y), allow_replace=True))
+    for probe in probes:
+        res.append(grid.search_for_valid_position_to_place(probe))
+    return res
+
+
+def bench_full_inventory(levels=(0, 5, 10, 15), n_trials=20, seed=808):
+    size = (InventoryState().cols, InventoryState().rows)
+
+    for level in levels:
+        fill_times = [0, 0]
+        poke_times = [0, 0]
+        n_placed = 0
+
+        for trial in range(0, n_trials):
+            items = _gen_items(level, 60, seed + trial * 7 + level)
+            probes = items[-5:]
+            results = []
+
+            for (i, grid_cls) in enumerate((_LinearItemGrid, ItemGrid)):
+                grid = grid_cls(size, grid_type=ItemGridType.INVENTORY)
+
+                start = time.perf_counter()
+                placed = _fill(grid, items[:-5])
+                fill_times[i] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                poked = _poke(grid, probes)
+                poke_times[i] += time.perf_counter() - start
+
+                results.append((placed, poked))
+
+            if results[0] != results[1]:
+                raise ValueError("placement mismatch (level={}, trial={})".format(level, trial))
+            n_placed += len(results[0][0])
+
+            # then clear it out again, one item at a time
+            grid = ItemGrid(size)
+            _fill(grid, items[:-5])
+            for (it, _) in results[0][0]:
+                grid.remove(it)
+                if any(grid.item_at_position((x, y)) is it for x in range(0, grid.w()) for y in range(0, grid.h())):
+                    raise ValueError("removed item is still in the grid (level={}, trial={})".format(level, trial))
+
+        print("INFO: level={}, {:.1f} items per full inventory:\tfill: old={:.3f}ms new={:.3f}ms ({:.1f}x)\t"
+              "every query: old={:.3f}ms new={:.3f}ms ({:.1f}x)".format(
+                  level, n_placed / n_trials,
+                  fill_times[0] * 1000 / n_trials, fill_times[1] * 1000 / n_trials,
+                  fill_times[0] / max(fill_times[1], 1e-9),
+                  poke_times[0] * 1000 / n_trials, poke_times[1] * 1000 / n_trials,
+                  poke_times[0] / max(poke_times[1], 1e-9)))
+
+
+if __name__ == "__main__":
+    simulation.init()
+    bench_full_inventory()
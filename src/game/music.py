@@ -79,13 +79,23 @@ CURRENT_SONG = Songs.SILENCE
 
 _MASTER_VOLUME = 1.0
 
+_ENABLED = True  # whether songs can play at all (they can't when there's no audio device)
+
+
+def set_enabled(val):
+    global _ENABLED
+    if not val:
+        play_song(Songs.SILENCE)
+    _ENABLED = val
+
 
 def set_master_volume(val):
     global _MASTER_VOLUME, CURRENT_SONG
     if val != _MASTER_VOLUME:
         print("INFO: setting master music volume to {}".format(val))
         _MASTER_VOLUME = Utils.bound(val, 0.0, 1.0)
-        pygame.mixer.music.set_volume(_MASTER_VOLUME * CURRENT_SONG.volume)
+        if _ENABLED:
+            pygame.mixer.music.set_volume(_MASTER_VOLUME * CURRENT_SONG.volume)
 
 
 # y'all better acquire the lock before you do anything involving fading
@@ -129,7 +139,7 @@ def play_song(song):
     if song is None:
         song = Songs.SILENCE
 
-    if song.is_continue():
+    if song.is_continue() or not _ENABLED:
         return
 
     global CURRENT_SONG, _IS_FADING_LOCK, _IS_FADING, _NEXT_SONG_AFTER_FADE
@@ -10,6 +10,7 @@ import src.utils.colors as colors
 from src.utils.util import Utils
 import src.game.balance as balance
 import src.items.cubeutils as cubeutils
+import src.items.cubecatalogue as cubecatalogue
 
 
 class NpcID(Enum):
@@ -1036,6 +1037,16 @@ class NpcItemThatFitsProtocol(NpcTradeProtocol):
         return ItemTags.CUBES in item.get_type().get_tags()
 
     def _is_enough_space_for_new_item(self, item):
+        player_equip_grid = gs.get_instance().player_state().inventory().get_equip_grid()
+        if player_equip_grid.w() == cubecatalogue.SIZE and player_equip_grid.h() == cubecatalogue.SIZE:
+            # a cluster of 5 or more empty cells always has room for some 5-cube shape (and vice-versa)
+            free_mask = 0
+            for x in range(0, player_equip_grid.w()):
+                for y in range(0, player_equip_grid.h()):
+                    if player_equip_grid.item_at_position((x, y)) is None:
+                        free_mask |= 1 << (x + cubecatalogue.SIZE * y)
+            return cubecatalogue.get_catalogue().any_fit(free_mask, 5)
+
         return len(self._get_empty_equipment_grid_cell_clusters(min_size=5)) > 0
 
     def _get_empty_equipment_grid_cell_clusters(self, min_size=5):
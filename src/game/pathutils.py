@@ -58,3 +58,40 @@ def get_save_data_path(with_subpath=None):
     else:
         return base_path
 
+
+
+def read_cache_file(path, parse, description):
+    """
+        path: pathlib.Path of the file.
+        parse: lambda: bytes -> whatever's in the file (or None, if it's out of date).
+        description: what the file is, for logging.
+        returns: the parsed contents, or None if the file doesn't exist or couldn't be read.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            return parse(f.read())
+    except Exception:
+        print("WARN: failed to read {}: {}".format(description, path))
+        traceback.print_exc()
+        return None
+
+
+def write_cache_file(path, data, description):
+    """
+        writes the bytes to path, making its directories if needed. failures are logged rather than raised,
+        since the file can always be rebuilt.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write then swap, so a crash halfway through can't leave a broken file behind
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        print("WARN: failed to write {}: {}".format(description, path))
+        traceback.print_exc()
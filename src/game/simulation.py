@@ -0,0 +1,306 @@
+import os
+import random
+import time
+import argparse
+
+# no window or audio device is needed (or wanted) in headless mode
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import src.game.spriteref as spriteref
+from src.utils.util import Utils
+
+
+"""
+Runs the game's world simulation without a window, GL context, or audio (e.g. for soak tests,
+balance runs, and perf regressions on machines without a GPU).
+
+Run with: python -m src.game.simulation --zone <zone_id> --seed 1 --ticks 10000 --input ai
+"""
+
+
+class InputSource:
+    """decides what the player does. get_requests is called whenever the player is waiting for input."""
+
+    def get_requests(self, world, player):
+        """returns: list of Actions for the player to attempt, in priority order."""
+        raise NotImplementedError()
+
+
+class ScriptedInput(InputSource):
+    """
+        plays back a string of commands, one per player turn, looping forever.
+        commands: L, U, R, D = move (or attack) in that direction, S = skip turn.
+    """
+
+    _DIRECTIONS = {"L": (-1, 0), "U": (0, -1), "R": (1, 0), "D": (0, 1)}
+
+    def __init__(self, script):
+        script = "".join(c for c in script.upper() if not c.isspace())
+        for c in script:
+            if c not in ScriptedInput._DIRECTIONS and c != "S":
+                raise ValueError("unrecognized command in script: {}".format(c))
+        if len(script) == 0:
+            raise ValueError("script is empty")
+
+        self.script = script
+        self._idx = 0
+
+    def get_requests(self, world, player):
+        import src.game.gameengine as gameengine
+
+        cmd = self.script[self._idx]
+        self._idx = (self._idx + 1) % len(self.script)
+
+        pos = world.to_grid_coords(*player.center())
+        if cmd == "S":
+            return [gameengine.SkipTurnAction(player, pos)]
+        else:
+            target_pos = Utils.add(pos, ScriptedInput._DIRECTIONS[cmd])
+            return gameengine.get_keyboard_action_requests(world, player, target_pos)
+
+
+class AutoExploreInput(InputSource):
+    """
+        attacks adjacent enemies, walks toward nearby ones, and otherwise wanders
+        toward the cells it has visited the least.
+    """
+
+    def __init__(self, rng, sight_radius=6):
+        self.rng = rng
+        self.sight_radius = sight_radius
+        self._visit_counts = {}  # (x, y) -> int
+
+    def get_requests(self, world, player):
+        import src.game.gameengine as gameengine
+
+        pos = world.to_grid_coords(*player.center())
+        self._visit_counts[pos] = self._visit_counts.get(pos, 0) + 1
+
+        enemy_positions = []
+        radius = self.sight_radius * world.cellsize()
+        for e in world.entities_in_circle(player.center(), radius, onscreen=False,
+                                          cond=lambda e: e.is_enemy() and e.get_actor_state().is_alive()):
+            enemy_positions.append(world.to_grid_coords(*e.center()))
+
+        options = []  # list of (score, tie_breaker, requests)
+        for n in Utils.neighbors(pos[0], pos[1]):
+            requests = gameengine.get_keyboard_action_requests(world, player, n)
+            if not any(a.is_possible(world) for a in requests):
+                continue
+
+            if n in enemy_positions:
+                score = -1000
+            elif len(enemy_positions) > 0:
+                score = min(Utils.dist_manhattan(n, e_pos) for e_pos in enemy_positions) - 100
+            else:
+                score = self._visit_counts.get(n, 0)
+
+            options.append((score, self.rng.random(), requests))
+
+        if len(options) == 0:
+            return [gameengine.SkipTurnAction(player, pos)]
+        else:
+            options.sort(key=lambda opt: opt[:2])
+            return options[0][2]
+
+
+class SimulationResult:
+
+    def __init__(self, n_ticks, n_turns, n_deaths, zones_visited, elapsed_secs):
+        self.n_ticks = n_ticks
+        self.n_turns = n_turns
+        self.n_deaths = n_deaths
+        self.zones_visited = zones_visited
+        self.elapsed_secs = elapsed_secs
+
+    def ticks_per_sec(self):
+        return self.n_ticks / self.elapsed_secs if self.elapsed_secs > 0 else 0
+
+    def turns_per_sec(self):
+        return self.n_turns / self.elapsed_secs if self.elapsed_secs > 0 else 0
+
+    def __repr__(self):
+        return ("{}[ticks={}, turns={}, deaths={}, zones={}, secs={:.2f}, "
+                "ticks/sec={:.1f}, turns/sec={:.1f}]").format(
+            type(self).__name__, self.n_ticks, self.n_turns, self.n_deaths, self.zones_visited,
+            self.elapsed_secs, self.ticks_per_sec(), self.turns_per_sec())
+
+
+def init(screen_size=(800, 600)):
+    """sets up the game's singletons, with stand-ins for everything that needs a display or audio device."""
+    import src.game.music as music
+    import src.game.sound_effects as sound_effects
+    music.set_enabled(False)
+    sound_effects.set_enabled(False)
+
+    pygame.init()
+
+    # never shown, but some things want to know the display's size
+    from src.game.windowstate import WindowState
+    WindowState.create_instance(window_size=screen_size, min_size=screen_size)
+
+    from src.renderengine.engine import RenderEngine
+    render_eng = RenderEngine.create_headless_instance()
+    render_eng.init(*screen_size)
+
+    # the sprite models are still needed for their sizes, but the sheet is never uploaded anywhere
+    sheet_names = ["image", "cinematics", "ui", "items", "bosses", "cave_horror", "font", "animations", "title_scene"]
+    sheets = [pygame.image.load(Utils.resource_path("assets/{}.png".format(name))) for name in sheet_names]
+    spriteref.build_spritesheet(*sheets)
+
+    for layer_id in (spriteref.FLOOR_LAYER, spriteref.SHADOW_LAYER, spriteref.WALL_LAYER,
+                     spriteref.ENTITY_LAYER, spriteref.UI_0_LAYER, spriteref.UI_TOOLTIP_LAYER):
+        render_eng.add_layer(layer_id, str(layer_id), layer_id, False, False)
+
+    from src.game.inputs import InputState
+    InputState.create_instance()
+
+    import src.worldgen.zones as zones
+    zones.init_zones()
+
+
+def start_new_game(zone_id):
+    import src.game.globalstate as gs
+    import src.ui.menus as menus
+    import src.worldgen.zones as zones
+    from src.renderengine.engine import RenderEngine
+
+    RenderEngine.get_instance().clear_all_sprites()
+
+    gs.create_new(menus.InGameUiState())
+    gs.get_instance().menu_manager().update()  # activates the in-game menu, which unpauses the world
+
+    _set_world(zones.build_world(zone_id))
+
+
+def _set_world(world):
+    import src.game.globalstate as gs
+    gs.get_instance().set_world(world)
+    print("INFO: entered zone {}".format(gs.get_instance().get_zone_id()))
+
+
+def run(zone_id=None, seed=None, n_ticks=10000, input_source=None, restart_on_death=True):
+    """
+        steps the world for n_ticks, without rendering anything.
+
+        zone_id: zone to start in (defaults to the first zone).
+        input_source: InputSource that controls the player (defaults to an AutoExploreInput).
+        returns: SimulationResult
+    """
+    import src.game.events as events
+    import src.game.globalstate as gs
+    import src.game.sound_effects as sound_effects
+    import src.worldgen.zones as zones
+
+    if seed is not None:
+        random.seed(seed)
+    if zone_id is None:
+        zone_id = zones.first_zone_id()
+    if input_source is None:
+        input_source = AutoExploreInput(random.Random(seed))
+
+    start_new_game(zone_id)
+
+    n_turns = 0
+    n_deaths = 0
+    zones_visited = [zone_id]
+    elapsed_secs = 0
+
+    tick = 0
+    while tick < n_ticks:
+        start_time = time.perf_counter()
+
+        stop = False
+        gs.get_instance().global_event_queue().flip()
+        for global_event in gs.get_instance().global_event_queue().all_events():
+            if global_event.get_type() == events.GlobalEventType.GAME_EXIT:
+                stop = True
+            elif global_event.get_type() == events.GlobalEventType.NEW_ZONE:
+                zone_id = global_event.get_next_zone()
+                zones_visited.append(zone_id)
+                transition_start_time = time.perf_counter()
+                _set_world(zones.build_world(zone_id))
+                print("INFO: zone transition to {} took {:.1f}ms".format(
+                    zone_id, (time.perf_counter() - transition_start_time) * 1000))
+
+        if stop:
+            break
+
+        died = False
+        gs.get_instance().event_queue().flip()
+        gs.get_instance().update_world_stuff()
+        for zone_event in gs.get_instance().event_queue().all_events():
+            if zone_event.get_type() == events.EventType.PLAYER_DIED:
+                died = True
+            elif zone_event.get_type() == events.EventType.GAME_WIN:
+                stop = True
+
+        if stop:
+            break
+        elif died:
+            n_deaths += 1
+            if not restart_on_death:
+                break
+            turn_count = gs.get_instance().get_run_statistic(gs.RunStatisticTypes.TURN_COUNT)
+            n_turns += turn_count
+            start_new_game(zone_id)
+
+        sound_effects.update()
+
+        # cinematics and dialogs would normally wait for the player to click through them
+        gs.get_instance().get_cinematics_queue().clear()
+        if gs.get_instance().dialog_manager().is_active():
+            gs.get_instance().dialog_manager().interact()
+
+        world, player = gs.get_instance().get_world_and_player()
+        if world is not None:
+            if player is not None:
+                if (not gs.get_instance().world_updates_paused()
+                        and player.get_actor_state().ready_to_act() and not player.is_performing_action()):
+                    gs.get_instance().player_controller().add_requests(input_source.get_requests(world, player))
+
+                gs.get_instance().set_camera_center_in_world(*player.center())
+
+            world.update_all()
+            gs.get_instance().dialog_manager().update(world)
+
+        gs.get_instance().increment_tick_counts()
+        tick += 1
+
+        elapsed_secs += time.perf_counter() - start_time
+
+    n_turns += gs.get_instance().get_run_statistic(gs.RunStatisticTypes.TURN_COUNT)
+
+    return SimulationResult(tick, n_turns, n_deaths, zones_visited, elapsed_secs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the game without a window.")
+    parser.add_argument("--zone", type=str, default=None, help="the zone to start in")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ticks", type=int, default=10000, help="the number of game ticks to simulate")
+    parser.add_argument("--input", type=str, default="ai",
+                        help="'ai' (auto-explore), or a script of player commands, e.g. 'LLUURRDDS'")
+    parser.add_argument("--pregen", action="store_true",
+                        help="generate the next zone in a background process (runs won't be reproducible)")
+    args = parser.parse_args()
+
+    init()
+
+    if args.pregen:
+        import src.worldgen.pregen as pregen
+        pregen.get_instance().set_enabled(True)
+
+    if args.input == "ai":
+        player_input = AutoExploreInput(random.Random(args.seed))
+    else:
+        player_input = ScriptedInput(args.input)
+
+    result = run(zone_id=args.zone, seed=args.seed, n_ticks=args.ticks, input_source=player_input)
+    print("INFO: {}".format(result))
+
+    if args.pregen:
+        pregen.get_instance().shutdown()
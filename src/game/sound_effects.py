@@ -15,6 +15,8 @@ class Effects:
 
 _MASTER_VOLUME = 1.0
 
+_ENABLED = True  # whether sounds can play at all (they can't when there's no audio device)
+
 _LOADED_EFFECTS = {}  # effect_id -> Effect object
 
 _RECENTLY_PLAYED = {}  # effect_id -> ticks since last play
@@ -27,6 +29,11 @@ def set_volume(volume):
     _MASTER_VOLUME = Utils.bound(volume, 0.0, 1.0)
 
 
+def set_enabled(val):
+    global _ENABLED
+    _ENABLED = val
+
+
 def update():
     to_remove = []
     for effect in _RECENTLY_PLAYED:
@@ -42,7 +49,7 @@ def play_sound(sound):
     """
     :param sound: either an effect_path, or a tuple (effect_path, volume)
     """
-    if sound is None:
+    if sound is None or not _ENABLED:
         return
 
     if isinstance(sound, tuple):
@@ -17,6 +17,11 @@ class StatType:
         self._local_desc = local_desc
         self._enemy_desc = enemy_desc
 
+        self._hash = hash(stat_id)  # stat types get looked up in dicts a lot
+
+        # position of this stat in stat vectors
+        self._index = _ALL_STAT_TYPES[stat_id]._index if stat_id in _ALL_STAT_TYPES else len(_ALL_STAT_TYPES)
+
         _ALL_STAT_TYPES[stat_id] = self
 
     def get_color(self):
@@ -25,6 +30,9 @@ class StatType:
     def get_id(self):
         return self._stat_id
 
+    def get_index(self):
+        return self._index
+
     def __repr__(self):
         return str(self.get_id())
 
@@ -60,7 +68,7 @@ class StatType:
             return False
 
     def __hash__(self):
-        return hash(self.get_id())
+        return self._hash
 
 
 class RangedStatType(StatType):
@@ -182,6 +190,10 @@ class StatTypes:
         for stat_id in _ALL_STAT_TYPES:
             yield _ALL_STAT_TYPES[stat_id]
 
+    @staticmethod
+    def count():
+        return len(_ALL_STAT_TYPES)
+
     @staticmethod
     def get_type_for_id(stat_id):
         if stat_id in _ALL_STAT_TYPES:
@@ -195,6 +207,13 @@ class StatProvider:
     def stat_value(self, stat_type, local=False):
         return 0
 
+    def stat_vector(self, local=False):
+        """returns: list of this provider's value for every StatType, indexed by StatType.get_index()."""
+        res = [0] * StatTypes.count()
+        for s_type in StatTypes.all_types():
+            res[s_type.get_index()] = self.stat_value(s_type, local=local)
+        return res
+
     def all_nonzero_stat_types(self, local=False):
         """returns: a list of all StatTypes with non-zero values on this StatProvider."""
         for s_type in StatTypes.all_types():
@@ -210,6 +229,25 @@ class StatProvider:
         return res
 
 
+def applied_stats_vector(applied_stats, local=False):
+    """
+        applied_stats: iterable of AppliedStats.
+        returns: stat vector of the summed values of the applied stats with the given locality.
+    """
+    res = [0] * StatTypes.count()
+    for stat in applied_stats:
+        if stat.local == local:
+            res[stat.stat_type.get_index()] += stat.value
+    return res
+
+
+def add_stat_vectors(dest, vector):
+    """adds the values in vector to dest, in place."""
+    for i in range(0, len(vector)):
+        if vector[i] != 0:
+            dest[i] += vector[i]
+
+
 def default_player_stats():
     stats = {
         StatTypes.ATT: 3,
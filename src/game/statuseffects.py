@@ -1,4 +1,4 @@
-from src.game.stats import StatProvider, BasicStatLookup
+from src.game.stats import StatProvider, BasicStatLookup, applied_stats_vector
 from src.game.stats import StatTypes
 from src.items.item import AppliedStat
 import src.utils.colors as colors
@@ -27,6 +27,7 @@ class StatusEffectType(StatProvider):
         self.circle_art_type = circle_art_type
         self.icon = icon
         self.applied_stats = applied_stats
+        self._stat_vectors = {False: None, True: None}  # local -> stat vector, built as needed
         self._is_debuff = is_debuff
 
         # weakly-typed languages were a mistake
@@ -51,6 +52,11 @@ class StatusEffectType(StatProvider):
                 res += stat.value
         return res
 
+    def stat_vector(self, local=False):
+        if self._stat_vectors[local] is None:
+            self._stat_vectors[local] = applied_stats_vector(self.all_applied_stats(), local=local)
+        return self._stat_vectors[local]
+
     def set_stat_value(self, stat_type, val):
         raise ValueError("can't change stat values of a StatusEffect after the fact.")
 
@@ -0,0 +1,174 @@
+import src.game.simulation as simulation  # must be imported before pygame is initialized
+
+import math
+import random
+import time
+
+import src.items.cubecatalogue as cubecatalogue
+from src.items.cubeutils import CubeUtils
+
+
+"""
+Benchmarks for the cube shape catalogue: rotating, mirroring and holy-checking every shape (against the geometry
+that the catalogue replaced), generating shapes (by re-rolling vs. picking from the catalogue), and making sure
+the catalogue's estimated odds match what CubeUtils.gen_cubes actually does.
+
+Run with: python -m src.items.cube_benchmarks
+"""
+
+
+def _geometric_rotate(cubes):
+    mapping = CubeUtils.geometric_rotation_mapping(cubes)
+    return CubeUtils.sort_cubes(mapping[c] for c in cubes)
+
+
+def _spin(all_cubes, geometric):
+    """returns: the results of rotating, mirroring and holy-checking each shape."""
+    res = []
+    for cubes in all_cubes:
+        if geometric:
+            res.append((_geometric_rotate(cubes), CubeUtils.geometric_rotation_mapping(cubes),
+                        CubeUtils.geometric_mirror_mapping(cubes), CubeUtils.geometric_is_holy(cubes)))
+        else:
+            res.append((CubeUtils.rotate_cubes(cubes), CubeUtils.calc_rotation_mapping(cubes),
+                        CubeUtils.calc_mirror_mapping(cubes), CubeUtils.is_holy(cubes)))
+    return res
+
+
+def bench_lookups(n_trials=20):
+    start = time.perf_counter()
+    catalogue = cubecatalogue.get_catalogue(use_disk=False)
+    build_time = time.perf_counter() - start
+
+    all_cubes = [s.cubes for s in catalogue.shapes]
+    expected = set(CubeUtils.get_all_possible_cube_configs(n=cubecatalogue.N_CUBES))
+    if set(all_cubes) != expected:
+        raise ValueError("catalogue has {} shapes, but there should be {}".format(len(all_cubes), len(expected)))
+
+    old_time = 0
+    new_time = 0
+    for _ in range(0, n_trials):
+        start = time.perf_counter()
+        old = _spin(all_cubes, True)
+        old_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = _spin(all_cubes, False)
+        new_time += time.perf_counter() - start
+
+        if old != new:
+            idx = min(i for i in range(0, len(old)) if old[i] != new[i])
+            raise ValueError("lookup mismatch for {}:\nexpected: {}\ngot: {}".format(
+                all_cubes[idx], old[idx], new[idx]))
+
+    print("INFO: built catalogue of {} shapes in {:.1f}ms ({} distinct pieces)".format(
+        len(all_cubes), build_time * 1000, len(set(s.free_id for s in catalogue.shapes))))
+    print("INFO: rotate + mirror + holy check on every shape:\told={:.3f}ms\tcatalogue={:.3f}ms\t({:.1f}x)".format(
+        old_time * 1000 / n_trials, new_time * 1000 / n_trials, old_time / max(new_time, 1e-9)))
+
+
+def _has_cluster(free_mask, min_size):
+    """the trade npc's old check: whether there's a group of min_size connected empty cells."""
+    size = cubecatalogue.SIZE
+    free = set((i % size, i // size) for i in range(0, size * size) if free_mask & (1 << i))
+    while len(free) > 0:
+        to_visit = [free.pop()]
+        n = 0
+        while len(to_visit) > 0:
+            (x, y) = to_visit.pop()
+            n += 1
+            for (dx, dy) in CubeUtils.NEIGHBORS:
+                if (x + dx, y + dy) in free:
+                    free.remove((x + dx, y + dy))
+                    to_visit.append((x + dx, y + dy))
+        if n >= min_size:
+            return True
+    return False
+
+
+def check_fits(n_grids=2000, seed=2525):
+    catalogue = cubecatalogue.get_catalogue(use_disk=False)
+    rand = random.Random(seed)
+    n_cells = cubecatalogue.SIZE * cubecatalogue.SIZE
+    for _ in range(0, n_grids):
+        free_mask = 0
+        density = rand.random()
+        for i in range(0, n_cells):
+            if rand.random() < density:
+                free_mask |= 1 << i
+
+        if catalogue.any_fit(free_mask, 5) != _has_cluster(free_mask, 5):
+            raise ValueError("fit mismatch for free_mask={:025b}".format(free_mask))
+        for (shape, (x, y)) in catalogue.placements_that_fit(free_mask, 7):
+            if any(not free_mask & (1 << (x + cx + cubecatalogue.SIZE * (y + cy))) for (cx, cy) in shape.cubes):
+                raise ValueError("{} doesn't fit at {} in free_mask={:025b}".format(shape.cubes, (x, y), free_mask))
+
+    print("INFO: shape fits match empty cell clusters on {} random grids".format(n_grids))
+
+
+def check_chances(n_samples=20000, seed=2525):
+    """compares the catalogue's estimated odds to what CubeUtils.gen_cubes actually makes."""
+    catalogue = cubecatalogue.get_catalogue(use_disk=False)
+
+    start = time.perf_counter()
+    catalogue.estimate_chances()
+    print("INFO: estimated the chance of each shape in {:.1f}ms".format((time.perf_counter() - start) * 1000))
+
+    random.seed(seed)
+    for n in cubecatalogue.N_CUBES:
+        counts = {}
+        for _ in range(0, n_samples):
+            cubes = CubeUtils.gen_cubes(n)
+            counts[cubes] = counts.get(cubes, 0) + 1
+
+        shapes = catalogue.all_shapes(n)
+        if any(cubes not in set(s.cubes for s in shapes) for cubes in counts):
+            raise ValueError("gen_cubes({}) made a shape that isn't in the catalogue".format(n))
+
+        dist = 0.5 * sum(abs(counts.get(s.cubes, 0) / n_samples - s.chance) for s in shapes)
+
+        # with this many samples, the total variation distance from sampling noise alone should be about this big
+        noise = 0.5 * sum(math.sqrt(s.chance * (1 - s.chance) / n_samples) for s in shapes) * math.sqrt(2 / math.pi)
+        if dist > 2 * noise:
+            raise ValueError("gen_cubes({}) doesn't match the catalogue: distance={:.4f} (noise is ~{:.4f})".format(
+                n, dist, noise))
+
+        holy = sum(counts.get(s.cubes, 0) for s in shapes if s.holy) / n_samples
+        print("INFO: n={}:\tdistance from catalogue={:.4f} (noise is ~{:.4f})\tholy: actual={:.4f} "
+              "catalogue={:.4f}".format(n, dist, noise, holy, catalogue.holy_chance(n)))
+
+
+def bench_holy_rerolls(n_items=200, n=7, seed=2525):
+    """the holy artifact debug setting: re-rolling up to 100 times vs. picking from the catalogue."""
+    catalogue = cubecatalogue.get_catalogue(use_disk=False)
+    catalogue.estimate_chances()
+
+    random.seed(seed)
+    n_holy = [0, 0]
+    start = time.perf_counter()
+    for _ in range(0, n_items):
+        for _ in range(0, 101):
+            cubes = CubeUtils.gen_cubes(n)
+            if CubeUtils.is_holy(cubes):
+                break
+        n_holy[0] += int(CubeUtils.is_holy(cubes))
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chance_of_holy = 1 - (1 - catalogue.holy_chance(n)) ** 101
+    for _ in range(0, n_items):
+        cubes = catalogue.sample(n, holy=random.random() < chance_of_holy).cubes
+        n_holy[1] += int(CubeUtils.is_holy(cubes))
+    new_time = time.perf_counter() - start
+
+    print("INFO: {} items with up to 100 re-rolls:\told={:.3f}ms ({} holy)\tcatalogue={:.3f}ms ({} holy)\t"
+          "({:.1f}x)".format(n_items, old_time * 1000, n_holy[0], new_time * 1000, n_holy[1],
+                             old_time / max(new_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    simulation.init()
+    bench_lookups()
+    check_fits()
+    check_chances()
+    bench_holy_rerolls()
@@ -0,0 +1,354 @@
+import bisect
+import json
+import random
+
+import numpy
+
+import src.game.pathutils as pathutils
+import src.items.cubeutils as cubeutils
+
+
+"""
+Every shape that a stat cube item can have (5, 6 or 7 cubes, connected edge to edge, fitting in a 5x5 box), built
+once along with everything about each shape that's otherwise recomputed from the cube tuples over and over: which
+shape it turns into when it's rotated or mirrored, whether it's holy, and how likely CubeUtils.gen_cubes is to
+make it. The catalogue is saved in the save data dir, so later sessions only have to read it.
+
+gen_cubes is a rejection loop whose odds are impractical to work out exactly, so the chance of each shape is
+estimated by running the same process (vectorized, with its own fixed seed) a few hundred thousand times. that takes
+a second or so, which is why it only happens when something asks for the chances.
+"""
+
+# bump this whenever the catalogue's format (or CubeUtils.gen_cubes, rotate_cubes, etc.) changes
+_FORMAT_VERSION = 2
+
+_CACHE_SUBPATH = "cache/cube_catalogue.json"
+
+N_CUBES = (5, 6, 7)
+SIZE = 5  # the shapes have to fit in a SIZE x SIZE box
+
+# how many times the sampler gets run (for each number of cubes) to estimate the chance of each shape
+_N_SAMPLER_RUNS = 1 << 18
+_SAMPLER_SEED = 25025
+
+_catalogue = None
+_sampling_enabled = False
+
+
+def is_sampling_enabled():
+    return _sampling_enabled
+
+
+def set_sampling_enabled(val):
+    """
+        whether CubeUtils.gen_cubes should pick from the catalogue instead of running its rejection loop. the odds
+        are the catalogue's estimates rather than exact, and picking uses a single random number, so it'll change
+        what happens with a given seed.
+    """
+    global _sampling_enabled
+    _sampling_enabled = val
+
+
+def get_catalogue(use_disk=True):
+    global _catalogue
+    if _catalogue is None:
+        cache_path = _cache_path() if use_disk else None
+        catalogue = _read_from_disk(cache_path) if use_disk else None
+        if catalogue is None:
+            catalogue = CubeCatalogue(_build_shapes(), cache_path=cache_path)
+            if use_disk:
+                _write_to_disk(cache_path, catalogue)
+        _catalogue = catalogue
+    return _catalogue
+
+
+def lookup(cubes):
+    """returns: the CubeShape for the given cubes, or None if they aren't exactly (and in order) one of the shapes."""
+    return get_catalogue().get(cubes)
+
+
+class CubeShape:
+    """
+        shape_id: index into the catalogue.
+        cubes: the cleaned cubes (see CubeUtils.clean_cubes), in sorted order.
+        mask: bitmask with bit (x + SIZE * y) set for each cube (x, y).
+        holy: whether the shape has a hole (see CubeUtils.is_holy).
+        free_id: the lowest shape_id among this shape's rotations and mirror images, so two shapes with the same
+                 free_id are the same piece turned or flipped.
+        rotated_id, mirrored_id: the shape_id after rotating (or mirroring) the shape.
+        rotation_order, mirror_order: for each cube, its index in the rotated (or mirrored) shape's cubes.
+        chance: how likely CubeUtils.gen_cubes is to make this shape, out of all the shapes with as many cubes. this
+                takes a while to estimate, so it's None until something needs it (see CubeCatalogue.estimate_chances).
+    """
+
+    def __init__(self, shape_id, cubes, holy, free_id, rotated_id, rotation_order, mirrored_id, mirror_order,
+                 chance):
+        self.shape_id = shape_id
+        self.cubes = cubes
+        self.holy = holy
+        self.free_id = free_id
+        self.rotated_id = rotated_id
+        self.rotation_order = rotation_order
+        self.mirrored_id = mirrored_id
+        self.mirror_order = mirror_order
+        self.chance = chance
+
+        self.mask = _to_mask(cubes)
+        self.size = cubeutils.CubeUtils.item_size(cubes)
+
+    def n_cubes(self):
+        return len(self.cubes)
+
+    def to_json(self):
+        return [[c for cube in self.cubes for c in cube], self.holy, self.free_id, self.rotated_id,
+                list(self.rotation_order), self.mirrored_id, list(self.mirror_order), self.chance]
+
+    @staticmethod
+    def from_json(shape_id, blob):
+        flat, holy, free_id, rotated_id, rotation_order, mirrored_id, mirror_order, chance = blob
+        cubes = tuple((flat[i], flat[i + 1]) for i in range(0, len(flat), 2))
+        return CubeShape(shape_id, cubes, holy, free_id, rotated_id, tuple(rotation_order), mirrored_id,
+                         tuple(mirror_order), chance)
+
+
+class CubeCatalogue:
+
+    def __init__(self, shapes, cache_path=None):
+        self.shapes = shapes
+        self._cache_path = cache_path
+        self._by_cubes = {shape.cubes: shape for shape in shapes}
+
+        self._by_n = {}
+        for shape in shapes:
+            if shape.n_cubes() not in self._by_n:
+                self._by_n[shape.n_cubes()] = []
+            self._by_n[shape.n_cubes()].append(shape)
+
+        # (n, holy) -> (list of CubeShape, cumulative chances), for picking shapes. holy=None means either.
+        self._pickers = {}
+
+        # n -> list of (mask, CubeShape, (x, y)) for every spot in the box where each shape can go
+        self._placements = {}
+        for n in self._by_n:
+            self._placements[n] = []
+            for shape in self._by_n[n]:
+                for y in range(0, SIZE - shape.size[1] + 1):
+                    for x in range(0, SIZE - shape.size[0] + 1):
+                        self._placements[n].append((shape.mask << (x + SIZE * y), shape, (x, y)))
+
+    def get(self, cubes):
+        return self._by_cubes.get(cubes if isinstance(cubes, tuple) else tuple(cubes))
+
+    def has_n_cubes(self, n):
+        return n in self._by_n
+
+    def all_shapes(self, n):
+        return list(self._by_n.get(n, []))
+
+    def rotated(self, shape):
+        return self.shapes[shape.rotated_id]
+
+    def mirrored(self, shape):
+        return self.shapes[shape.mirrored_id]
+
+    def estimate_chances(self):
+        """fills in the chance of each shape (if that hasn't happened yet), and saves them along with the rest."""
+        if any(s.chance is None for s in self.shapes):
+            chances = _estimate_chances(self.shapes)
+            for s in self.shapes:
+                s.chance = chances[s.shape_id]
+            if self._cache_path is not None:
+                _write_to_disk(self._cache_path, self)
+
+    def holy_chance(self, n):
+        """returns: how likely CubeUtils.gen_cubes(n) is to make a holy shape."""
+        self.estimate_chances()
+        return sum(s.chance for s in self._by_n.get(n, []) if s.holy)
+
+    def sample(self, n, holy=None, rand=random):
+        """
+            picks an n-cube shape with the same odds as CubeUtils.gen_cubes, using exactly one random number.
+            holy: if True or False, only picks from the shapes that are (or aren't) holy, keeping their relative odds.
+        """
+        if (n, holy) not in self._pickers:
+            self.estimate_chances()
+            options = [s for s in self._by_n.get(n, []) if s.chance > 0 and (holy is None or s.holy == holy)]
+            cumulative = []
+            total = 0
+            for s in options:
+                total += s.chance
+                cumulative.append(total)
+            self._pickers[(n, holy)] = (options, cumulative)
+
+        options, cumulative = self._pickers[(n, holy)]
+        if len(options) == 0:
+            raise ValueError("no shapes to pick from: n={}, holy={}".format(n, holy))
+        idx = bisect.bisect_right(cumulative, rand.random() * cumulative[-1])
+        return options[min(idx, len(options) - 1)]
+
+    def placements_that_fit(self, free_mask, n):
+        """
+            free_mask: bitmask of the empty cells of a SIZE x SIZE grid, with bit (x + SIZE * y) for cell (x, y).
+            returns: list of (CubeShape, (x, y)) for every n-cube shape and position that only covers empty cells.
+        """
+        return [(shape, xy) for (mask, shape, xy) in self._placements.get(n, []) if mask & free_mask == mask]
+
+    def any_fit(self, free_mask, n):
+        """returns: whether any n-cube shape fits in the empty cells (see placements_that_fit)."""
+        return any(mask & free_mask == mask for (mask, _, _) in self._placements.get(n, []))
+
+
+def _to_mask(cubes):
+    res = 0
+    for (x, y) in cubes:
+        res |= 1 << (x + SIZE * y)
+    return res
+
+
+def _from_mask(mask):
+    return [(i % SIZE, i // SIZE) for i in range(0, SIZE * SIZE) if mask & (1 << i)]
+
+
+def _all_cube_tuples():
+    """returns: the cleaned cubes of every shape, grown one cube at a time (instead of recursively)."""
+    CubeUtils = cubeutils.CubeUtils
+    res = []
+    prev = {((0, 0),)}
+    for n in range(2, max(N_CUBES) + 1):
+        grown = set()
+        for cubes in prev:
+            for cube in cubes:
+                for n_offs in CubeUtils.NEIGHBORS:
+                    neighbor = (cube[0] + n_offs[0], cube[1] + n_offs[1])
+                    if neighbor not in cubes:
+                        new_cubes = CubeUtils.clean_cubes(cubes + (neighbor,))
+                        w, h = CubeUtils.item_size(new_cubes)
+                        if w <= SIZE and h <= SIZE:
+                            grown.add(new_cubes)
+        if n in N_CUBES:
+            res.extend(sorted(grown))
+        prev = grown
+    return res
+
+
+def _build_shapes():
+    CubeUtils = cubeutils.CubeUtils
+    all_cubes = _all_cube_tuples()
+    ids = {cubes: i for (i, cubes) in enumerate(all_cubes)}
+
+    # the lookups in CubeUtils use the catalogue, so this has to use the geometry directly
+    rotated = []
+    mirrored = []
+    for cubes in all_cubes:
+        for (mapping, dest) in ((CubeUtils.geometric_rotation_mapping(cubes), rotated),
+                                (CubeUtils.geometric_mirror_mapping(cubes), mirrored)):
+            new_cubes = CubeUtils.sort_cubes(mapping[cube] for cube in cubes)
+            order = tuple(new_cubes.index(mapping[cube]) for cube in cubes)
+            dest.append((ids[new_cubes], order))
+
+    free_ids = []
+    for i in range(0, len(all_cubes)):
+        turns = [i]
+        for _ in range(0, 3):
+            turns.append(rotated[turns[-1]][0])
+        free_ids.append(min(turns + [mirrored[t][0] for t in turns]))
+
+    return [CubeShape(i, cubes, CubeUtils.geometric_is_holy(cubes), free_ids[i], rotated[i][0], rotated[i][1],
+                      mirrored[i][0], mirrored[i][1], None)
+            for (i, cubes) in enumerate(all_cubes)]
+
+
+def _estimate_chances(shapes):
+    """returns: list of the chance of each shape, by shape_id"""
+    ids = {s.cubes: s.shape_id for s in shapes}
+    chances = [0.0] * len(shapes)
+    rng = numpy.random.RandomState(_SAMPLER_SEED)
+    for n in N_CUBES:
+        masks, counts = numpy.unique(_run_sampler(n, _N_SAMPLER_RUNS, rng), return_counts=True)
+        for (mask, count) in zip(masks.tolist(), counts.tolist()):
+            chances[ids[cubeutils.CubeUtils.clean_cubes(_from_mask(mask))]] += count / _N_SAMPLER_RUNS
+    return chances
+
+
+def _run_sampler(n, n_runs, rng):
+    """
+        does what CubeUtils.gen_cubes(n) does (in a SIZE x SIZE box) n_runs times over, all at once: the cells go by
+        in a random order, and each one gets added if it touches the shape (or only has a 50% chance if it also
+        touches diagonally), otherwise it gets another chance after every other cell has had one.
+        returns: array of the resulting bitmasks (not pushed to the origin).
+    """
+    n_cells = SIZE * SIZE
+    bits = numpy.left_shift(numpy.int32(1), numpy.arange(0, n_cells, dtype=numpy.int32))
+    neighbor_masks = numpy.zeros(n_cells, dtype=numpy.int32)
+    diag_masks = numpy.zeros(n_cells, dtype=numpy.int32)
+    for i in range(0, n_cells):
+        x, y = i % SIZE, i // SIZE
+        for (offsets, dest) in ((cubeutils.CubeUtils.NEIGHBORS, neighbor_masks),
+                                (((-1, -1), (1, -1), (1, 1), (-1, 1)), diag_masks)):
+            for (dx, dy) in offsets:
+                if 0 <= x + dx < SIZE and 0 <= y + dy < SIZE:
+                    dest[i] |= bits[x + dx + SIZE * (y + dy)]
+
+    # the first cell in the shuffle starts the shape, and the rest are the first pass
+    # order[i] is the i'th cell to go by in each run
+    order = _transposed_argsort(rng.random_sample((n_runs, n_cells)))
+    shapes = bits[order[0]]
+    n_added = numpy.ones(n_runs, dtype=numpy.int32)
+    in_pass = bits.sum() ^ shapes
+    start = 1
+
+    res = []
+    while len(shapes) > 0:
+        rejects = numpy.zeros(len(shapes), dtype=numpy.int32)
+        for i in range(start, n_cells):
+            cell = order[i]
+            bit = bits[cell]
+            live = (in_pass & bit != 0) & (n_added < n)
+            touching = shapes & neighbor_masks[cell] != 0
+            diag = shapes & diag_masks[cell] != 0
+            added = live & touching & (~diag | (rng.random_sample(len(shapes)) < 0.5))
+            shapes |= numpy.where(added, bit, 0)
+            n_added += added
+            rejects |= numpy.where(live & ~added, bit, 0)
+
+        done = n_added >= n
+        res.append(shapes[done])
+        shapes, n_added, in_pass = shapes[~done], n_added[~done], rejects[~done]
+
+        # the rejects get shuffled, and go again (the cells that aren't in the pass sort to the end)
+        keys = rng.random_sample((len(shapes), n_cells))
+        keys[(in_pass[:, None] & bits[None, :]) == 0] = 2
+        order = _transposed_argsort(keys)
+        start = 0
+
+    return numpy.concatenate(res)
+
+
+def _transposed_argsort(keys):
+    """returns: the argsort of each row of keys, as columns (so that each step of the sampler reads one row)."""
+    return numpy.ascontiguousarray(numpy.argsort(keys, axis=1).astype(numpy.int8).T)
+
+
+def _cache_key():
+    return [_FORMAT_VERSION, list(N_CUBES), SIZE, _N_SAMPLER_RUNS, _SAMPLER_SEED]
+
+
+def _cache_path():
+    return pathutils.get_save_data_path(with_subpath=_CACHE_SUBPATH)
+
+
+def _from_bytes(data, cache_path):
+    """returns: the CubeCatalogue, or None if it was built by a different version of the game."""
+    blob = json.loads(data.decode("utf-8"))
+    if blob["cache_key"] != _cache_key():
+        return None
+    return CubeCatalogue([CubeShape.from_json(i, s) for (i, s) in enumerate(blob["shapes"])], cache_path=cache_path)
+
+
+def _read_from_disk(cache_path):
+    return pathutils.read_cache_file(cache_path, lambda data: _from_bytes(data, cache_path), "cube catalogue")
+
+
+def _write_to_disk(cache_path, catalogue):
+    blob = {"cache_key": _cache_key(), "shapes": [s.to_json() for s in catalogue.shapes]}
+    pathutils.write_cache_file(cache_path, json.dumps(blob).encode("utf-8"), "cube catalogue")
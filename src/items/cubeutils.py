@@ -1,5 +1,8 @@
 import random
 
+import src.items.cubecatalogue as cubecatalogue
+
+
 class CubeUtils:
 
     @staticmethod
@@ -26,13 +29,39 @@ class CubeUtils:
 
     @staticmethod
     def rotate_cubes(cubes):
-        rot_mapping = CubeUtils.calc_rotation_mapping(cubes)
+        shape = cubecatalogue.lookup(cubes)
+        if shape is not None:
+            return cubecatalogue.get_catalogue().rotated(shape).cubes
+
+        rot_mapping = CubeUtils.geometric_rotation_mapping(cubes)
         res = tuple(rot_mapping[cube] for cube in cubes)
         return CubeUtils.sort_cubes(res)
 
     @staticmethod
     def calc_rotation_mapping(cubes):
         """returns: map (x, y) -> (x, y)"""
+        shape = cubecatalogue.lookup(cubes)
+        if shape is not None:
+            return CubeUtils._mapping_from_order(shape.cubes, cubecatalogue.get_catalogue().rotated(shape).cubes,
+                                                 shape.rotation_order)
+        return CubeUtils.geometric_rotation_mapping(cubes)
+
+    @staticmethod
+    def calc_mirror_mapping(cubes):
+        """returns: map (x, y) -> (x, y)"""
+        shape = cubecatalogue.lookup(cubes)
+        if shape is not None:
+            return CubeUtils._mapping_from_order(shape.cubes, cubecatalogue.get_catalogue().mirrored(shape).cubes,
+                                                 shape.mirror_order)
+        return CubeUtils.geometric_mirror_mapping(cubes)
+
+    @staticmethod
+    def _mapping_from_order(cubes, new_cubes, order):
+        return {cube: new_cubes[idx] for (cube, idx) in zip(cubes, order)}
+
+    @staticmethod
+    def geometric_rotation_mapping(cubes):
+        """calc_rotation_mapping without the catalogue. returns: map (x, y) -> (x, y)"""
         res = {}
         min_x = float('inf')
         min_y = float('inf')
@@ -48,8 +77,8 @@ class CubeUtils:
         return res
 
     @staticmethod
-    def calc_mirror_mapping(cubes):
-        """returns: map (x, y) -> (x, y)"""
+    def geometric_mirror_mapping(cubes):
+        """calc_mirror_mapping without the catalogue. returns: map (x, y) -> (x, y)"""
         res = {}
         min_x = float('inf')
         min_y = float('inf')
@@ -75,6 +104,10 @@ class CubeUtils:
         if n > size[0] * size[1]:
             raise ValueError("{} is too many cubes for {}".format(n, size))
 
+        if (cubecatalogue.is_sampling_enabled() and size == (cubecatalogue.SIZE, cubecatalogue.SIZE)
+                and n in cubecatalogue.N_CUBES):
+            return cubecatalogue.get_catalogue().sample(n).cubes
+
         choices = []
         for x in range(0, size[0]):
             for y in range(0, size[1]):
@@ -109,6 +142,14 @@ class CubeUtils:
     @staticmethod
     def is_holy(cubes):
         """return: whether the cube configuration has a hole"""
+        shape = cubecatalogue.lookup(cubes)
+        if shape is not None:
+            return shape.holy
+        return CubeUtils.geometric_is_holy(cubes)
+
+    @staticmethod
+    def geometric_is_holy(cubes):
+        """is_holy without the catalogue."""
         size = CubeUtils.item_size(cubes)
         for x in range(1, size[0] - 1):
             for y in range(1, size[1] - 1):
@@ -1,7 +1,7 @@
 import random
 import uuid
 
-from src.game.stats import StatTypes, StatProvider
+from src.game.stats import StatTypes, StatProvider, applied_stats_vector
 from src.utils.util import Utils
 import src.renderengine.img as img
 from src.items.cubeutils import CubeUtils
@@ -191,6 +191,7 @@ class Item(StatProvider):
         self.item_type = item_type
         self.item_actions = tuple() if actions is None else tuple(actions)
         self.stats = tuple(stats)
+        self._stat_vectors = {False: None, True: None}  # local -> stat vector, built as needed
         self.cubes = tuple(CubeUtils.clean_cubes(cubes))
         self.color = color
         self.uuid = uuid_str if uuid_str is not None else str(uuid.uuid4())
@@ -269,6 +270,12 @@ class Item(StatProvider):
                 res += stat.value
         return res
 
+    def stat_vector(self, local=False):
+        # stats can't change after the item is created, so these only need to be built once
+        if self._stat_vectors[local] is None:
+            self._stat_vectors[local] = applied_stats_vector(self.all_applied_stats(), local=local)
+        return self._stat_vectors[local]
+
     def all_applied_stats(self):
         return self.stats
 
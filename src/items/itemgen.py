@@ -6,6 +6,7 @@ from src.game.stats import StatTypes, StatType, StatProvider
 import src.game.spriteref as spriteref
 from src.utils.util import Utils
 from src.items.cubeutils import CubeUtils
+import src.items.cubecatalogue as cubecatalogue
 import src.game.statuseffects as statuseffects
 import src.game.balance as balance
 import src.game.debug as debug
@@ -435,6 +436,12 @@ class StatCubesItemFactory:
         is_holy = CubeUtils.is_holy(cubes)
 
         if n_cubes >= 7 and not is_holy and debug.holy_artifacts_100x_more_likely():
+            catalogue = cubecatalogue.get_catalogue()
+            if catalogue.has_n_cubes(n_cubes):
+                # same odds as re-rolling up to 100 times until it's holy, but without the re-rolling
+                chance_of_holy = 1 - (1 - catalogue.holy_chance(n_cubes)) ** 100
+                return catalogue.sample(n_cubes, holy=random.random() < chance_of_holy).cubes
+
             for _ in range(0, 100):
                 cubes = CubeUtils.gen_cubes(n_cubes)
                 is_holy = CubeUtils.is_holy(cubes)
@@ -0,0 +1,95 @@
+import src.renderengine.headless as headless  # must be imported before anything else touches OpenGL
+
+import random
+import time
+
+import numpy
+from OpenGL.GL import *
+
+from src.renderengine.engine import RenderEngine130, RenderEngineVBO
+from src.renderengine.render_benchmarks import gen_random_bundles
+
+
+"""
+Compares the render backends inside a headless GL context (EGL surfaceless), checking that they draw
+the same pixels and timing their frames.
+
+Run with: python -m src.renderengine.backend_benchmarks
+"""
+
+_SCREEN_SIZE = (128, 96)  # kept small so software rasterizers measure submission, not fill rate
+_SHEET_SIZE = 1024
+
+
+def _setup_engine(engine_type, n_sprites, seed):
+    engine = engine_type()
+    engine.init(*_SCREEN_SIZE)
+
+    rand = numpy.random.RandomState(seed)
+    tex_data = rand.randint(0, 256, size=(_SHEET_SIZE, _SHEET_SIZE, 4), dtype=numpy.uint8)
+    tex_data[:, :, 3] = 255
+    engine.set_texture(tex_data.tobytes(), _SHEET_SIZE, _SHEET_SIZE)
+
+    engine.add_layer(0, "sorted", 0, True, True)
+    engine.add_layer(1, "unsorted", 1, False, False)
+
+    bundles = gen_random_bundles(n_sprites, seed=seed)
+    for i in range(0, len(bundles)):
+        bundles[i] = bundles[i].update(new_x=bundles[i].x() / 4, new_y=bundles[i].y() / 4)
+        bundles[i]._layer = i % 2
+        engine.update(bundles[i])
+
+    return engine, bundles
+
+
+def _do_frames(engine, bundles, n_frames, churn, seed):
+    """returns: (average time spent in render_layers, average time including glFinish)"""
+    rand = random.Random(seed)
+    submit_time = 0
+    total_time = 0
+    for _ in range(0, n_frames):
+        for _ in range(0, int(len(bundles) * churn)):
+            i = rand.randint(0, len(bundles) - 1)
+            bundles[i] = bundles[i].update(new_x=bundles[i].x() + rand.randint(-1, 1),
+                                           new_depth=bundles[i].depth() + rand.randint(-1, 1))
+            engine.update(bundles[i])
+
+        start = time.perf_counter()
+        engine.render_layers()
+        submit_time += time.perf_counter() - start
+        glFinish()
+        total_time += time.perf_counter() - start
+
+    return submit_time / n_frames, total_time / n_frames
+
+
+def bench_backends(sizes=(1000, 10000, 50000), n_frames=30, churn=0.001):
+    ctx = headless.HeadlessContext(*_SCREEN_SIZE)
+    print("INFO: headless context running OpenGL version: {}".format(glGetString(GL_VERSION).decode()))
+
+    for n in sizes:
+        frame_times = []
+        pixels = []
+
+        for engine_type in (RenderEngine130, RenderEngineVBO):
+            engine, bundles = _setup_engine(engine_type, n, seed=n)
+            frame_times.append(_do_frames(engine, bundles, n_frames, churn, seed=n))
+            pixels.append(ctx.read_pixels().copy())
+
+            for layer_id in list(engine.layers.keys()):
+                engine.remove_layer(layer_id)
+            engine.cleanup()
+
+        if not numpy.array_equal(pixels[0], pixels[1]):
+            raise ValueError("backends drew different images (n={})".format(n))
+
+        print("INFO: frame time n={}, churn={}:\tclient arrays={:.2f}ms ({:.2f}ms submit)"
+              "\tbuffer objects={:.2f}ms ({:.2f}ms submit)".format(
+                n, churn, frame_times[0][1] * 1000, frame_times[0][0] * 1000,
+                frame_times[1][1] * 1000, frame_times[1][0] * 1000))
+
+    ctx.cleanup()
+
+
+if __name__ == "__main__":
+    bench_backends()
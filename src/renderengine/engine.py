@@ -1,11 +1,15 @@
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+import ctypes
 import numpy
 import math
 import re
+import time
 import traceback
 
+from src.renderengine.img import ImageBundle
+
 
 def assert_int(val):
     if not isinstance(val, int):
@@ -41,7 +45,47 @@ def remove_all_in_place(l, elements):
     del l[(last_element+1):]
 
 
+def calc_removal_moves(positions_to_remove, length):
+    """
+        finds the moves that remove_all_in_place would make, without scanning the whole list.
+
+        positions_to_remove: indices of the elements being removed.
+        returns: (new_length, list of (src_idx, dest_idx) moves)
+    """
+    rem_set = set(positions_to_remove)
+    new_length = length - len(rem_set)
+
+    holes = sorted(idx for idx in rem_set if idx < new_length)
+    fillers = [idx for idx in range(length - 1, new_length - 1, -1) if idx not in rem_set]
+
+    return new_length, list(zip(fillers, holes))
+
+
+def merge_ranges(ranges):
+    """
+        ranges: list of (start, end)
+        returns: sorted list of non-overlapping (start, end) covering the same values.
+    """
+    merged = []
+    for (start, end) in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# the two triangles of each sprite's quad, relative to its first vertex
+_QUAD_INDICES = numpy.array([0, 1, 2, 0, 2, 3])
+
+
 class _Layer:
+
+    _INITIAL_CAPACITY = 16
+
+    # past this many depth changes in one rebuild, sorted layers just re-sort everything
+    _MAX_INCREMENTAL_SORT_CHANGES = 32
+
     def __init__(self, name, layer_id, z_order, sort_sprites, use_color):
         """
             name: str -- used for logging
@@ -51,21 +95,42 @@ class _Layer:
         """
         self.name = name
         self.layer_id = layer_id
-        self.images = []  # ordered list of image ids
+        self.images = []  # ordered list of image ids, images[i] lives in slot i of the buffers
         self._image_set = set()
+        self._slots = {}  # image id -> slot index
         self._offset = (0, 0)
         self._z_order = z_order
         self.sort_sprites = sort_sprites
 
+        # number of sprites the buffers have room for. slots past len(self.images) are free.
+        self._capacity = 0
+
         # these are the pointers the layer passes to gl
         self.vertices = numpy.array([], dtype=float)
         self.tex_coords = numpy.array([], dtype=float)
         self.indices = numpy.array([], dtype=float)
         self.colors = numpy.array([], dtype=float) if use_color else None
+
+        # draw order, only tracked for sorted layers. for unsorted layers, sprites are drawn in slot order.
+        self._order = numpy.array([], dtype=numpy.int64)  # draw position -> slot
+        self._order_keys = numpy.array([], dtype=float)  # draw position -> -depth, always ascending
+        self._positions = numpy.array([], dtype=numpy.int64)  # slot -> draw position
+        self._depths = numpy.array([], dtype=float)  # slot -> depth
+        self._n_ordered = 0
         
         self._dirty_sprites = []
         self._to_remove = []
         self._to_add = []
+
+        # what's changed since the buffers were last copied to the GPU (only used by RenderEngineVBO)
+        self._gpu_needs_realloc = True
+        self._gpu_dirty_ranges = []  # list of (first_slot, last_slot + 1)
+        self._gpu_dirty_index_ranges = []  # list of (first_draw_position, last_draw_position + 1)
+        self._order_dirty_ranges = []
+
+        self.last_rebuild_time = 0  # seconds spent in the most recent rebuild
+        self.last_render_time = 0  # seconds spent rebuilding and drawing during the most recent render_layers
+        self.last_rebuild_n_written = 0  # number of sprites written in the most recent rebuild
     
     def set_offset(self, x, y):
         self._offset = (x, y)
@@ -92,44 +157,283 @@ class _Layer:
         
     def uses_color(self):
         return self.colors is not None
-        
-    def rebuild(self, bundle_lookup): 
+
+    def capacity(self):
+        return self._capacity
+
+    def _mark_gpu_dirty(self, first_slot, end_slot):
+        if first_slot < end_slot:
+            self._gpu_dirty_ranges.append((first_slot, end_slot))
+
+    def _mark_gpu_dirty_slots(self, slots):
+        if len(slots) == 0:
+            return
+        slots = numpy.unique(slots)
+        breaks = numpy.flatnonzero(numpy.diff(slots) > 1)
+        starts = numpy.concatenate((slots[:1], slots[breaks + 1]))
+        ends = numpy.concatenate((slots[breaks], slots[-1:])) + 1
+        self._gpu_dirty_ranges.extend(zip(starts.tolist(), ends.tolist()))
+
+    def invalidate_gpu_buffers(self):
+        self._gpu_needs_realloc = True
+
+    def pop_gpu_changes(self):
+        """
+            returns: (needs_realloc, dirty_ranges, dirty_index_ranges) describing what changed since the last call.
+                needs_realloc: bool -- true if the buffers were resized and must be re-uploaded entirely.
+                dirty_ranges: sorted, non-overlapping list of (first_slot, last_slot + 1) that were written.
+                dirty_index_ranges: same, but for rows of the index array (which are in draw order).
+        """
+        res = (self._gpu_needs_realloc,
+               merge_ranges(self._gpu_dirty_ranges),
+               merge_ranges(self._gpu_dirty_index_ranges))
+        self._gpu_needs_realloc = False
+        self._gpu_dirty_ranges = []
+        self._gpu_dirty_index_ranges = []
+        return res
+
+    def _ensure_capacity(self, n_sprites):
+        if n_sprites <= self._capacity:
+            return
+
+        old_capacity = self._capacity
+        new_capacity = max(_Layer._INITIAL_CAPACITY, self._capacity)
+        while new_capacity < n_sprites:
+            new_capacity *= 2
+
+        # need refcheck to be false or else Pycharm's debugger can cause this to fail (due to holding a ref)
+        self.vertices.resize(8 * new_capacity, refcheck=False)
+        self.tex_coords.resize(8 * new_capacity, refcheck=False)
+        self.indices.resize(6 * new_capacity, refcheck=False)
+        if self.uses_color():
+            self.colors.resize(4 * 3 * new_capacity, refcheck=False)
+        if self.sort_sprites:
+            for arr in (self._order, self._order_keys, self._positions, self._depths):
+                arr.resize(new_capacity, refcheck=False)
+
+        # in unsorted layers, a slot's indices only depend on its position, so they're written once
+        # when the slot is created. sorted layers overwrite these as their draw order changes.
+        new_slots = numpy.arange(old_capacity, new_capacity)
+        self.indices.reshape(-1, 6)[new_slots] = 4 * new_slots[:, None] + _QUAD_INDICES
+
+        self._capacity = new_capacity
+        self._gpu_needs_realloc = True
+
+    def _move_slots(self, moves):
+        """moves: list of (src_slot, dest_slot)"""
+        if len(moves) == 0:
+            return
+
+        src = numpy.array([m[0] for m in moves])
+        dest = numpy.array([m[1] for m in moves])
+
+        for arr, stride in self._per_slot_arrays():
+            rows = arr.reshape(-1, stride)
+            rows[dest] = rows[src]
+
+        for (src_slot, dest_slot) in moves:
+            uid = self.images[src_slot]
+            self.images[dest_slot] = uid
+            self._slots[uid] = dest_slot
+
+        self._mark_gpu_dirty_slots(dest)
+
+        if self.sort_sprites:
+            # the sprites keep their draw positions, those positions just point at new slots now
+            moved_positions = self._positions[dest]
+            self._order[moved_positions] = dest
+            self._mark_order_dirty_positions(moved_positions)
+
+    def _per_slot_arrays(self):
+        yield self.vertices, 8
+        yield self.tex_coords, 8
+        if self.uses_color():
+            yield self.colors, 12
+        if self.sort_sprites:
+            yield self._depths, 1
+            yield self._positions, 1
+
+    def _apply_removals(self):
+        rem_set = set(self._to_remove)
+        for bun_id in rem_set:
+            if bun_id in self._image_set:
+                self._image_set.remove(bun_id)
+
+        remove_all_in_place(self._to_add, rem_set)
+
+        removed_slots = [self._slots[uid] for uid in rem_set if uid in self._slots]
+        if self.sort_sprites and len(removed_slots) > 0:
+            self._remove_from_order(numpy.array(removed_slots, dtype=numpy.int64))
+
+        # swap-with-last compaction, the same moves remove_all_in_place would make
+        new_length, moves = calc_removal_moves(removed_slots, len(self.images))
+        self._move_slots(moves)
+
+        for uid in rem_set:
+            self._slots.pop(uid, None)
+
+        del self.images[new_length:]
+        self._to_remove.clear()
+
+    def _apply_additions(self):
+        start = len(self.images)
+        self._ensure_capacity(start + len(self._to_add))
+
+        for i in range(0, len(self._to_add)):
+            self._slots[self._to_add[i]] = start + i
+
+        self.images.extend(self._to_add)
+        self._to_add.clear()
+
+    def _mark_order_dirty(self, first_pos, end_pos):
+        if first_pos < end_pos:
+            self._order_dirty_ranges.append((first_pos, end_pos))
+
+    def _mark_order_dirty_positions(self, positions):
+        for pos in positions:
+            self._order_dirty_ranges.append((int(pos), int(pos) + 1))
+
+    def _remove_from_order(self, slots):
+        """takes the given slots out of the draw order. everything else keeps its relative order."""
+        n = self._n_ordered
+        positions = self._positions[slots]
+        first = int(positions.min())
+
+        keep = numpy.ones(n - first, dtype=bool)
+        keep[positions - first] = False
+        new_n = first + int(numpy.count_nonzero(keep))
+
+        self._order[first:new_n] = self._order[first:n][keep]
+        self._order_keys[first:new_n] = self._order_keys[first:n][keep]
+        self._positions[self._order[first:new_n]] = numpy.arange(first, new_n)
+
+        self._n_ordered = new_n
+        self._mark_order_dirty(first, new_n)
+
+    def _place_in_order(self, slot, key, is_new):
+        """
+            moves a sprite to its spot in the draw order, shifting only the sprites between its old
+            and new positions. ties end up the way a stable sort of the old order would leave them: a
+            new sprite, or one whose key went down, goes after the sprites it's tied with, and one
+            whose key went up goes before them.
+        """
+        n = self._n_ordered
+        order = self._order
+        keys = self._order_keys
+
+        # keys[:n] stays sorted after every call, so this is valid even while other sprites are waiting to move
+        side = 'left' if not is_new and key > keys[self._positions[slot]] else 'right'
+        insert_at = int(numpy.searchsorted(keys[:n], key, side=side))
+
+        if is_new:
+            new_pos = insert_at
+            order[new_pos + 1:n + 1] = order[new_pos:n]
+            keys[new_pos + 1:n + 1] = keys[new_pos:n]
+            self._n_ordered = n + 1
+            first, end = new_pos, n + 1
+        else:
+            old_pos = int(self._positions[slot])
+            new_pos = insert_at - 1 if insert_at > old_pos else insert_at
+            if new_pos > old_pos:
+                order[old_pos:new_pos] = order[old_pos + 1:new_pos + 1]
+                keys[old_pos:new_pos] = keys[old_pos + 1:new_pos + 1]
+            elif new_pos < old_pos:
+                order[new_pos + 1:old_pos + 1] = order[new_pos:old_pos]
+                keys[new_pos + 1:old_pos + 1] = keys[new_pos:old_pos]
+            first, end = min(old_pos, new_pos), max(old_pos, new_pos) + 1
+
+        order[new_pos] = slot
+        keys[new_pos] = key
+        self._positions[order[first:end]] = numpy.arange(first, end)
+        self._mark_order_dirty(first, end)
+
+    def _update_order(self, slots, depths, n_new):
+        """
+            slots: the slots that were just written, with the newly added ones first.
+            depths: the new depth of each of those slots.
+            n_new: how many of the slots were just added.
+        """
+        old_depths = self._depths[slots]
+        self._depths[slots] = depths
+
+        to_move = numpy.flatnonzero(depths[n_new:] != old_depths[n_new:]) + n_new
+        n_changes = n_new + len(to_move)
+
+        if n_changes > max(_Layer._MAX_INCREMENTAL_SORT_CHANGES, self._n_ordered // 128):
+            self._resort_everything(slots[:n_new])
+        else:
+            # to match a stable sort, sprites whose keys went up are placed last-drawn first, and the ones
+            # whose keys went down (and then the new ones) are placed first-drawn first
+            went_up = -depths[to_move] > -old_depths[to_move]
+            positions = self._positions[slots[to_move]]
+            for i in to_move[went_up][numpy.argsort(-positions[went_up], kind='stable')]:
+                self._place_in_order(int(slots[i]), -depths[i], False)
+            for i in to_move[~went_up][numpy.argsort(positions[~went_up], kind='stable')]:
+                self._place_in_order(int(slots[i]), -depths[i], False)
+            for i in range(0, n_new):
+                self._place_in_order(int(slots[i]), -depths[i], True)
+
+        # indices are written in draw order, so only the stretch of positions that shifted needs rewriting
+        index_rows = self.indices.reshape(-1, 6)
+        for (first, end) in merge_ranges(self._order_dirty_ranges):
+            index_rows[first:end] = 4 * self._order[first:end, None] + _QUAD_INDICES
+            self._gpu_dirty_index_ranges.append((first, end))
+        self._order_dirty_ranges.clear()
+
+    def _resort_everything(self, new_slots):
+        """when lots of sprites moved at once, it's cheaper to sort the whole layer in one go."""
+        n = self._n_ordered + len(new_slots)
+        order = self._order
+        order[self._n_ordered:n] = new_slots
+
+        # stable, so unmoved sprites with equal depths keep their relative order
+        keys = -self._depths[order[:n]]
+        perm = numpy.argsort(keys, kind='stable')
+        order[:n] = order[:n][perm]
+        self._order_keys[:n] = keys[perm]
+        self._positions[order[:n]] = numpy.arange(0, n)
+
+        self._n_ordered = n
+        self._mark_order_dirty(0, n)
+
+    def draw_order(self):
+        """returns: the layer's image ids, in the order they're drawn."""
+        if self.sort_sprites:
+            return [self.images[slot] for slot in self._order[:self._n_ordered]]
+        else:
+            return list(self.images)
+
+    def rebuild(self, bundle_lookup):
+        start_time = time.perf_counter()
+
         if len(self._to_remove) > 0:
-            for bun_id in self._to_remove:
-                if bun_id in self._image_set:
-                    self._image_set.remove(bun_id)
+            self._apply_removals()
 
-            remove_all_in_place(self.images, self._to_remove)
-            remove_all_in_place(self._to_add, self._to_remove)
-            self._to_remove.clear()
+        # new sprites first, in the order they were added, then everything else that changed
+        to_write = dict.fromkeys(self._to_add)
+        n_new = len(to_write)
 
         if len(self._to_add) > 0:
-            self.images.extend(self._to_add)
-            self._to_add.clear()
+            self._apply_additions()
 
+        for uid in self._dirty_sprites:
+            if uid in self._slots:
+                to_write[uid] = None
         self._dirty_sprites.clear()
-        
+
+        to_write = list(to_write)
+        bundles = [bundle_lookup[uid] for uid in to_write]
+        slots = numpy.array([self._slots[uid] for uid in to_write], dtype=numpy.int64)
+
+        ImageBundle.add_all(bundles, self.vertices, self.tex_coords, self.colors, None, idxs=slots)
+        self._mark_gpu_dirty_slots(slots)
+
         if self.sort_sprites:
-            self.images.sort(key=lambda x: -bundle_lookup[x].depth())
+            self._update_order(slots, ImageBundle.gather_depths(bundles), n_new)
 
-        n_sprites = len(self.images)
+        self.last_rebuild_n_written = len(to_write)
+        self.last_rebuild_time = time.perf_counter() - start_time
 
-        # need refcheck to be false or else Pycharm's debugger can cause this to fail (due to holding a ref)
-        self.vertices.resize(8 * n_sprites, refcheck=False)
-        self.tex_coords.resize(8 * n_sprites, refcheck=False)
-        self.indices.resize(6 * n_sprites, refcheck=False)
-        if self.uses_color():
-            self.colors.resize(4 * 3 * n_sprites, refcheck=False)
-
-        for i in range(0, n_sprites):
-            bundle = bundle_lookup[self.images[i]]
-            bundle.add_urself(
-                    i,
-                    self.vertices, 
-                    self.tex_coords, 
-                    self.colors, 
-                    self.indices)
-            
     def render(self, engine):
         # split up like this to make it easier to find performance bottlenecks
         self._set_client_states(True, engine)
@@ -150,7 +454,7 @@ class _Layer:
             engine.set_colors(self.colors)
 
     def _draw_elements(self):
-        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.indices)
+        glDrawElements(GL_TRIANGLES, 6 * len(self.images), GL_UNSIGNED_INT, self.indices)
 
     def __len__(self):
         return len(self.images)   
@@ -234,6 +538,8 @@ class RenderEngine:
 
         if major_vers <= 1 and minor_vers < 30:
             return RenderEngine120()
+        elif RenderEngineVBO.is_supported():
+            return RenderEngineVBO()
         else:
             return RenderEngine130()
 
@@ -255,6 +561,16 @@ class RenderEngine:
             _SINGLETON = RenderEngine._get_best_render_engine(glsl_version)
             return _SINGLETON
 
+    @staticmethod
+    def create_headless_instance():
+        """intializes the RenderEngine singleton as an engine that never touches OpenGL."""
+        global _SINGLETON
+        if _SINGLETON is not None:
+            raise ValueError("There is already a RenderEngine initialized.")
+        else:
+            _SINGLETON = RenderEngineHeadless()
+            return _SINGLETON
+
     @staticmethod
     def get_instance():
         """after init is called, returns the RenderEngine singleton."""
@@ -462,21 +778,36 @@ class RenderEngine:
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         for layer in self.ordered_layers:
+            start_time = time.perf_counter()
             if layer.is_dirty():
                 layer.rebuild(self.bundles)
+            else:
+                layer.last_rebuild_time = 0
+                layer.last_rebuild_n_written = 0
 
-            if layer.layer_id in self.hidden_layers:
-                continue
+            if layer.layer_id not in self.hidden_layers:
+                offs = layer.offset()
 
-            offs = layer.offset()
+                self.set_matrix_offset(-offs[0], -offs[1])
 
-            self.set_matrix_offset(-offs[0], -offs[1])
-            
-            layer.render(self)
+                self.render_layer(layer)
+
+            layer.last_render_time = time.perf_counter() - start_time
+
+    def render_layer(self, layer):
+        layer.render(self)
 
     def cleanup(self):
         self.shader.end()
 
+    def get_rebuild_times(self):
+        """returns: map of layer name -> seconds spent rebuilding that layer during the last render_layers call."""
+        return {layer.name: layer.last_rebuild_time for layer in self.ordered_layers}
+
+    def get_render_times(self):
+        """returns: map of layer name -> seconds spent rebuilding and drawing that layer during the last render_layers call."""
+        return {layer.name: layer.last_render_time for layer in self.ordered_layers}
+
     def count_sprites(self):
         res = 0
         for layer in self.layers.values():
@@ -741,3 +1072,201 @@ class RenderEngine120(RenderEngine130):
             }
             '''
         )
+
+
+class _LayerBuffers:
+    """the GPU-side copy of a _Layer's arrays."""
+
+    # past this many separate dirty ranges, it's cheaper to re-upload the whole buffer
+    MAX_SUB_UPLOADS = 32
+
+    def __init__(self, layer, position_loc, texture_pos_loc, color_loc):
+        self.vao = glGenVertexArrays(1)
+        self.vertex_vbo, self.tex_coord_vbo, self.color_vbo, self.index_vbo = glGenBuffers(4)
+        self.capacity = -1
+        self.uses_color = layer.uses_color()
+
+        # the attribute layout lives in the VAO, so it only needs to be set up once
+        glBindVertexArray(self.vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo)
+        glEnableVertexAttribArray(position_loc)
+        glVertexAttribPointer(position_loc, 2, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.tex_coord_vbo)
+        glEnableVertexAttribArray(texture_pos_loc)
+        glVertexAttribPointer(texture_pos_loc, 2, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+
+        if self.uses_color:
+            glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+            glEnableVertexAttribArray(color_loc)
+            glVertexAttribPointer(color_loc, 3, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+        else:
+            # falls back to the default (white) color set in setup_shader
+            glDisableVertexAttribArray(color_loc)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        printOpenGLError()
+
+    def _array_buffers(self, layer):
+        yield self.vertex_vbo, layer.vertices, 8
+        yield self.tex_coord_vbo, layer.tex_coords, 8
+        if self.uses_color:
+            yield self.color_vbo, layer.colors, 12
+
+    def sync(self, layer):
+        """uploads whatever parts of the layer changed since the last sync."""
+        needs_realloc, dirty_ranges, dirty_index_ranges = layer.pop_gpu_changes()
+        capacity = layer.capacity()
+
+        reallocate = needs_realloc or capacity != self.capacity
+
+        if reallocate:
+            for vbo, arr, _ in self._array_buffers(layer):
+                self._upload_all(GL_ARRAY_BUFFER, vbo, arr.astype(numpy.float32), GL_DYNAMIC_DRAW)
+
+            glBindVertexArray(self.vao)
+            self._upload_all(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo, layer.indices.astype(numpy.uint32),
+                             GL_DYNAMIC_DRAW)
+            glBindVertexArray(0)
+
+            self.capacity = capacity
+
+        elif len(dirty_ranges) > 0:
+            n_dirty = sum(end_slot - first_slot for (first_slot, end_slot) in dirty_ranges)
+            orphan = 2 * n_dirty > capacity or len(dirty_ranges) > _LayerBuffers.MAX_SUB_UPLOADS
+
+            for vbo, arr, stride in self._array_buffers(layer):
+                if orphan:
+                    # replacing the whole store lets the driver hand us fresh memory instead of waiting
+                    # for draws that still use the old contents.
+                    self._upload_all(GL_ARRAY_BUFFER, vbo, arr.astype(numpy.float32), GL_DYNAMIC_DRAW)
+                else:
+                    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+                    for (first_slot, end_slot) in dirty_ranges:
+                        data = arr[first_slot * stride:end_slot * stride].astype(numpy.float32)
+                        glBufferSubData(GL_ARRAY_BUFFER, first_slot * stride * 4, data.nbytes, data)
+
+        if not reallocate and len(dirty_index_ranges) > 0:
+            # only sorted layers change their indices, and only over the draw positions that shifted
+            glBindVertexArray(self.vao)
+            if len(dirty_index_ranges) > _LayerBuffers.MAX_SUB_UPLOADS:
+                self._upload_all(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo, layer.indices.astype(numpy.uint32),
+                                 GL_DYNAMIC_DRAW)
+            else:
+                for (first_pos, end_pos) in dirty_index_ranges:
+                    data = layer.indices[first_pos * 6:end_pos * 6].astype(numpy.uint32)
+                    glBufferSubData(GL_ELEMENT_ARRAY_BUFFER, first_pos * 6 * 4, data.nbytes, data)
+            glBindVertexArray(0)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        printOpenGLError()
+
+    def _upload_all(self, target, vbo, data, usage):
+        glBindBuffer(target, vbo)
+        glBufferData(target, data.nbytes, data, usage)
+
+    def draw(self, n_sprites):
+        glBindVertexArray(self.vao)
+        glDrawElements(GL_TRIANGLES, 6 * n_sprites, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteBuffers(4, [self.vertex_vbo, self.tex_coord_vbo, self.color_vbo, self.index_vbo])
+        glDeleteVertexArrays(1, [self.vao])
+
+
+class RenderEngineVBO(RenderEngine130):
+    """
+        keeps each layer's geometry in GPU buffer objects, so only the slots that changed
+        get re-uploaded each frame. needs OpenGL 3.0 (for vertex array objects).
+    """
+
+    @staticmethod
+    def is_supported():
+        try:
+            return bool(glGenVertexArrays) and bool(glGenBuffers) and bool(glBufferSubData)
+        except Exception:
+            return False
+
+    def __init__(self):
+        super().__init__()
+        self._layer_buffers = {}  # layer_id -> _LayerBuffers
+
+    def render_layer(self, layer):
+        buffers = self._layer_buffers.get(layer.layer_id)
+        if buffers is None:
+            buffers = _LayerBuffers(layer, self._position_attrib_loc, self._texture_pos_attrib_loc,
+                                    self._color_attrib_loc)
+            self._layer_buffers[layer.layer_id] = buffers
+
+        buffers.sync(layer)
+        buffers.draw(layer.num_sprites())
+
+    def remove_layer(self, layer_id):
+        if layer_id in self._layer_buffers:
+            self._layer_buffers[layer_id].delete()
+            del self._layer_buffers[layer_id]
+        super().remove_layer(layer_id)
+
+    def reset_for_display_mode_change(self):
+        # the old buffers went away with the old context
+        self._layer_buffers.clear()
+        for layer in self.layers.values():
+            layer.invalidate_gpu_buffers()
+
+        super().reset_for_display_mode_change()
+
+
+class RenderEngineHeadless(RenderEngine):
+    """
+        keeps track of the active sprites like a real engine, but never uploads or draws them.
+        used to run the game without a window or GL context.
+    """
+
+    def __init__(self):
+        RenderEngine.__init__(self)
+
+    def get_glsl_version(self):
+        return None
+
+    def init(self, w, h):
+        self.resize(w, h)
+
+    def reset_for_display_mode_change(self):
+        pass
+
+    def resize_internal(self):
+        pass
+
+    def set_clear_color(self, r, g, b):
+        pass
+
+    def set_texture(self, img_data, width, height, tex_id=None):
+        pass
+
+    def remove(self, img_bundle):
+        if img_bundle is None:
+            return
+        self.bundles.pop(img_bundle.uid(), None)
+
+    def update(self, img_bundle):
+        if img_bundle is None:
+            return
+        for bun in img_bundle.all_bundles():
+            self.bundles[bun.uid()] = bun
+
+    def clear_all_sprites(self):
+        self.bundles.clear()
+
+    def render_layers(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+    def count_sprites(self):
+        return len(self.bundles)
@@ -0,0 +1,67 @@
+import os
+import ctypes
+
+# these have to be set before OpenGL is imported anywhere, so import this module first.
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+from OpenGL import EGL
+from OpenGL.GL import *
+
+import numpy
+
+
+"""
+A window-less GL context (EGL surfaceless, e.g. Mesa's llvmpipe), so the render engines can be
+exercised on machines without a display or GPU.
+"""
+
+
+class HeadlessContext:
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self._display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self._display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise ValueError("failed to initialize EGL display")
+
+        config_attribs = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                          EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                          EGL.EGL_NONE]
+        config_attribs = (EGL.EGLint * len(config_attribs))(*config_attribs)
+        config = EGL.EGLConfig()
+        n_configs = EGL.EGLint()
+        EGL.eglChooseConfig(self._display, config_attribs, ctypes.pointer(config), 1, ctypes.pointer(n_configs))
+        if n_configs.value == 0:
+            raise ValueError("no EGL config supports desktop OpenGL")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self._context = EGL.eglCreateContext(self._display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self._context):
+            raise ValueError("failed to make EGL context current")
+
+        # there's no window, so everything gets drawn into an offscreen framebuffer instead
+        self._fbo = glGenFramebuffers(1)
+        self._color_rb = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self._color_rb)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self._fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self._color_rb)
+
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise ValueError("offscreen framebuffer is incomplete")
+
+    def read_pixels(self):
+        """returns: uint8 array of shape (height, width, 4)"""
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(self.height, self.width, 4)
+
+    def cleanup(self):
+        glDeleteFramebuffers(1, [self._fbo])
+        glDeleteRenderbuffers(1, [self._color_rb])
+        EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self._display, self._context)
+        EGL.eglTerminate(self._display)
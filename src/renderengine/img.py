@@ -2,9 +2,13 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 
 import random
+import numpy
 
 UNIQUE_ID_CTR = 0
 
+# the two triangles of each sprite's quad, relative to its first vertex
+_QUAD_INDICES = numpy.array([0, 1, 2, 0, 2, 3])
+
 
 def gen_unique_id():
     """Note: this ain't threadsafe"""
@@ -13,7 +17,82 @@ def gen_unique_id():
     return UNIQUE_ID_CTR - 1
     
 
+class _BundleStore:
+    """
+        column storage for the render-relevant fields of every live ImageBundle. each bundle owns one row,
+        which lets the render engine pull the fields of many bundles at once with array indexing.
+    """
+
+    def __init__(self):
+        self._capacity = 0
+        self._n_rows = 0
+        self._free_rows = []
+
+        self.x = numpy.zeros(0, dtype=numpy.float64)
+        self.y = numpy.zeros(0, dtype=numpy.float64)
+        self.scale = numpy.zeros(0, dtype=numpy.float64)
+        self.depth = numpy.zeros(0, dtype=numpy.float64)
+        self.xflip = numpy.zeros(0, dtype=numpy.bool_)
+        self.rotation = numpy.zeros(0, dtype=numpy.int32)
+        self.color = numpy.zeros((0, 3), dtype=numpy.float64)
+        self.ratio = numpy.zeros((0, 2), dtype=numpy.float64)
+        self.model_idx = numpy.zeros(0, dtype=numpy.int32)
+
+        # model index 0 is reserved for bundles without a model
+        self._n_models = 1
+        self.model_data = numpy.zeros((1, 6), dtype=numpy.float64)  # w, h, tx1, ty1, tx2, ty2
+
+    def alloc_row(self):
+        if len(self._free_rows) > 0:
+            return self._free_rows.pop()
+
+        if self._n_rows == self._capacity:
+            new_capacity = max(1024, self._capacity * 2)
+            for col in (self.x, self.y, self.scale, self.depth, self.xflip, self.rotation, self.model_idx):
+                col.resize(new_capacity, refcheck=False)
+            self.color.resize((new_capacity, 3), refcheck=False)
+            self.ratio.resize((new_capacity, 2), refcheck=False)
+            self._capacity = new_capacity
+
+        self._n_rows += 1
+        return self._n_rows - 1
+
+    def free_row(self, row):
+        self._free_rows.append(row)
+
+    def n_live_rows(self):
+        return self._n_rows - len(self._free_rows)
+
+    def model_idx_for(self, model):
+        if model is None:
+            return 0
+        elif model._store_idx is None:
+            if self._n_models == len(self.model_data):
+                self.model_data.resize((2 * self._n_models, 6), refcheck=False)
+            model._store_idx = self._n_models
+            self._n_models += 1
+            self.update_model(model)
+
+        return model._store_idx
+
+    def update_model(self, model):
+        self.model_data[model._store_idx] = (model.w, model.h, model.tx1, model.ty1, model.tx2, model.ty2)
+
+
+_STORE = _BundleStore()
+
+
 class ImageBundle:
+    """
+        a handle to one row of the bundle store. update() changes the bundle in place (and returns it), so
+        moving a sprite around doesn't allocate anything.
+    """
+
+    __slots__ = ("_unique_id", "_row", "_model", "_x", "_y", "_layer", "_scale", "_depth", "_xflip",
+                 "_rotation", "_color", "_ratio", "_is_destroyed")
+
+    # held here (rather than only in the module) so it's still reachable from __del__ during shutdown
+    _store = _STORE
 
     @staticmethod
     def new_bundle(layer_id, scale=1, depth=0):
@@ -21,47 +100,70 @@ class ImageBundle:
 
     def __init__(self, model, x, y, layer=0, scale=1, depth=1, xflip=False, rotation=0, color=(1, 1, 1), ratio=(1, 1), uid=None):
         self._unique_id = gen_unique_id() if uid is None else uid
+        self._row = None
+        self._layer = layer  # Note: can't be changed once set
+        self._is_destroyed = False
+
+        row = _STORE.alloc_row()
+        self._row = row
+
         self._model = model
+        _STORE.model_idx[row] = _STORE.model_idx_for(model)
         self._x = x
+        _STORE.x[row] = x
         self._y = y
-        self._layer = layer  # Note: can't be changed once set
+        _STORE.y[row] = y
         self._scale = scale
+        _STORE.scale[row] = scale
         self._depth = depth
+        _STORE.depth[row] = depth
         self._xflip = xflip
+        _STORE.xflip[row] = xflip
         self._rotation = rotation
+        _STORE.rotation[row] = rotation
         self._color = color
+        _STORE.color[row] = (color[0], color[1], color[2])
         self._ratio = ratio
+        _STORE.ratio[row] = (ratio[0], ratio[1])
 
-        self._is_destroyed = False
+    def __del__(self):
+        if self._row is not None:
+            self._store.free_row(self._row)
+            self._row = None
             
     def update(self, new_model=None, new_x=None, new_y=None, new_scale=None, new_depth=None,
                new_xflip=None, new_color=None, new_rotation=None, new_ratio=None):
-                
-        model = self.model() if new_model is None else new_model
-        x = self.x() if new_x is None else new_x
-        y = self.y() if new_y is None else new_y
-        scale = self.scale() if new_scale is None else new_scale
-        depth = self.depth() if new_depth is None else new_depth
-        xflip = self.xflip() if new_xflip is None else new_xflip
-        color = self.color() if new_color is None else new_color
-        rotation = self.rotation() if new_rotation is None else new_rotation
-        ratio = self.ratio() if new_ratio is None else new_ratio
-        
-        if (model == self.model() and 
-                x == self.x() and 
-                y == self.y() and
-                scale == self.scale() and
-                depth == self.depth() and 
-                xflip == self.xflip() and
-                color == self.color() and
-                ratio == self.ratio() and
-                rotation == self.rotation()):
-            return self
-        else:
-            res = ImageBundle(model, x, y, scale=scale, depth=depth, xflip=xflip, rotation=rotation,
-                              layer=self.layer(), color=color, ratio=ratio, uid=self.uid())
-            res._is_destroyed = self._is_destroyed
-            return res
+        row = self._row
+
+        if new_model is not None and new_model != self._model:
+            self._model = new_model
+            _STORE.model_idx[row] = _STORE.model_idx_for(new_model)
+        if new_x is not None and new_x != self._x:
+            self._x = new_x
+            _STORE.x[row] = new_x
+        if new_y is not None and new_y != self._y:
+            self._y = new_y
+            _STORE.y[row] = new_y
+        if new_scale is not None and new_scale != self._scale:
+            self._scale = new_scale
+            _STORE.scale[row] = new_scale
+        if new_depth is not None and new_depth != self._depth:
+            self._depth = new_depth
+            _STORE.depth[row] = new_depth
+        if new_xflip is not None and new_xflip != self._xflip:
+            self._xflip = new_xflip
+            _STORE.xflip[row] = new_xflip
+        if new_color is not None and new_color != self._color:
+            self._color = new_color
+            _STORE.color[row] = (new_color[0], new_color[1], new_color[2])
+        if new_rotation is not None and new_rotation != self._rotation:
+            self._rotation = new_rotation
+            _STORE.rotation[row] = new_rotation
+        if new_ratio is not None and new_ratio != self._ratio:
+            self._ratio = new_ratio
+            _STORE.ratio[row] = (new_ratio[0], new_ratio[1])
+
+        return self
         
     def model(self):
         return self._model
@@ -186,6 +288,112 @@ class ImageBundle:
         indices[6 * i + 4] = 4 * i + 2
         indices[6 * i + 5] = 4 * i + 3
 
+    @staticmethod
+    def gather_attributes(bundles):
+        """
+            returns: float array of shape (len(bundles), 17) with the raw values add_urself reads, one row per bundle:
+                (x, y, model_w, model_h, scale, ratio_x, ratio_y, rotation, xflip, has_model,
+                 tx1, ty1, tx2, ty2, r, g, b)
+        """
+        rows = numpy.fromiter((b._row for b in bundles), dtype=numpy.int64, count=len(bundles))
+        model_idx = _STORE.model_idx[rows]
+        model_data = _STORE.model_data[model_idx]
+
+        res = numpy.empty((len(rows), 17), dtype=numpy.float64)
+        res[:, 0] = _STORE.x[rows]
+        res[:, 1] = _STORE.y[rows]
+        res[:, 2:4] = model_data[:, 0:2]
+        res[:, 4] = _STORE.scale[rows]
+        res[:, 5:7] = _STORE.ratio[rows]
+        res[:, 7] = _STORE.rotation[rows]
+        res[:, 8] = _STORE.xflip[rows]
+        res[:, 9] = model_idx != 0
+        res[:, 10:14] = model_data[:, 2:6]
+        res[:, 14:17] = _STORE.color[rows]
+        return res
+
+    @staticmethod
+    def gather_depths(bundles):
+        rows = numpy.fromiter((b._row for b in bundles), dtype=numpy.int64, count=len(bundles))
+        return _STORE.depth[rows]
+
+    @staticmethod
+    def add_all(bundles, vertices, texts, colors, indices, idxs=None):
+        """
+            writes many bundles into the arrays at once. the result is identical to calling add_urself
+            on each bundle, but the math is done with whole-array operations instead of per-element writes.
+
+            bundles: list of ImageBundles.
+            idxs: sprite "index" for each bundle, or None to use 0, 1, ..., len(bundles) - 1.
+            indices: may be None, in which case the caller is responsible for the index array.
+        """
+        n = len(bundles)
+        if n == 0:
+            return
+
+        if idxs is None:
+            idxs = numpy.arange(n)
+        else:
+            idxs = numpy.asarray(idxs, dtype=numpy.int64)
+
+        attrs = ImageBundle.gather_attributes(bundles)
+        ImageBundle.add_all_from_attributes(attrs, idxs, vertices, texts, colors, indices)
+
+    @staticmethod
+    def add_all_from_attributes(attrs, idxs, vertices, texts, colors, indices):
+        """
+            attrs: float array of shape (n, 17), one row of batch_attributes() per sprite.
+            idxs: int array of shape (n,), the sprite "index" of each row.
+        """
+        x = attrs[:, 0]
+        y = attrs[:, 1]
+
+        # same evaluation order as add_urself, so the floats come out bit-for-bit the same
+        w = attrs[:, 2] * attrs[:, 4] * attrs[:, 5]
+        h = attrs[:, 3] * attrs[:, 4] * attrs[:, 6]
+
+        rotation = attrs[:, 7].astype(numpy.int64)
+        swap = (rotation == 1) | (rotation == 3)
+        w, h = numpy.where(swap, h, w), numpy.where(swap, w, h)
+
+        x_plus_w = x + w
+        y_plus_h = y + h
+
+        vert_rows = vertices.reshape(-1, 8)
+        vert_rows[idxs] = numpy.stack([x, y, x, y_plus_h, x_plus_w, y_plus_h, x_plus_w, y], axis=1)
+
+        if colors is not None:
+            color_rows = colors.reshape(-1, 12)
+            color_rows[idxs] = numpy.tile(attrs[:, 14:17], 4)
+
+        has_model = attrs[:, 9] != 0
+        if numpy.any(has_model):
+            tx1 = attrs[:, 10]
+            ty1 = attrs[:, 11]
+            tx2 = attrs[:, 12]
+            ty2 = attrs[:, 13]
+
+            xflip = attrs[:, 8] != 0
+            left = numpy.where(xflip, tx2, tx1)
+            right = numpy.where(xflip, tx1, tx2)
+
+            corners = numpy.stack([left, ty2, left, ty1, right, ty1, right, ty2], axis=1)
+
+            # each rotation shifts the corners over by one (x, y) pair
+            n_shifts = numpy.maximum(rotation, 0) % 4
+            for shift in range(1, 4):
+                to_shift = n_shifts == shift
+                if numpy.any(to_shift):
+                    corners[to_shift] = numpy.roll(corners[to_shift], -2 * shift, axis=1)
+
+            # sprites without a model don't touch their tex coords
+            text_rows = texts.reshape(-1, 8)
+            text_rows[idxs[has_model]] = corners[has_model]
+
+        if indices is not None:
+            index_rows = indices.reshape(-1, 6)
+            index_rows[idxs] = 4 * idxs[:, None] + _QUAD_INDICES
+
     def __repr__(self):
         return "ImageBundle({}, {}, {}, {}, {}, {}, {}, {}, {}. {})".format(
                 self.model(), self.x(), self.y(), self.layer(),
@@ -207,6 +415,8 @@ class ImageModel:
         self.ty1 = 0
         self.tx2 = 0
         self.ty2 = 0
+
+        self._store_idx = None  # this model's row in the bundle store's model table, once it's used
         
     def rect(self):
         return self._rect
@@ -225,6 +435,9 @@ class ImageModel:
         self.tx2 = self.x + self.w
         self.ty1 = size[1] - (self.y + self.h)
         self.ty2 = size[1] - self.y
+
+        if self._store_idx is not None:
+            _STORE.update_model(self)
         
     def __repr__(self):
         return "ImageModel({}, {}, {}, {})".format(self.x, self.y, self.w, self.h)
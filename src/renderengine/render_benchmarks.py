@@ -0,0 +1,359 @@
+import random
+import time
+import tracemalloc
+
+import numpy
+
+from src.renderengine.img import ImageBundle, ImageModel
+from src.renderengine.engine import _Layer, remove_all_in_place
+
+
+"""
+Benchmarks for the render engine's CPU-side work. These don't need a window or a GL context.
+
+Run with: python -m src.renderengine.render_benchmarks
+"""
+
+
+def gen_random_bundles(n, seed=12345):
+    rand = random.Random(seed)
+    models = []
+    for _ in range(0, 64):
+        model = ImageModel(rand.randint(0, 500), rand.randint(0, 500), rand.randint(1, 64), rand.randint(1, 64))
+        model.set_sheet_size((1024, 1024))
+        models.append(model)
+    models.append(None)
+
+    res = []
+    for _ in range(0, n):
+        res.append(ImageBundle(rand.choice(models),
+                               rand.randint(-200, 2000) + rand.choice([0, 0.5, 0.25]),
+                               rand.randint(-200, 2000),
+                               scale=rand.choice([1, 2, 3, 0.5]),
+                               depth=rand.randint(-100, 100),
+                               xflip=rand.random() < 0.5,
+                               rotation=rand.randint(0, 3),
+                               color=(rand.random(), rand.random(), 1),
+                               ratio=rand.choice([(1, 1), (0.5, 1), (1, 0.75)])))
+    return res
+
+
+def _alloc_arrays(n):
+    return (numpy.zeros(8 * n, dtype=float),
+            numpy.zeros(8 * n, dtype=float),
+            numpy.zeros(12 * n, dtype=float),
+            numpy.zeros(6 * n, dtype=float))
+
+
+def rebuild_serially(bundles, arrays):
+    vertices, tex_coords, colors, indices = arrays
+    for i in range(0, len(bundles)):
+        bundles[i].add_urself(i, vertices, tex_coords, colors, indices)
+
+
+def rebuild_batched(bundles, arrays):
+    vertices, tex_coords, colors, indices = arrays
+    ImageBundle.add_all(bundles, vertices, tex_coords, colors, indices)
+
+
+def _time_it(func, n_trials):
+    best = None
+    for _ in range(0, n_trials):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_layer_rebuild(sizes=(1000, 10000, 50000), n_trials=5):
+    for n in sizes:
+        bundles = gen_random_bundles(n)
+
+        serial_arrays = _alloc_arrays(n)
+        batched_arrays = _alloc_arrays(n)
+
+        serial_time = _time_it(lambda: rebuild_serially(bundles, serial_arrays), n_trials)
+        batched_time = _time_it(lambda: rebuild_batched(bundles, batched_arrays), n_trials)
+
+        for a1, a2 in zip(serial_arrays, batched_arrays):
+            if a1.tobytes() != a2.tobytes():
+                raise ValueError("batched rebuild output differs from serial rebuild (n={})".format(n))
+
+        print("INFO: rebuild n={}:\tserial={:.2f}ms\tbatched={:.2f}ms\t({:.1f}x faster)".format(
+            n, serial_time * 1000, batched_time * 1000, serial_time / max(batched_time, 1e-9)))
+
+
+class _FullRebuildLayer(_Layer):
+    """the way layers worked before incremental patching: every change rewrites the entire layer."""
+
+    def rebuild(self, bundle_lookup):
+        start_time = time.perf_counter()
+
+        for bun_id in self._to_remove:
+            if bun_id in self._image_set:
+                self._image_set.remove(bun_id)
+        if self.sort_sprites:
+            # sorted layers keep everything else in the same relative order when sprites are removed
+            rem_set = set(self._to_remove)
+            self.images = [uid for uid in self.images if uid not in rem_set]
+        else:
+            remove_all_in_place(self.images, self._to_remove)
+        remove_all_in_place(self._to_add, self._to_remove)
+        self._to_remove.clear()
+
+        self.images.extend(self._to_add)
+        self._to_add.clear()
+        self._dirty_sprites.clear()
+
+        if self.sort_sprites:
+            self.images.sort(key=lambda x: -bundle_lookup[x].depth())
+
+        self._ensure_capacity(len(self.images))
+        ImageBundle.add_all([bundle_lookup[uid] for uid in self.images],
+                            self.vertices, self.tex_coords, self.colors, self.indices)
+
+        self.last_rebuild_n_written = len(self.images)
+        self.last_rebuild_time = time.perf_counter() - start_time
+
+    def draw_order(self):
+        return list(self.images)
+
+    def slot_lookup(self):
+        return {self.images[i]: i for i in range(0, len(self.images))}
+
+
+def _random_layer_ops(layer_list, bundle_lookup, rand, n_updates, n_adds, n_removes, move_depth=True):
+    """applies the same random changes to every layer in layer_list."""
+    live = list(bundle_lookup.keys())
+
+    for _ in range(0, n_updates):
+        uid = rand.choice(live)
+        bun = bundle_lookup[uid]
+        new_depth = bun.depth() + rand.randint(-2, 2) if move_depth else None
+        bundle_lookup[uid] = bun.update(new_x=bun.x() + rand.randint(-2, 2), new_depth=new_depth)
+        for layer in layer_list:
+            layer.update(uid)
+
+    for _ in range(0, n_removes):
+        uid = rand.choice(live)
+        for layer in layer_list:
+            layer.remove(uid)
+
+    for bun in gen_random_bundles(n_adds, seed=rand.randint(0, 100000)):
+        bundle_lookup[bun.uid()] = bun
+        for layer in layer_list:
+            layer.update(bun.uid())
+
+
+def _check_layers_match(incremental, full, bundle_lookup):
+    inc_order = incremental.draw_order()
+    full_order = full.draw_order()
+
+    if inc_order != full_order:
+        raise ValueError("layers have different sprite orders")
+
+    n = len(inc_order)
+    inc_slots = [incremental._slots[uid] for uid in inc_order]
+    full_slots = full.slot_lookup()
+    full_slots = [full_slots[uid] for uid in inc_order]
+
+    # sprites without a model never write their tex coords, so those are left out of the comparison
+    has_model = numpy.array([bundle_lookup[uid].model() is not None for uid in inc_order], dtype=bool)
+
+    for arr_name, stride in (("vertices", 8), ("tex_coords", 8), ("colors", 12)):
+        inc_rows = getattr(incremental, arr_name).reshape(-1, stride)[inc_slots]
+        full_rows = getattr(full, arr_name).reshape(-1, stride)[full_slots]
+        if arr_name == "tex_coords" and n > 0:
+            inc_rows = inc_rows[has_model]
+            full_rows = full_rows[has_model]
+        if inc_rows.tobytes() != full_rows.tobytes():
+            raise ValueError("layers have different {}".format(arr_name))
+
+    # the indices have to point at each sprite's slot, in draw order
+    expected_indices = 4 * numpy.array(inc_slots, dtype=float)[:, None] + numpy.array([0, 1, 2, 0, 2, 3])
+    if incremental.indices[:6 * n].tobytes() != expected_indices.tobytes():
+        raise ValueError("incremental layer has bad indices")
+
+
+def check_incremental_layer_matches_full_rebuild(n_frames=200, seed=555):
+    rand = random.Random(seed)
+    for sort_sprites in (False, True):
+        incremental = _Layer("incremental", 0, 0, sort_sprites, True)
+        full = _FullRebuildLayer("full", 0, 0, sort_sprites, True)
+
+        bundle_lookup = {}
+        _random_layer_ops([incremental, full], bundle_lookup, rand, 0, 500, 0)
+
+        for _ in range(0, n_frames):
+            _random_layer_ops([incremental, full], bundle_lookup, rand,
+                              rand.randint(0, 60), rand.randint(0, 5), rand.randint(0, 5))
+            incremental.rebuild(bundle_lookup)
+            full.rebuild(bundle_lookup)
+            _check_layers_match(incremental, full, bundle_lookup)
+
+    print("INFO: incremental layer rebuilds match full rebuilds")
+
+
+def check_ties_keep_stable_order(n_filler=5000):
+    """
+        sprites that end up tied on depth should keep their old relative order (like a stable sort), no matter
+        whether the frame gets sorted incrementally or all at once.
+    """
+    for n_churn in (0, n_filler):
+        bundle_lookup = {}
+        layer = _Layer("ties", 0, 0, True, True)
+        ref = _FullRebuildLayer("ties_ref", 0, 0, True, True)
+
+        # C(7), A(5), B(5), plus lots of sprites further back (that can be churned to force a full resort)
+        named = {}
+        for (name, depth) in (("C", 7), ("A", 5), ("B", 5), ("D", 3), ("E", 3)):
+            named[name] = ImageBundle(None, 0, 0, depth=depth)
+        filler = [ImageBundle(None, 0, 0, depth=-50) for _ in range(0, n_filler)]
+        for bun in list(named.values()) + filler:
+            bundle_lookup[bun.uid()] = bun
+            layer.update(bun.uid())
+            ref.update(bun.uid())
+        layer.rebuild(bundle_lookup)
+        ref.rebuild(bundle_lookup)
+
+        # C moves back and E moves forward, and both end up tied with A and B
+        for (name, depth) in (("C", 5), ("E", 5)):
+            bundle_lookup[named[name].uid()] = bundle_lookup[named[name].uid()].update(new_depth=depth)
+            layer.update(named[name].uid())
+            ref.update(named[name].uid())
+        for bun in filler[:n_churn]:
+            bundle_lookup[bun.uid()] = bundle_lookup[bun.uid()].update(new_depth=-60)
+            layer.update(bun.uid())
+            ref.update(bun.uid())
+
+        layer.rebuild(bundle_lookup)
+        ref.rebuild(bundle_lookup)
+
+        names = {bun.uid(): name for (name, bun) in named.items()}
+        actual = [names[uid] for uid in layer.draw_order() if uid in names]
+        expected = [names[uid] for uid in ref.draw_order() if uid in names]
+        if actual != expected or expected != ["C", "A", "B", "E", "D"]:
+            raise ValueError("tied sprites out of order (churn={}): expected {}, got {}".format(
+                n_churn, ["C", "A", "B", "E", "D"], actual))
+
+    print("INFO: tied sprites keep their order with both incremental and full sorts")
+
+
+def bench_depth_churn(n=10000, churn_rates=(0.001, 0.01, 0.1, 0.5), n_frames=10):
+    for churn in churn_rates:
+        res = []
+        for layer_type in (_FullRebuildLayer, _Layer):
+            rand = random.Random(n)
+            layer = layer_type("bench", 0, 0, True, True)
+            bundle_lookup = {}
+            _random_layer_ops([layer], bundle_lookup, rand, 0, n, 0)
+            layer.rebuild(bundle_lookup)
+
+            total = 0
+            for _ in range(0, n_frames):
+                # entities shuffling up and down a little
+                _random_layer_ops([layer], bundle_lookup, rand, int(n * churn), 0, 0, move_depth=True)
+                layer.rebuild(bundle_lookup)
+                total += layer.last_rebuild_time
+            res.append(total / n_frames)
+
+        print("INFO: sorted rebuild n={}, depth churn={}:\tfull sort={:.2f}ms\tincremental={:.3f}ms".format(
+            n, churn, res[0] * 1000, res[1] * 1000))
+
+
+def bench_incremental_rebuild(sizes=(1000, 10000, 50000), n_frames=20, n_dirty_per_frame=1):
+    for sort_sprites in (False, True):
+        for n in sizes:
+            res = []
+            for layer_type in (_FullRebuildLayer, _Layer):
+                rand = random.Random(n)
+                layer = layer_type("bench", 0, 0, sort_sprites, True)
+                bundle_lookup = {}
+                _random_layer_ops([layer], bundle_lookup, rand, 0, n, 0)
+                layer.rebuild(bundle_lookup)
+
+                total = 0
+                for _ in range(0, n_frames):
+                    # like a single skeleton walking around
+                    _random_layer_ops([layer], bundle_lookup, rand, n_dirty_per_frame, 0, 0, move_depth=False)
+                    layer.rebuild(bundle_lookup)
+                    total += layer.last_rebuild_time
+                res.append(total / n_frames)
+
+            print("INFO: per-frame rebuild n={}, sorted={}:\tfull={:.2f}ms\tincremental={:.3f}ms".format(
+                n, sort_sprites, res[0] * 1000, res[1] * 1000))
+
+
+class _CopyOnUpdateBundle(ImageBundle):
+    """the way bundles worked before the bundle store: every change allocates a brand-new bundle."""
+
+    __slots__ = ()
+
+    def update(self, new_model=None, new_x=None, new_y=None, new_scale=None, new_depth=None,
+               new_xflip=None, new_color=None, new_rotation=None, new_ratio=None):
+        return _CopyOnUpdateBundle(self.model() if new_model is None else new_model,
+                                   self.x() if new_x is None else new_x,
+                                   self.y() if new_y is None else new_y,
+                                   layer=self.layer(),
+                                   scale=self.scale() if new_scale is None else new_scale,
+                                   depth=self.depth() if new_depth is None else new_depth,
+                                   xflip=self.xflip() if new_xflip is None else new_xflip,
+                                   rotation=self.rotation() if new_rotation is None else new_rotation,
+                                   color=self.color() if new_color is None else new_color,
+                                   ratio=self.ratio() if new_ratio is None else new_ratio,
+                                   uid=self.uid())
+
+
+def _text_menu_frame(bundles, frame_idx):
+    # a menu full of text that's scrolling, with the selected option's color pulsing
+    for i in range(0, len(bundles)):
+        color = (1, 1, 1) if (i // 40) != frame_idx % 50 else (1, 0.5 + (frame_idx % 10) / 20, 0.5)
+        bundles[i] = bundles[i].update(new_y=bundles[i].y() + 1, new_color=color)
+
+
+def _crowded_zone_frame(bundles, frame_idx):
+    # entity sprites and their shadows walking around and animating
+    for i in range(0, len(bundles)):
+        bun = bundles[i]
+        x = bun.x() + (1 if (i + frame_idx) % 3 == 0 else 0)
+        y = bun.y() + (1 if (i + frame_idx) % 5 == 0 else 0)
+        bundles[i] = bun.update(new_x=x, new_y=y, new_depth=-y, new_xflip=(frame_idx // 30) % 2 == 0)
+
+
+def bench_bundle_allocations(n_frames=60):
+    models = [b.model() for b in gen_random_bundles(100) if b.model() is not None]
+    rand = random.Random(4)
+
+    scenarios = [
+        ("text menu", _text_menu_frame, 2000),
+        ("crowded zone", _crowded_zone_frame, 800)
+    ]
+
+    for (name, frame_func, n_bundles) in scenarios:
+        for bundle_type in (_CopyOnUpdateBundle, ImageBundle):
+            bundles = [bundle_type(rand.choice(models), rand.randint(0, 400), rand.randint(0, 300))
+                       for _ in range(0, n_bundles)]
+
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+
+            for frame_idx in range(0, n_frames):
+                frame_func(bundles, frame_idx)
+
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print("INFO: {}, {} bundles, {}:\t{:.2f}ms per frame\tpeak allocated={:.1f}KB".format(
+                name, n_bundles, bundle_type.__name__, elapsed * 1000 / n_frames, (peak - baseline) / 1024))
+
+
+if __name__ == "__main__":
+    bench_layer_rebuild()
+    check_incremental_layer_matches_full_rebuild()
+    check_ties_keep_stable_order()
+    bench_incremental_rebuild()
+    bench_depth_churn()
+    bench_bundle_allocations()
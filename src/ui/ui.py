@@ -1630,7 +1630,6 @@ class TextImage:
             self.scale = new_scale if new_scale is not None else self.scale
             self._build_images()
 
-        new_imgs = []
         for letter, idx in zip(self._letter_images, self._letter_image_indexes):
             letter_new_x = letter.x() + dx
             letter_new_y = letter.y() + dy
@@ -1638,10 +1637,10 @@ class TextImage:
                 color = self.custom_colors[idx]
             else:
                 color = self.color
-            new_imgs.append(letter.update(new_x=letter_new_x, new_y=letter_new_y,
-                                          new_depth=new_depth, new_color=color))
 
-        self._letter_images = new_imgs
+            # bundles update in place, so there's no need to rebuild the list
+            letter.update(new_x=letter_new_x, new_y=letter_new_y, new_depth=new_depth, new_color=color)
+
         self.x = new_x if new_x is not None else self.x
         self.y = new_y if new_y is not None else self.y
         self.actual_size = self._recalc_size()
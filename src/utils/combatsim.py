@@ -1,146 +1,313 @@
-import random
-from src.utils.util import Utils
+import os
+import json
+import argparse
+import multiprocessing
+import concurrent.futures
 
-ATTACK_RANGE = [1, 2, 3, 4, 5, 6]
-DEFEND_RANGE = [1, 2, 3, 4, 5, 6]
+import numpy
 
 
-class _Combatant:
+"""
+Monte Carlo simulator for fights between the player and groups of enemies, for balancing. Thousands of fights are
+simulated at once as numpy arrays, using the same turn order, energy rules, and dice as the actual game (see
+World.update_all and gameengine.determine_damage_dealt), and with the player and enemies built from their real
+stats. Status effects, items, and positioning are ignored, everyone just trades unarmed attacks.
 
-    def __init__(self, name, ATT, DEF, HP, SPEED):
+Run with: python -m src.utils.combatsim --fights 2000 --out combatsim_report.json
+"""
+
+MAX_ENERGY = 8  # same as ActorState.max_energy
+
+# bonus (ATT, DEF, VIT) from the player's gear
+DEFAULT_GEAR_GRID = [(att, defense, vit) for att in (0, 2, 4, 6) for defense in (0, 2, 4) for vit in (0, 10)]
+
+DEFAULT_GROUP_SIZES = (1, 2, 3)
+
+
+class Combatant:
+
+    def __init__(self, name, att, defense, hp, speed, start_energies=(0,)):
+        """start_energies: the energy each fight starts with is picked at random from these."""
         self.name = name
-        self.ATT = ATT
-        self.DEF = DEF
-        self.HP = HP
-        self.SPEED = SPEED
-
-        self.energy = 0
-        self.max_energy = 8
-
-    def copy(self):
-        return _Combatant(self.name, self.ATT, self.DEF, self.HP, self.SPEED)
-
-
-class _Fight:
-
-    def __init__(self, player, fight_seq=None):
-        self.player = player
-
-        # a sequence of group-fights for player
-        # a list of lists of combatants
-        self.fight_seq = []
-
-        if fight_seq is not None:
-            for f in Utils.listify(fight_seq):
-                self.add(f)
-
-    def add(self, enemy_group):
-        self.fight_seq.append(Utils.listify(enemy_group))
-        return self
-
-    def copy(self):
-        res = _Fight(self.player.copy(), None)
-        for group in self.fight_seq:
-            new_group = [c.copy() for c in group]
-            res.add(new_group)
-        return res
-
-    def active_enemies(self):
-        for enemy_group in self.fight_seq:
-            alive = [e for e in enemy_group if e.HP > 0]
-            if len(alive) > 0:
-                return alive
-        return []
-
-    def all_enemies(self, alive_only=False):
-        for enemy_group in self.fight_seq:
-            for e in enemy_group:
-                if not alive_only or e.HP > 0:
-                    yield e
-
-
-def do_attack(attacker, defender, turn_num, silent=False):
-    atts = [random.choice(ATTACK_RANGE) for _ in range(0, attacker.ATT)]
-    defs = [random.choice(DEFEND_RANGE) for _ in range(0, defender.DEF)]
-    atts.sort(reverse=True)
-
-    for d in defs:
-        for i in range(0, len(atts)):
-            if atts[i] <= d:
-                atts.pop(i)
-                break
-
-    att_value = len(atts)
-    defender.HP -= att_value
-    if not silent:
-        print("{}: {} dealt {} damage to {}, bringing it's health to {}".format(
-              turn_num, attacker.name, att_value, defender.name, defender.HP))
-
-
-def do_fight(fight, silent=False):
-    i = 0
-    player = fight.player
-    while True:
-        active_enemies = fight.active_enemies()
-        if len(active_enemies) == 0:
-            return i
-
-        player.energy += player.SPEED
-        if player.energy >= player.max_energy:
-            to_attack = active_enemies[0]
-            player.energy = player.energy % player.max_energy
-            do_attack(player, to_attack, i, silent=silent)
-
-        for enemy in active_enemies:
-            enemy.energy += enemy.SPEED
-            if enemy.energy >= enemy.max_energy:
-                enemy.energy = enemy.energy % enemy.max_energy
-                do_attack(enemy, player, i, silent=silent)
-
-        i += 1
-
-
-def do_many_fights(fight, n):
-    # stats for when player wins
-    player_wins = 0
-    player_hp_total = 0
-
-    # stats for when enemies win
-    enemies_remaining_total = 0
-    enemy_hp_total = 0
-
-    for _ in range(0, n):
-        fight_copy = fight.copy()
-        do_fight(fight_copy, silent=True)
-        if fight_copy.player.HP > 0:
-            player_wins += 1
-            player_hp_total += fight_copy.player.HP
-        else:
-            for alive_enemy in fight_copy.all_enemies(alive_only=True):
-                enemies_remaining_total += 1
-                enemy_hp_total += alive_enemy.HP
-
-    pcnt_player_win = player_wins / n
-    avg_player_hp = 0 if player_wins == 0 else player_hp_total / player_wins
-    avg_enemy_hp = 0 if player_wins == n else enemy_hp_total / (n - player_wins)
-    avg_enemies_remaining = 0 if player_wins == n else enemies_remaining_total / (n - player_wins)
-
-    print("Results of {} fights:".format(n))
-    print("  Player won {:.1f}% of fights with an average {:.1f} HP remaining.".format(
-        pcnt_player_win*100, avg_player_hp
-    ))
-    print("  Enemies won {:.1f}% of fights with an average of {} remaining and {:.1f} total HP remaining.\n".format(
-        (1-pcnt_player_win)*100, avg_enemies_remaining, avg_enemy_hp
-    ))
+        self.att = att
+        self.defense = defense
+        self.hp = hp
+        self.speed = speed
+        self.start_energies = tuple(start_energies)
 
-    return pcnt_player_win
+    def __repr__(self):
+        return "{}(ATT={}, DEF={}, HP={}, SPD={})".format(self.name, self.att, self.defense, self.hp, self.speed)
 
+    @staticmethod
+    def from_stats(name, stat_provider, start_energies=(0,)):
+        """builds a combatant the way ActorState reads its stats, for an unarmed attack."""
+        from src.game.stats import StatTypes
 
-BASE_PLAYER = _Combatant("Player", 3, 1, 20, 4)
-ENEMY_1 = _Combatant("Enemy", 2, 2, 6, 2)
+        def bound(val, lower, upper):
+            return max(lower, min(upper, val))
+
+        return Combatant(name,
+                         max(0, stat_provider.stat_value_with_item(StatTypes.ATT, None)),
+                         max(0, stat_provider.stat_value(StatTypes.DEF)),
+                         bound(stat_provider.stat_value(StatTypes.VIT), 1, 999),
+                         bound(stat_provider.stat_value(StatTypes.SPEED), 1, MAX_ENERGY),
+                         start_energies=start_energies)
 
-if __name__ == "__main__":
 
-    fight = _Fight(BASE_PLAYER.copy(), fight_seq=[[ENEMY_1.copy(), ENEMY_1.copy(), ENEMY_1.copy()]])
+def player_combatant(gear=(0, 0, 0)):
+    """gear: bonus (ATT, DEF, VIT) on top of stats.default_player_stats()."""
+    import src.game.stats as stats
+    from src.game.stats import StatTypes
 
-    do_many_fights(fight, 100)
+    base = stats.default_player_stats()
+    lookup = stats.BasicStatLookup(dict(base.lookup))
+    for (stat_type, bonus) in zip((StatTypes.ATT, StatTypes.DEF, StatTypes.VIT), gear):
+        lookup.set_stat_value(stat_type, lookup.stat_value(stat_type) + bonus)
+
+    return Combatant.from_stats("Player", lookup)
+
+
+def enemy_combatant(template):
+    """template: an EnemyTemplate"""
+    # enemies start with either no energy or half of it (see EnemyFactory.get_state)
+    return Combatant.from_stats(template.get_name(), template.get_stats(), start_energies=(0, MAX_ENERGY // 2))
+
+
+def enemy_groups_for_level(level, group_sizes=DEFAULT_GROUP_SIZES):
+    """returns: list of lists of Combatants, one group per random-spawn enemy type and group size."""
+    import src.game.enemies as enemies
+
+    res = []
+    for template in enemies.get_all_rand_spawn_templates(level=level):
+        for size in group_sizes:
+            res.append([enemy_combatant(template) for _ in range(0, size)])
+    return res
+
+
+def roll_damage(att, defense, rng):
+    """
+        the same dice as gameengine.determine_damage_dealt, for a bunch of attacks at once.
+
+        att, defense: int arrays of the same length.
+        rng: numpy RandomState
+        returns: int array of the damage dealt by each attack.
+    """
+    damage = att.copy()
+    if len(att) == 0 or att.max() <= 0:
+        return damage
+
+    att_rolls = rng.randint(1, 7, size=(len(att), att.max()))
+    att_rolls[numpy.arange(att.max())[None, :] >= att[:, None]] = 0
+
+    max_def = defense.max()
+    def_rolls = rng.randint(1, 5, size=(len(defense), max(1, max_def)))
+    def_rolls[numpy.arange(max(1, max_def))[None, :] >= defense[:, None]] = 0
+
+    # going up through the die values, the attack dice showing each value become blockable, and then
+    # each defense die showing that value blocks one of them (see damagetables for why that's the same thing).
+    blockable = numpy.zeros(len(att), dtype=att.dtype)
+    for v in range(1, 5):
+        blockable += (att_rolls == v).sum(axis=1)
+        blocked = numpy.minimum(blockable, (def_rolls == v).sum(axis=1))
+        blockable -= blocked
+        damage -= blocked
+
+    return damage
+
+
+class FightResults:
+    """
+        player_hp: the player's HP at the end of each fight (<= 0 means they lost).
+        enemies_left: number of enemies still alive at the end of each fight.
+        rounds: number of rounds each fight lasted.
+    """
+
+    def __init__(self, player_hp, enemies_left, rounds):
+        self.player_hp = player_hp
+        self.enemies_left = enemies_left
+        self.rounds = rounds
+
+    def n_fights(self):
+        return len(self.player_hp)
+
+    def wins(self):
+        return (self.player_hp > 0) & (self.enemies_left == 0)
+
+    def win_rate(self):
+        return float(self.wins().mean())
+
+    def avg_hp_left_on_win(self):
+        wins = self.wins()
+        return float(self.player_hp[wins].mean()) if wins.any() else 0.0
+
+    def avg_rounds(self):
+        return float(self.rounds.mean())
+
+    def summary(self):
+        return {"win_rate": round(self.win_rate(), 4),
+                "avg_hp_left_on_win": round(self.avg_hp_left_on_win(), 2),
+                "avg_rounds": round(self.avg_rounds(), 2)}
+
+
+def simulate_fights(player, enemy_groups, n, rng, max_rounds=1000):
+    """
+        the player fights each group of enemies n times. each round, the player (and then each living enemy)
+        gains energy, and if it's full, attacks. the player always attacks the first living enemy in the group.
+
+        player: Combatant
+        enemy_groups: list of lists of Combatants.
+        rng: numpy RandomState
+        returns: list of FightResults, one per group.
+    """
+    n_total = n * len(enemy_groups)
+    group_size = max(len(group) for group in enemy_groups)
+
+    # groups smaller than the biggest one get padded with enemies that are already dead
+    def per_enemy(func, pad):
+        res = numpy.full((len(enemy_groups), group_size), pad, dtype=numpy.int64)
+        for i in range(0, len(enemy_groups)):
+            for j in range(0, len(enemy_groups[i])):
+                res[i, j] = func(enemy_groups[i][j])
+        return numpy.repeat(res, n, axis=0)
+
+    e_hp = per_enemy(lambda e: e.hp, 0)
+    e_att = per_enemy(lambda e: e.att, 0)
+    e_def = per_enemy(lambda e: e.defense, 0)
+    e_speed = per_enemy(lambda e: e.speed, 0)
+    e_energy = numpy.zeros((n_total, group_size), dtype=numpy.int64)
+    for i in range(0, len(enemy_groups)):
+        for j in range(0, len(enemy_groups[i])):
+            e_energy[i * n:(i + 1) * n, j] = rng.choice(enemy_groups[i][j].start_energies, size=n)
+
+    p_hp = numpy.full(n_total, player.hp, dtype=numpy.int64)
+    p_energy = rng.choice(player.start_energies, size=n_total).astype(numpy.int64)
+    rounds = numpy.zeros(n_total, dtype=numpy.int64)
+
+    all_fights = numpy.arange(0, n_total)
+
+    for _ in range(0, max_rounds):
+        active = (p_hp > 0) & (e_hp > 0).any(axis=1)
+        if not active.any():
+            break
+        rounds[active] += 1
+
+        # the player goes first
+        p_energy[active] += player.speed
+        p_acts = active & (p_energy >= MAX_ENERGY)
+        p_energy[p_acts] %= MAX_ENERGY
+
+        attacking = all_fights[p_acts]
+        if len(attacking) > 0:
+            target = (e_hp[attacking] > 0).argmax(axis=1)
+            dmg = roll_damage(numpy.full(len(attacking), player.att), e_def[attacking, target], rng)
+            e_hp[attacking, target] -= dmg
+
+        # then every enemy that's still alive
+        e_active = active[:, None] & (e_hp > 0)
+        e_energy[e_active] += e_speed[e_active]
+        e_acts = e_active & (e_energy >= MAX_ENERGY)
+        e_energy[e_acts] %= MAX_ENERGY
+
+        fight_idxs, enemy_idxs = numpy.nonzero(e_acts)
+        if len(fight_idxs) > 0:
+            dmg = roll_damage(e_att[fight_idxs, enemy_idxs], numpy.full(len(fight_idxs), player.defense), rng)
+            p_hp -= numpy.bincount(fight_idxs, weights=dmg, minlength=n_total).astype(numpy.int64)
+
+    enemies_left = (e_hp > 0).sum(axis=1)
+    return [FightResults(p_hp[i * n:(i + 1) * n], enemies_left[i * n:(i + 1) * n], rounds[i * n:(i + 1) * n])
+            for i in range(0, len(enemy_groups))]
+
+
+def do_many_fights(player, enemy_group, n, seed=None):
+    """simulates n fights between the player and a single group of enemies, and prints the results."""
+    res = simulate_fights(player, [enemy_group], n, numpy.random.RandomState(seed))[0]
+
+    print("Results of {} fights between {} and [{}]:".format(n, player, ", ".join(str(e) for e in enemy_group)))
+    print("  Player won {:.1f}% of fights with an average {:.1f} HP remaining.".format(
+        res.win_rate() * 100, res.avg_hp_left_on_win()))
+    print("  Fights lasted an average of {:.1f} rounds.\n".format(res.avg_rounds()))
+
+    return res.win_rate()
+
+
+def _group_name(group):
+    return "{}x {}".format(len(group), group[0].name)
+
+
+def _sweep_task(args):
+    """returns: (level, gear, map of group name -> summary)"""
+    level, gear, player, enemy_groups, n, seed = args
+    rng = numpy.random.RandomState(seed)
+    results = simulate_fights(player, enemy_groups, n, rng)
+    return level, gear, {_group_name(enemy_groups[i]): results[i].summary() for i in range(0, len(enemy_groups))}
+
+
+def sweep(levels=range(0, 16), gear_grid=DEFAULT_GEAR_GRID, n_fights=2000, group_sizes=DEFAULT_GROUP_SIZES,
+          seed=0, n_workers=None):
+    """
+        fights every enemy group at each level with every set of player gear, spread across all the CPU's cores.
+
+        n_workers: number of worker processes (defaults to one per core). 1 means run everything in this process.
+        returns: json blob of level -> gear -> results (overall, and for each enemy group).
+    """
+    tasks = []
+    for level in levels:
+        enemy_groups = enemy_groups_for_level(level, group_sizes=group_sizes)
+        if len(enemy_groups) == 0:
+            continue
+        for gear_idx in range(0, len(gear_grid)):
+            gear = gear_grid[gear_idx]
+            task_seed = [seed, level, gear_idx]
+            tasks.append((level, gear, player_combatant(gear), enemy_groups, n_fights, task_seed))
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers <= 1:
+        task_results = [_sweep_task(task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers,
+                                                    mp_context=multiprocessing.get_context("spawn")) as executor:
+            task_results = list(executor.map(_sweep_task, tasks))
+
+    report = {}
+    for (level, gear, group_results) in task_results:
+        groups = list(group_results.values())
+        worst = min(group_results, key=lambda name: group_results[name]["win_rate"])
+        report.setdefault(str(level), {})["ATT+{} DEF+{} VIT+{}".format(*gear)] = {
+            "win_rate": round(sum(g["win_rate"] for g in groups) / len(groups), 4),
+            "avg_hp_left_on_win": round(sum(g["avg_hp_left_on_win"] for g in groups) / len(groups), 2),
+            "worst_group": worst,
+            "worst_win_rate": group_results[worst]["win_rate"],
+            "groups": group_results
+        }
+    return report
+
+
+def print_report(report):
+    for level in report:
+        print("INFO: level {}".format(level))
+        for gear in report[level]:
+            res = report[level][gear]
+            print("INFO:\t{:<22} win={:>5.1f}%\thp_left={:>5.1f}\tworst={} ({:.1f}%)".format(
+                gear, res["win_rate"] * 100, res["avg_hp_left_on_win"], res["worst_group"],
+                res["worst_win_rate"] * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates lots of fights between the player and enemies.")
+    parser.add_argument("--fights", type=int, default=2000, help="number of fights per enemy group and gear")
+    parser.add_argument("--levels", type=str, default=None, help="comma-separated zone levels (defaults to 0-15)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (defaults to one per core)")
+    parser.add_argument("--out", type=str, default=None, help="where to write the json report")
+    args = parser.parse_args()
+
+    level_list = range(0, 16) if args.levels is None else [int(lvl) for lvl in args.levels.split(",")]
+    json_report = sweep(levels=level_list, n_fights=args.fights, seed=args.seed, n_workers=args.workers)
+    print_report(json_report)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(json_report, f, indent=2, sort_keys=True)
+        print("INFO: wrote report to {}".format(args.out))
@@ -1,17 +1,40 @@
 import cProfile
 import pstats
+import collections
+import time
+import json
+import csv
+import pathlib
 
 _instance = None
+_frame_timer = None
+_worldgen_stats = None
 
 
 def get_instance():
     global _instance
     if _instance is None:
         _instance = Profiler()
-    
+
     return _instance
 
 
+def get_frame_timer():
+    global _frame_timer
+    if _frame_timer is None:
+        _frame_timer = FrameTimer()
+
+    return _frame_timer
+
+
+def get_worldgen_stats():
+    global _worldgen_stats
+    if _worldgen_stats is None:
+        _worldgen_stats = StatsRecorder()
+
+    return _worldgen_stats
+
+
 class Profiler:
 
     def __init__(self):
@@ -34,3 +57,271 @@ class Profiler:
             print("INFO\tstarted profiling...")
             self.pr.clear()
             self.pr.enable()
+
+
+class _NullSection:
+    """what FrameTimer hands out while it's disabled, so timing costs next to nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _Section:
+
+    __slots__ = ("_timer", "_name", "_start")
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._timer.add_time(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class FrameTimer:
+    """
+        keeps per-frame timings of named sections of the game loop, over a rolling window of frames.
+
+        usage:
+            with timer.section("world.update_all"):
+                world.update_all()
+
+        or, for long stretches of code:
+            timer.lap("events")  # adds the time since the frame started (or since the last lap)
+    """
+
+    TOTAL = "total"
+
+    # upper edges of the histogram buckets, in milliseconds
+    HISTOGRAM_EDGES_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16.7, 33.3, 66.7, float("inf"))
+
+    def __init__(self, history_length=600):
+        self._enabled = False
+        self._history = collections.deque(maxlen=history_length)  # list of (frame_idx, {name -> secs})
+        self._section_names = []  # in the order they were first seen
+        self._current = {}
+        self._frame_idx = 0
+        self._frame_start = None
+        self._last_lap = None
+
+    def is_enabled(self):
+        return self._enabled
+
+    def set_enabled(self, val):
+        if val and not self._enabled:
+            print("INFO: started frame timer")
+        elif not val and self._enabled:
+            print("INFO: stopped frame timer")
+        self._enabled = val
+        self._current = {}
+        self._frame_start = None
+        self._last_lap = None
+
+    def toggle(self):
+        self.set_enabled(not self._enabled)
+
+    def section(self, name):
+        if not self._enabled:
+            return _NULL_SECTION
+        else:
+            return _Section(self, name)
+
+    def add_time(self, name, secs):
+        if not self._enabled:
+            return
+        if name not in self._current:
+            if name not in self._section_names:
+                self._section_names.append(name)
+            self._current[name] = secs
+        else:
+            self._current[name] += secs
+
+    def lap(self, name):
+        if not self._enabled or self._last_lap is None:
+            return
+        cur_time = time.perf_counter()
+        self.add_time(name, cur_time - self._last_lap)
+        self._last_lap = cur_time
+
+    def start_frame(self):
+        if self._enabled:
+            self._frame_start = time.perf_counter()
+            self._last_lap = self._frame_start
+
+    def end_frame(self):
+        if not self._enabled:
+            return
+        if self._frame_start is not None:
+            self.add_time(FrameTimer.TOTAL, time.perf_counter() - self._frame_start)
+            self._frame_start = None
+            self._last_lap = None
+
+        self._history.append((self._frame_idx, self._current))
+        self._current = {}
+        self._frame_idx += 1
+
+    def num_frames(self):
+        return len(self._history)
+
+    def section_names(self):
+        return list(self._section_names)
+
+    def samples(self, name):
+        """returns: list of the section's time (in seconds) for each frame in the window."""
+        return [times.get(name, 0) for (_, times) in self._history]
+
+    def histogram(self, name):
+        """returns: list of frame counts, one per bucket in HISTOGRAM_EDGES_MS."""
+        res = [0] * len(FrameTimer.HISTOGRAM_EDGES_MS)
+        for secs in self.samples(name):
+            ms = secs * 1000
+            for i in range(0, len(FrameTimer.HISTOGRAM_EDGES_MS)):
+                if ms <= FrameTimer.HISTOGRAM_EDGES_MS[i]:
+                    res[i] += 1
+                    break
+        return res
+
+    def summary(self, name):
+        """returns: map of stat name -> milliseconds"""
+        samples = sorted(self.samples(name))
+        if len(samples) == 0:
+            return {"mean": 0, "p50": 0, "p95": 0, "max": 0}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {"mean": 1000 * sum(samples) / len(samples),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": samples[-1] * 1000}
+
+    def to_json(self):
+        return {
+            "n_frames": self.num_frames(),
+            "histogram_edges_ms": [str(e) for e in FrameTimer.HISTOGRAM_EDGES_MS],
+            "sections": {name: {"summary_ms": self.summary(name),
+                                "histogram": self.histogram(name)} for name in self._section_names}
+        }
+
+    def export(self, path):
+        """writes the current window to disk. the format depends on the file extension (.csv or .json)."""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.suffix == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame"] + self._section_names)
+                for (frame_idx, times) in self._history:
+                    writer.writerow([frame_idx] + ["{:.4f}".format(times.get(name, 0) * 1000)
+                                                   for name in self._section_names])
+        else:
+            with open(path, "w") as f:
+                json.dump(self.to_json(), f, indent=2)
+
+        print("INFO: wrote frame times for {} frames to {}".format(self.num_frames(), path))
+
+
+class StatsRecorder:
+    """
+        accumulates the time spent in named sections of code, and named counters, until it's reset.
+        like FrameTimer, it does (almost) nothing while it's disabled.
+    """
+
+    def __init__(self):
+        self._enabled = False
+        self._times = {}   # name -> secs
+        self._counts = {}  # name -> int
+
+    def is_enabled(self):
+        return self._enabled
+
+    def set_enabled(self, val):
+        self._enabled = val
+
+    def section(self, name):
+        if not self._enabled:
+            return _NULL_SECTION
+        else:
+            return _Section(self, name)
+
+    def add_time(self, name, secs):
+        if self._enabled:
+            self._times[name] = self._times.get(name, 0) + secs
+
+    def count(self, name, n=1):
+        if self._enabled:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def times(self):
+        """returns: map of section name -> secs"""
+        return dict(self._times)
+
+    def counts(self):
+        """returns: map of counter name -> int"""
+        return dict(self._counts)
+
+    def reset(self):
+        self._times = {}
+        self._counts = {}
+
+
+class FrameTimerOverlay:
+    """draws a FrameTimer's stats on top of the screen."""
+
+    def __init__(self, timer, refresh_rate=30):
+        self.timer = timer
+        self.refresh_rate = refresh_rate
+        self._text_img = None
+        self._tick_count = 0
+
+    def _build_text(self):
+        lines = ["{:<24} {:>6} {:>6}".format("section", "avg", "p95")]
+        for name in self.timer.section_names():
+            stats = self.timer.summary(name)
+            lines.append("{:<24} {:>6.2f} {:>6.2f}".format(name[:24], stats["mean"], stats["p95"]))
+        return "\n".join(lines)
+
+    def update(self):
+        import src.game.spriteref as spriteref
+        from src.renderengine.engine import RenderEngine
+        from src.ui.ui import TextImage
+
+        if not self.timer.is_enabled():
+            self.cleanup()
+            return
+
+        self._tick_count += 1
+        if self._text_img is not None and self._tick_count % self.refresh_rate != 0:
+            return
+
+        text = self._build_text()
+        if self._text_img is None:
+            self._text_img = TextImage(4, 4, text, spriteref.UI_TOOLTIP_LAYER, scale=1, depth=-1000,
+                                       font_lookup=spriteref.tiny_font_lookup)
+        else:
+            self._text_img = self._text_img.update(new_text=text)
+
+        render_eng = RenderEngine.get_instance()
+        for bun in self._text_img.all_bundles():
+            render_eng.update(bun)
+
+    def cleanup(self):
+        if self._text_img is not None:
+            from src.renderengine.engine import RenderEngine
+            render_eng = RenderEngine.get_instance()
+            for bun in self._text_img.all_bundles():
+                render_eng.remove(bun)
+            self._text_img = None
@@ -41,6 +41,11 @@ class Entity:
         self._last_vel = (0, 0)
         self._alive = False  # World sets this upon adding/removing the entity
 
+        # the World this entity is in, which indexes it by position (World sets these too)
+        self._world = None
+        self._world_cell = None
+        self._world_add_order = 0
+
     def __str__(self):
         typename = type(self).__name__
         c_x = self.center()[0] // constants.CELLSIZE
@@ -95,11 +100,15 @@ class Entity:
         self._x = x
         self.rect[0] = int(x)
         self._last_vel = (0, 0)
+        if self._world is not None:
+            self._world._entity_moved(self)
     
     def set_y(self, y):
         self._y = y
         self.rect[1] = int(y)
         self._last_vel = (0, 0)
+        if self._world is not None:
+            self._world._entity_moved(self)
 
     def valid_to_stand_on(self, world, x, y):
         return not world.is_solid_at(x, y) and world.get_geo_at(x, y) != World.EMPTY
@@ -0,0 +1,169 @@
+import numpy
+
+from src.utils.util import Utils
+
+
+"""
+The world's light levels, built up from the light maps of its light sources.
+"""
+
+
+_LEVEL_TABLES = {}  # light range -> (levels, in_range), both indexed by [x][y] offset from the source (+ range)
+
+
+def _get_level_table(max_dist):
+    """
+        returns: (levels, in_range), where levels[x][y] is the light level a source with this range gives off
+                 (ignoring walls) and in_range[x][y] is whether that cell is close enough to be lit at all.
+    """
+    if max_dist not in _LEVEL_TABLES:
+        size = 2 * max_dist + 1
+        levels = [[0.0] * size for _ in range(0, size)]
+        in_range = [[False] * size for _ in range(0, size)]
+        mult = Utils.bound((max_dist / 6) ** (2 / 3), 0, 1)
+        for x in range(0, size):
+            for y in range(0, size):
+                xy_dist = Utils.dist((x, y), (max_dist, max_dist))
+                if xy_dist <= max_dist:
+                    levels[x][y] = mult * (1 - (xy_dist / max_dist) ** 1.5)
+                    in_range[x][y] = True
+        _LEVEL_TABLES[max_dist] = (levels, in_range)
+
+    return _LEVEL_TABLES[max_dist]
+
+
+def _calc_light_map(max_dist, solids):
+    """
+        flood-fills outward from the center of the window, stopping at solid cells (which still get lit).
+        solids: (2 * max_dist + 1)^2 array of bools, centered on the light source.
+        returns: array of light levels, the same shape as solids.
+    """
+    size = 2 * max_dist + 1
+    levels, in_range = _get_level_table(max_dist)
+    solids = solids.tolist()
+    res = [[0.0] * size for _ in range(0, size)]
+
+    processed = set()
+    q = [(max_dist, max_dist)]
+    processed.add(q[0])
+
+    while len(q) > 0:
+        x, y = q.pop()
+
+        if in_range[x][y]:
+            res[x][y] = levels[x][y]
+
+            # it's sometimes expected to have light sources embedded inside solid blocks
+            # (like when the player is walking through a door that's opening...)
+            if (x, y) != (max_dist, max_dist) and solids[x][y]:
+                continue
+
+            for n in Utils.neighbors(x, y):
+                if n not in processed and 0 <= n[0] < size and 0 <= n[1] < size:
+                    processed.add(n)
+                    q.append(n)
+
+    return numpy.array(res, dtype=numpy.float64)
+
+
+class LightingGrid:
+    """
+        keeps a light map for each light source (how much light it gives to each cell around it), keyed by the
+        source's position, range, and the solid cells within its range. when the sources change, only the maps
+        of new or moved sources need to be flood-filled again, and the rest are composited from the cache.
+    """
+
+    def __init__(self, width, height):
+        self._size = (width, height)
+        self._levels = numpy.zeros((width, height), dtype=numpy.float64)  # 0.0 = totally dark, 1.0 = fully lit
+        self._solid = numpy.ones((width, height), dtype=bool)
+        self._lightable = numpy.zeros((width, height), dtype=bool)  # only these cells' levels are ever changed
+
+        self._light_maps = {}  # (grid_x, grid_y, light_range) -> (bytes: solids in range, array of levels)
+
+    def size(self):
+        return self._size
+
+    def get(self, grid_x, grid_y):
+        return self._levels.item(grid_x, grid_y)
+
+    def set_geo(self, grid_x, grid_y, is_solid, is_lightable):
+        self._solid[grid_x, grid_y] = is_solid
+        self._lightable[grid_x, grid_y] = is_lightable
+
+    def set_all_geo(self, is_solid, is_lightable):
+        """is_solid, is_lightable: width x height arrays of bools"""
+        self._solid[:, :] = is_solid
+        self._lightable[:, :] = is_lightable
+
+    def _window(self, grid_x, grid_y, max_dist):
+        """
+            returns: (world_slices, window_slices) for the part of the source's square that's inside the world,
+                     or None if none of it is.
+        """
+        x1 = max(0, grid_x - max_dist)
+        y1 = max(0, grid_y - max_dist)
+        x2 = min(self._size[0], grid_x + max_dist + 1)
+        y2 = min(self._size[1], grid_y + max_dist + 1)
+        if x1 >= x2 or y1 >= y2:
+            return None
+
+        wx = x1 - (grid_x - max_dist)
+        wy = y1 - (grid_y - max_dist)
+        return ((slice(x1, x2), slice(y1, y2)),
+                (slice(wx, wx + x2 - x1), slice(wy, wy + y2 - y1)))
+
+    def get_light_map(self, src):
+        """
+            src: (grid_x, grid_y, int: light range)
+            returns: (2 * range + 1)^2 array of the light levels the source gives to the cells around it.
+        """
+        grid_x, grid_y, max_dist = src
+        size = 2 * max_dist + 1
+
+        # everything outside the world is solid
+        solids = numpy.ones((size, size), dtype=bool)
+        window = self._window(grid_x, grid_y, max_dist)
+        if window is not None:
+            solids[window[1]] = self._solid[window[0]]
+
+        geo_key = solids.tobytes()
+        cached = self._light_maps.get(src)
+        if cached is not None and cached[0] == geo_key:
+            return cached[1]
+
+        light_map = _calc_light_map(max_dist, solids)
+        self._light_maps[src] = (geo_key, light_map)
+        return light_map
+
+    def recalc(self, old_sources, new_sources):
+        """
+            old_sources: set of (grid_x, grid_y, int: light range)
+            new_sources: set of (grid_x, grid_y, int: light range)
+            returns: list of (grid_x, grid_y) cells whose light level changed.
+        """
+        old_levels = self._levels.copy()
+
+        deleted = [src for src in old_sources if src not in new_sources]
+        for d_src in deleted:
+            window = self._window(*d_src)
+            if window is not None:
+                self._levels[window[0]][self._lightable[window[0]]] = 0.0
+
+        if len(deleted) == 0:
+            to_add = [src for src in new_sources if src not in old_sources]
+        else:
+            to_add = new_sources
+
+        for src in to_add:
+            window = self._window(*src)
+            if window is not None:
+                light_map = self.get_light_map(src)
+                region = self._levels[window[0]]
+                numpy.maximum(region, light_map[window[1]], out=region, where=self._lightable[window[0]])
+
+        # maps of sources that have moved away aren't worth keeping around
+        for src in [src for src in self._light_maps if src not in new_sources]:
+            del self._light_maps[src]
+
+        return [(int(x), int(y)) for (x, y) in numpy.argwhere(self._levels != old_levels)]
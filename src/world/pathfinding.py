@@ -0,0 +1,154 @@
+import heapq
+import collections
+
+
+"""
+Pathfinding over the world's grid of cells.
+"""
+
+
+def tiebreak(x, y, salt):
+    """returns: a number that's the same for the same inputs, but looks random across cells and salts."""
+    h = (x * 73856093) ^ (y * 19349663) ^ (salt * 83492791)
+    h = ((h >> 16) ^ h) * 0x45d9f3b
+    return ((h >> 16) ^ h) & 0xFFFF
+
+
+def find_path(start, end, is_passable, max_length=-1, salt=None):
+    """
+        A* with a manhattan heuristic. among equally short paths, which one is picked depends on the salt (so
+        different searches don't all hug the same walls), but the same search always gives the same path.
+
+        start: (grid_x, grid_y). it's never checked for passability.
+        end: (grid_x, grid_y)
+        is_passable: lambda (grid_x, grid_y) -> bool. called at most once per cell.
+        max_length: max number of steps in the path, or -1 for no limit.
+        salt: int used to break ties (defaults to one based on the start and end).
+        returns: list of cells from start to end (inclusive), or None if there's no path.
+    """
+    if start == end:
+        return [start]
+
+    if salt is None:
+        salt = start[0] * 7919 + start[1] * 104729 + end[0] * 31 + end[1]
+
+    end_x, end_y = end
+    h = abs(start[0] - end_x) + abs(start[1] - end_y)
+    if -1 < max_length < h:
+        return None
+
+    backrefs = {start: None}  # cell -> the cell before it
+    dists = {start: 0}        # cell -> length of the shortest path to it found so far
+    checked = {start: True}   # cell -> whether it's passable
+
+    # (estimated total length, -dist, tiebreak, cell). deeper cells go first among equal estimates.
+    frontier = [(h, 0, 0, start)]
+
+    while len(frontier) > 0:
+        _, neg_dist, _, cur = heapq.heappop(frontier)
+        dist = -neg_dist
+        if dist > dists[cur]:
+            continue  # stale entry
+
+        if cur == end:
+            res = [end]  # building the list in reverse
+            temp = backrefs[end]
+            while temp is not None:
+                res.append(temp)
+                temp = backrefs[temp]
+            res.reverse()
+            return res
+
+        n_dist = dist + 1
+        x, y = cur
+        for n in ((x + 1, y), (x, y + 1), (x - 1, y), (x, y - 1)):
+            if n in dists and dists[n] <= n_dist:
+                continue
+
+            n_h = abs(n[0] - end_x) + abs(n[1] - end_y)
+            if -1 < max_length < n_dist + n_h:
+                continue
+
+            if n not in checked:
+                checked[n] = is_passable(n)
+            if not checked[n]:
+                continue
+
+            dists[n] = n_dist
+            backrefs[n] = cur
+            heapq.heappush(frontier, (n_dist + n_h, -n_dist, tiebreak(n[0], n[1], salt), n))
+
+    return None
+
+
+class DistanceField:
+    """
+        the number of steps from every cell within some range to a single target cell (or, equivalently, from the
+        target to every cell). cells that are out of range or unreachable aren't in the field at all.
+    """
+
+    def __init__(self, target, dists, max_dist):
+        self.target = target
+        self.max_dist = max_dist
+        self._dists = dists  # (grid_x, grid_y) -> int
+
+    def get_dist(self, xy):
+        """returns: the number of steps between xy and the target, or None if it's unreachable or out of range."""
+        return self._dists.get(xy)
+
+    def __contains__(self, xy):
+        return xy in self._dists
+
+    def __len__(self):
+        return len(self._dists)
+
+    def all_cells(self):
+        return self._dists.keys()
+
+    def get_next_steps(self, xy, max_dist=-1, salt=0):
+        """
+            xy: (grid_x, grid_y). it doesn't need to be in the field itself (e.g. it could be a solid actor).
+            max_dist: neighbors further than this from the target are skipped, or -1 for no limit.
+            returns: list of the neighbors of xy that are in the field, closest to the target first. among equally
+                     close neighbors the order depends on the salt, but it's the same for the same salt.
+        """
+        x, y = xy
+        res = []
+        for n in ((x + 1, y), (x, y + 1), (x - 1, y), (x, y - 1)):
+            n_dist = self._dists.get(n)
+            if n_dist is not None and (max_dist < 0 or n_dist <= max_dist):
+                res.append((n_dist, tiebreak(n[0], n[1], salt), n))
+        res.sort()
+        return [n for (_, _, n) in res]
+
+
+def compute_distance_field(target, is_passable, max_dist=-1):
+    """
+        breadth-first search outward from the target.
+
+        target: (grid_x, grid_y). it's never checked for passability, and is always in the field (at distance 0).
+        is_passable: lambda (grid_x, grid_y) -> bool. called at most once per cell. impassable cells aren't in the
+                     field, and the search doesn't continue through them.
+        max_dist: cells further than this many steps from the target are left out, or -1 for no limit.
+        returns: a DistanceField
+    """
+    dists = {target: 0}
+    checked = {target: True}
+    frontier = collections.deque([target])
+
+    while len(frontier) > 0:
+        cur = frontier.popleft()
+        n_dist = dists[cur] + 1
+        if -1 < max_dist < n_dist:
+            continue
+
+        x, y = cur
+        for n in ((x + 1, y), (x, y + 1), (x - 1, y), (x, y - 1)):
+            if n in checked:
+                continue
+            checked[n] = is_passable(n)
+            if checked[n]:
+                dists[n] = n_dist
+                frontier.append(n)
+
+    return DistanceField(target, dists, max_dist)
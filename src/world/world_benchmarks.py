@@ -0,0 +1,524 @@
+import src.game.simulation as simulation  # must be imported before pygame is initialized
+
+import random
+import time
+
+from src.utils.util import Utils
+import src.world.pathfinding as pathfinding
+
+
+"""
+Benchmarks for World's entity queries (on a real zone that's been stuffed with extra decorations and items),
+for its lighting, for building Worlds out of zones, and for enemy pathfinding.
+
+Run with: python -m src.world.world_benchmarks
+"""
+
+
+def _linear_entities_in_cell(world, grid_x, grid_y, cond=None):
+    res = []
+    for e in world.all_entities():
+        if cond is None or cond(e):
+            grid_pos = world.to_grid_coords(e.center()[0], e.center()[1])
+            if grid_x == grid_pos[0] and grid_y == grid_pos[1]:
+                res.append(e)
+    return res
+
+
+def _linear_is_solid(world, grid_x, grid_y):
+    if world.get_geo(grid_x, grid_y) in world.SOLIDS:
+        return True
+    return len(_linear_entities_in_cell(world, grid_x, grid_y, cond=lambda e: e.is_solid(world))) > 0
+
+
+def _linear_entities_in_circle(world, center, radius, cond=None):
+    r2 = radius * radius
+    res = []
+    for e in world.all_entities():
+        if cond is None or cond(e):
+            e_c = e.center()
+            dx = e_c[0] - center[0]
+            dy = e_c[1] - center[1]
+            if dx * dx + dy * dy <= r2:
+                res.append(e)
+    res.sort(key=lambda e: Utils.dist(center, e.center()))
+    return res
+
+
+def _linear_get_entity(world, uid):
+    for e in world.all_entities():
+        if e.get_uid() == uid:
+            return e
+    return None
+
+
+def build_crowded_world(zone_id, n_decorations, n_items, seed):
+    """returns: a World for the zone, with extra decorations and items scattered across its floor."""
+    import src.game.globalstate as gs
+    import src.game.decoration as decoration
+    from src.items.itemgen import ItemFactory
+
+    random.seed(seed)
+    simulation.start_new_game(zone_id)
+    world = gs.get_instance().get_world()
+
+    floors = [(x, y) for x in range(0, world.size()[0]) for y in range(0, world.size()[1])
+              if world.get_geo(x, y) == world.FLOOR]
+
+    for _ in range(0, n_decorations):
+        world.add(decoration.DecorationFactory.get_decoration(0), gridcell=random.choice(floors))
+
+    for _ in range(0, n_items):
+        item = None
+        while item is None:
+            item = ItemFactory.gen_item(0)
+        world.add_item_as_entity(item, world.cell_center(*random.choice(floors)))
+
+    world.flush_new_entity_additions()
+    return world
+
+
+def _time_it(func, n_trials):
+    start = time.perf_counter()
+    for _ in range(0, n_trials):
+        func()
+    return (time.perf_counter() - start) / n_trials
+
+
+def bench_entity_queries(zone_id="city_3", sizes=((0, 0), (200, 200), (500, 500)), n_trials=3, seed=101):
+    for (n_decs, n_items) in sizes:
+        world = build_crowded_world(zone_id, n_decs, n_items, seed)
+
+        cells = [(x, y) for x in range(0, world.size()[0]) for y in range(0, world.size()[1])]
+        rand = random.Random(seed)
+        circles = [(world.cell_center(*rand.choice(cells)), rand.choice([16, 64, 160, 400])) for _ in range(0, 200)]
+        uids = [e.get_uid() for e in world.all_entities()] + [-1]
+
+        # make sure the indexed queries give exactly the same results as the linear scans
+        for xy in cells:
+            if world.get_entities_in_cell(*xy) != _linear_entities_in_cell(world, *xy):
+                raise ValueError("get_entities_in_cell mismatch at {}".format(xy))
+            if world.is_solid(*xy, including_entities=True) != _linear_is_solid(world, *xy):
+                raise ValueError("is_solid mismatch at {}".format(xy))
+        for (center, radius) in circles:
+            if world.entities_in_circle(center, radius, onscreen=False) != _linear_entities_in_circle(world, center, radius):
+                raise ValueError("entities_in_circle mismatch at {}, r={}".format(center, radius))
+        for uid in uids:
+            if world.get_entity(uid, onscreen=False) is not _linear_get_entity(world, uid):
+                raise ValueError("get_entity mismatch for uid={}".format(uid))
+
+        results = [
+            ("is_solid (all cells)",
+             lambda: [world.is_solid(*xy, including_entities=True) for xy in cells],
+             lambda: [_linear_is_solid(world, *xy) for xy in cells]),
+            ("entities_in_circle (x200)",
+             lambda: [world.entities_in_circle(c, r, onscreen=False) for (c, r) in circles],
+             lambda: [_linear_entities_in_circle(world, c, r) for (c, r) in circles]),
+            ("get_entity (all uids)",
+             lambda: [world.get_entity(uid, onscreen=False) for uid in uids],
+             lambda: [_linear_get_entity(world, uid) for uid in uids])
+        ]
+
+        print("INFO: zone={}, {} entities ({} extra decorations, {} extra items), {} cells".format(
+            zone_id, len(uids) - 1, n_decs, n_items, len(cells)))
+        for (name, indexed, linear) in results:
+            indexed_time = _time_it(indexed, n_trials)
+            linear_time = _time_it(linear, n_trials)
+            print("INFO:\t{:<26} linear={:.2f}ms\tindexed={:.2f}ms\t({:.1f}x)".format(
+                name, linear_time * 1000, indexed_time * 1000, linear_time / max(indexed_time, 1e-9)))
+
+
+def bench_entity_churn(zone_id="city_3", spawns_per_tick=(5, 20, 80), n_ticks=120, seed=202):
+    """times World.update_all while short-lived effect entities are constantly being added and removed."""
+    import src.game.globalstate as gs
+
+    for n_spawns in spawns_per_tick:
+        world = build_crowded_world(zone_id, 0, 0, seed)
+        player = world.get_player()
+        rand = random.Random(seed)
+
+        total_time = 0
+        for _ in range(0, n_ticks):
+            for _ in range(0, n_spawns):
+                cx = player.center()[0] + rand.randint(-200, 200)
+                cy = player.center()[1] + rand.randint(-200, 200)
+                if rand.random() < 0.5:
+                    world.show_explosion(cx, cy, rand.randint(10, 30))
+                else:
+                    world.show_floating_text("-1", (1, 0, 0), 1, player)
+
+            start = time.perf_counter()
+            world.update_all()
+            total_time += time.perf_counter() - start
+            gs.get_instance().increment_tick_counts()
+
+        print("INFO: update_all with {} effects spawned per tick:\t{} entities alive,\t{:.2f}ms per tick".format(
+            n_spawns, len(list(world.all_entities())), total_time * 1000 / n_ticks))
+
+
+class _LinearLighting:
+    """the old way of lighting the world: zero around removed sources, then flood-fill every source again."""
+
+    def __init__(self, world):
+        self.world = world
+        self.levels = [[0.0] * world.size()[1] for _ in range(0, world.size()[0])]
+
+    def _set(self, x, y, val):
+        if self.world.is_valid(x, y) and self.world.get_geo(x, y) in (self.world.FLOOR, self.world.DOOR):
+            self.levels[x][y] = val
+
+    def recalc(self, old_lighting, new_lighting):
+        deleted = [src for src in old_lighting if src not in new_lighting]
+        for (grid_x, grid_y, dist) in deleted:
+            for x in range(grid_x - dist, grid_x + dist + 1):
+                for y in range(grid_y - dist, grid_y + dist + 1):
+                    self._set(x, y, 0.0)
+
+        to_add = [src for src in new_lighting if src not in old_lighting] if len(deleted) == 0 else new_lighting
+
+        for (grid_x, grid_y, max_dist) in to_add:
+            processed = {(grid_x, grid_y)}
+            q = [(grid_x, grid_y)]
+            while len(q) > 0:
+                x, y = q.pop()
+                xy_dist = Utils.dist((x, y), (grid_x, grid_y))
+                if xy_dist <= max_dist:
+                    mult = Utils.bound((max_dist / 6) ** (2 / 3), 0, 1)
+                    level = mult * (1 - (xy_dist / max_dist) ** 1.5)
+                    if self.world.is_valid(x, y) and level > self.levels[x][y]:
+                        self._set(x, y, level)
+
+                    if (x, y) != (grid_x, grid_y) and self.world.is_solid(x, y):
+                        continue
+
+                    for n in Utils.neighbors(x, y):
+                        if n not in processed and abs(n[0] - grid_x) <= max_dist and abs(n[1] - grid_y) <= max_dist:
+                            processed.add(n)
+                            q.append(n)
+
+
+def bench_lighting(zone_id="city_3", extra_sources=(0, 10, 40), n_steps=300, seed=303):
+    """
+        moves the player's light around the zone (opening a door now and then) and times the lighting updates,
+        with some extra stationary light sources scattered across the floor.
+    """
+    for n_extra in extra_sources:
+        world = build_crowded_world(zone_id, 0, 0, seed)
+        player = world.get_player()
+        rand = random.Random(seed)
+
+        floors = [(x, y) for x in range(0, world.size()[0]) for y in range(0, world.size()[1])
+                  if world.get_geo(x, y) == world.FLOOR]
+        sources = world.get_light_sources(onscreen=False)
+        for _ in range(0, n_extra):
+            sources.add(rand.choice(floors) + (rand.randint(2, 8),))
+        player_pos = world.to_grid_coords(*player.center())
+        player_src = (player_pos[0], player_pos[1], player.get_light_level())
+        doors = [(x, y) for x in range(0, world.size()[0]) for y in range(0, world.size()[1])
+                 if world.get_geo(x, y) == world.DOOR]
+
+        linear = _LinearLighting(world)
+        linear.recalc(set(), sources)
+        world._recalc_lighting(set(), sources)
+
+        linear_time = 0
+        cached_time = 0
+        for step in range(0, n_steps):
+            if len(doors) > 0 and rand.random() < 0.05:
+                world.set_geo(*doors.pop(rand.randint(0, len(doors) - 1)), world.FLOOR)
+
+            moves = [n for n in Utils.neighbors(player_src[0], player_src[1]) if world.get_geo(*n) == world.FLOOR]
+            if len(moves) > 0:
+                n = rand.choice(moves)
+                new_sources = set(sources)
+                new_sources.discard(player_src)
+                player_src = (n[0], n[1], player_src[2])
+                new_sources.add(player_src)
+            else:
+                new_sources = sources
+
+            start = time.perf_counter()
+            linear.recalc(sources, new_sources)
+            linear_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            world._recalc_lighting(sources, new_sources)
+            cached_time += time.perf_counter() - start
+
+            sources = new_sources
+
+            for x in range(0, world.size()[0]):
+                for y in range(0, world.size()[1]):
+                    if world.get_lighting(x, y) != linear.levels[x][y]:
+                        raise ValueError("lighting mismatch at {} after step {}: expected {}, got {}".format(
+                            (x, y), step, linear.levels[x][y], world.get_lighting(x, y)))
+
+        print("INFO: lighting in zone={} with {} light sources:\tlinear={:.2f}ms\tcached={:.2f}ms\t({:.1f}x)".format(
+            zone_id, len(sources), linear_time * 1000 / n_steps, cached_time * 1000 / n_steps,
+            linear_time / max(cached_time, 1e-9)))
+
+def _reference_set_all_geo(world, geo, floor_types=None, wall_types=None):
+    """the old way of filling in a new world: a set_geo (and set_floor_type / set_wall_type) for every cell."""
+    for x in range(0, world.size()[0]):
+        for y in range(0, world.size()[1]):
+            world.set_geo(x, y, int(geo[x][y]))
+            if wall_types is not None and wall_types[x][y] is not None:
+                world.set_wall_type(wall_types[x][y], xy=(x, y))
+            if floor_types is not None and floor_types[x][y] is not None:
+                world.set_floor_type(floor_types[x][y], xy=(x, y))
+
+
+def _world_snapshot(world):
+    return (world._level_geo,
+            list(world._floor_art_overrides.items()),
+            list(world._wall_art_overrides.items()),
+            world._lighting._solid.tobytes(),
+            world._lighting._lightable.tobytes(),
+            [(type(e).__name__, e.center()) for e in world._ents_to_add])
+
+
+def bench_world_construction(handbuilt_zone_ids=("tomb_town", "frog_lair", "undergrowth", "loot_zone_0"),
+                             generated_zone_ids=("caves_1", "swamps_3", "city_3"), n_trials=5, seed=404):
+    """times building Worlds from zone blueprints and generated tile grids, with per-cell and bulk geo loading."""
+    import src.worldgen.zones as zones
+    from src.world.worldstate import World
+    from src.worldgen.pregen import TileGridBlueprint
+
+    builders = []
+    for zone_id in handbuilt_zone_ids:
+        zone = zones.get_zone(zone_id)
+        bp, _ = zones.ZoneLoader.load_blueprint_from_file(zone_id, zone.get_file(), zone.get_level())
+        builders.append((zone_id, bp.build_world))
+
+    for zone_id in generated_zone_ids:
+        t_grid = zones.get_zone(zone_id).get_tile_grid_blueprint().generate()
+        builders.append((zone_id, lambda z_id=zone_id, t=t_grid: zones.ZoneBuilder._tile_grid_to_world(
+            z_id, zones.get_zone(z_id).get_level(), t)))
+
+    def build(builder, set_all_geo):
+        bulk_set_all_geo = World.set_all_geo
+        World.set_all_geo = set_all_geo
+        try:
+            random.seed(seed)
+            start = time.perf_counter()
+            world = builder()
+            return world, time.perf_counter() - start
+        finally:
+            World.set_all_geo = bulk_set_all_geo
+
+    for (zone_id, builder) in builders:
+        ref_world, _ = build(builder, _reference_set_all_geo)
+        world, _ = build(builder, World.set_all_geo)
+        if _world_snapshot(ref_world) != _world_snapshot(world):
+            raise ValueError("built a different world for zone={}".format(zone_id))
+
+        ref_time = sum(build(builder, _reference_set_all_geo)[1] for _ in range(0, n_trials)) / n_trials
+        bulk_time = sum(build(builder, World.set_all_geo)[1] for _ in range(0, n_trials)) / n_trials
+
+        print("INFO: building world for zone={} ({}x{}):	per-cell={:.2f}ms	bulk={:.2f}ms	({:.1f}x)".format(
+            zone_id, world.size()[0], world.size()[1], ref_time * 1000, bulk_time * 1000,
+            ref_time / max(bulk_time, 1e-9)))
+
+def _bfs_path_between(world, p1, p2, max_length, cond, rng):
+    """the old World.get_path_between: a breadth-first search, visiting neighbors in a random order."""
+    if p1 == p2:
+        return [p1] if cond(p1) else None
+    if -1 < max_length < Utils.dist_manhattan(p1, p2):
+        return None
+
+    dists = {p1: 0}
+    backrefs = {p1: None}
+    q = [p1]
+    while len(q) > 0:
+        cur = q.pop(0)
+        n_dist = dists[cur] + 1
+        if n_dist > max_length > -1:
+            continue
+
+        neighbors = list(Utils.neighbors(cur[0], cur[1]))
+        rng.shuffle(neighbors)
+        for n in neighbors:
+            if n in dists:
+                continue
+            dists[n] = n_dist
+            if world.is_valid(*n) and cond(n):
+                backrefs[n] = cur
+                q.append(n)
+
+        if p2 in backrefs:
+            break
+
+    if p2 not in backrefs:
+        return None
+    res = [p2]
+    while backrefs[res[-1]] is not None:
+        res.append(backrefs[res[-1]])
+    res.reverse()
+    return res
+
+
+def bench_pathfinding(zone_id="city_3", n_enemies=20, n_turns=40, path_ranges=(8, 16, 40), seed=505):
+    """
+        20 enemies chase the player (who wanders around randomly) for a while. every turn, each enemy
+        looks for a path to the player, the way EnemyController does, and takes a step along it.
+        (in the actual game, enemies only path up to balance.ENEMY_SMART_PATHING_RANGE steps).
+    """
+    from src.game.enemies import EnemyFactory
+
+    for max_length in path_ranges:
+        world = build_crowded_world(zone_id, 0, 0, seed)
+        player = world.get_player()
+        rand = random.Random(seed)
+
+        # spawning them in the player's part of the map, so that they have something to chase
+        p_pos = world.to_grid_coords(*player.center())
+        nearby = {p_pos: 0}
+        q = [p_pos]
+        while len(q) > 0:
+            cur = q.pop(0)
+            for n in Utils.neighbors(*cur):
+                if n not in nearby and nearby[cur] < 12 and world.is_passable(*n):
+                    nearby[n] = nearby[cur] + 1
+                    q.append(n)
+        del nearby[p_pos]
+
+        enemies = []
+        for xy in rand.sample(sorted(nearby), min(n_enemies, len(nearby))):
+            enemy = EnemyFactory.gen_enemy(None, 0)
+            world.add(enemy, gridcell=xy)
+            enemies.append(enemy)
+        world.flush_new_entity_additions()
+
+        ref_rng = random.Random(seed)
+        old_time = 0
+        new_time = 0
+        n_found = 0
+        n_queries = 0
+
+        for turn in range(0, n_turns):
+            p_pos = world.to_grid_coords(*player.center())
+            moves = [n for n in Utils.neighbors(*p_pos) if world.is_passable(*n)]
+            if len(moves) > 0:
+                p_pos = rand.choice(moves)
+                player.set_center(*world.cell_center(*p_pos))
+
+            for enemy in enemies:
+                pos = world.to_grid_coords(*enemy.center())
+
+                def cond(xy):
+                    return xy == p_pos or xy == pos or not world.is_solid(*xy, including_entities=True)
+
+                start = time.perf_counter()
+                expected = _bfs_path_between(world, pos, p_pos, max_length, cond, ref_rng)
+                old_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                path = world.get_path_between(pos, p_pos, max_length=max_length,
+                                              cond=lambda xy: xy == p_pos or xy == pos or world.is_passable(*xy))
+                new_time += time.perf_counter() - start
+
+                n_queries += 1
+                if (expected is None) != (path is None) or (path is not None and len(path) != len(expected)):
+                    raise ValueError("path mismatch from {} to {} (turn {}):\nexpected: {}\ngot: {}".format(
+                        pos, p_pos, turn, expected, path))
+                if path is None:
+                    continue
+
+                n_found += 1
+                for i in range(1, len(path)):
+                    if Utils.dist_manhattan(path[i - 1], path[i]) != 1 or not cond(path[i]):
+                        raise ValueError("invalid path from {} to {}: {}".format(pos, p_pos, path))
+
+                if len(path) > 2:
+                    enemy.set_center(*world.cell_center(*path[1]))
+
+        print("INFO: {} enemies chasing the player for {} turns (max_length={}, {}/{} paths found):\t"
+              "bfs={:.3f}ms\ta*={:.3f}ms per turn\t({:.1f}x)".format(
+                  n_enemies, n_turns, max_length, n_found, n_queries, old_time * 1000 / n_turns,
+                  new_time * 1000 / n_turns, old_time / max(new_time, 1e-9)))
+
+
+def bench_distance_field(zone_id="city_3", enemy_counts=(5, 20, 60), n_turns=40, seed=606):
+    """
+        same chase as bench_pathfinding, but with enemies pathing up to balance.ENEMY_SMART_PATHING_RANGE, and
+        every enemy picking its step before any of them move (like in the actual game). compares each enemy
+        searching for its own path with all of them sharing the player's distance field.
+    """
+    from src.game.enemies import EnemyFactory
+    import src.game.balance as balance
+
+    max_length = balance.ENEMY_SMART_PATHING_RANGE
+
+    for n_enemies in enemy_counts:
+        world = build_crowded_world(zone_id, 0, 0, seed)
+        player = world.get_player()
+        rand = random.Random(seed)
+
+        p_pos = world.to_grid_coords(*player.center())
+        nearby = pathfinding.compute_distance_field(p_pos, lambda xy: world.is_passable(*xy), max_dist=12)
+        spawn_cells = sorted(xy for xy in nearby.all_cells() if xy != p_pos)
+
+        enemies = []
+        for xy in rand.sample(spawn_cells, min(n_enemies, len(spawn_cells))):
+            enemy = EnemyFactory.gen_enemy(None, 0)
+            world.add(enemy, gridcell=xy)
+            enemies.append(enemy)
+        world.flush_new_entity_additions()
+
+        old_time = 0
+        new_time = 0
+        n_found = 0
+
+        for turn in range(0, n_turns):
+            p_pos = world.to_grid_coords(*player.center())
+            moves = [n for n in Utils.neighbors(*p_pos) if world.is_passable(*n)]
+            if len(moves) > 0:
+                p_pos = rand.choice(moves)
+                player.set_center(*world.cell_center(*p_pos))
+
+            steps = []
+            for enemy in enemies:
+                pos = world.to_grid_coords(*enemy.center())
+
+                start = time.perf_counter()
+                path = world.get_path_between(pos, p_pos, max_length=max_length,
+                                              cond=lambda xy: xy == p_pos or xy == pos or world.is_passable(*xy))
+                old_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                dist_field = world.get_distance_field_to_player(max_length)
+                next_steps = dist_field.get_next_steps(pos, max_dist=max_length - 1, salt=enemy.get_uid())
+                new_time += time.perf_counter() - start
+
+                expected = None if path is None or len(path) < 2 else len(path) - 1
+                actual = None if len(next_steps) == 0 else dist_field.get_dist(next_steps[0]) + 1
+                if expected != actual:
+                    raise ValueError("step mismatch from {} to {} (turn {}):\npath: {}\nnext steps: {}".format(
+                        pos, p_pos, turn, path, next_steps))
+
+                if actual is not None:
+                    n_found += 1
+                    if next_steps[0] != p_pos:
+                        steps.append((enemy, next_steps[0]))
+
+            taken = set()
+            for (enemy, xy) in steps:
+                if xy not in taken:
+                    taken.add(xy)
+                    enemy.set_center(*world.cell_center(*xy))
+
+        print("INFO: {} enemies chasing the player for {} turns ({}/{} found a step):\t"
+              "a*={:.3f}ms\tshared field={:.3f}ms per turn\t({:.1f}x)".format(
+                  n_enemies, n_turns, n_found, n_enemies * n_turns, old_time * 1000 / n_turns,
+                  new_time * 1000 / n_turns, old_time / max(new_time, 1e-9)))
+
+
+
+if __name__ == "__main__":
+    simulation.init()
+    bench_entity_queries()
+    bench_entity_churn()
+    bench_lighting()
+    bench_world_construction()
+    bench_pathfinding()
+    bench_distance_field()
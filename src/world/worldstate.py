@@ -1,10 +1,14 @@
 import random
 
+import numpy
+
 import src.game.spriteref as spriteref
 from src.utils.util import Utils
 import src.utils.colors as colors
 import src.game.globalstate as gs
 import src.game.constants as constants
+from src.world.lighting import LightingGrid
+import src.world.pathfinding as pathfinding
 
 CELLSIZE = constants.CELLSIZE  # it's 32
 
@@ -21,7 +25,7 @@ class World:
     def __init__(self, width, height):
         self._size = (width, height)
         self._level_geo = []
-        self._level_lighting = []  # 0.0 = totally dark, 1.0 = fully lit
+        self._lighting = LightingGrid(width, height)
         self._hidden = []
 
         self._cached_light_sources = set()  # used to track changes in lighting between updates
@@ -34,14 +38,23 @@ class World:
 
         for _ in range(0, width):
             self._level_geo.append([World.EMPTY] * height)
-            self._level_lighting.append([0.0] * height)
             self._hidden.append([False] * height)
 
-        self.entities = []
+        self._entities = {}  # uid -> entity, in the order they were added
         self._ents_to_remove = set()
         self._ents_to_add = []
         self._onscreen_entities = set()
 
+        # indexes over self._entities, kept up to date as entities are added, removed, and moved
+        self._entities_by_cell = {}  # (grid_x, grid_y) -> {entity -> None}, keyed by the entity's center
+        self._entity_add_counter = 0  # used to return entities in the same order as self._entities
+        self._player = None
+        self._npcs_by_id = {}  # npc_id -> list of entities, in the order they were added
+
+        # bumped whenever something that could block movement changes (geo, or entities entering/leaving cells)
+        self._pathing_version = 0
+        self._player_dist_field = None  # (cache key, DistanceField)
+
         # actors within this x, y range from player will act
         self._entity_act_range = (9, 8)
 
@@ -127,19 +140,103 @@ class World:
                         self.remove(dep_ent)
 
     def __contains__(self, entity):
-        return entity in self.entities
+        return entity is not None and self._entities.get(entity.get_uid()) is entity
+
+    def _index_entity(self, entity):
+        entity._world = self
+        entity._world_cell = None
+        entity._world_add_order = self._entity_add_counter
+        self._entity_add_counter += 1
+
+        self._entities[entity.get_uid()] = entity
+        self._entity_moved(entity)
+
+        if entity.is_player():
+            if self._player is None:
+                self._player = entity
+        elif entity.is_npc():
+            if entity.get_npc_id() not in self._npcs_by_id:
+                self._npcs_by_id[entity.get_npc_id()] = []
+            self._npcs_by_id[entity.get_npc_id()].append(entity)
+
+    def _unindex_entity(self, entity):
+        if self._entities.get(entity.get_uid()) is entity:
+            del self._entities[entity.get_uid()]
+
+        if entity is self._player:
+            self._player = None
+            for e in self._entities.values():
+                if e.is_player():
+                    self._player = e
+                    break
+        elif entity.is_npc() and entity.get_npc_id() in self._npcs_by_id:
+            npcs_with_id = self._npcs_by_id[entity.get_npc_id()]
+            if entity in npcs_with_id:
+                npcs_with_id.remove(entity)
+            if len(npcs_with_id) == 0:
+                del self._npcs_by_id[entity.get_npc_id()]
+
+        cell = entity._world_cell
+        if cell is not None and cell in self._entities_by_cell:
+            self._pathing_version += 1
+            ents_in_cell = self._entities_by_cell[cell]
+            ents_in_cell.pop(entity, None)
+            if len(ents_in_cell) == 0:
+                del self._entities_by_cell[cell]
+
+        entity._world = None
+        entity._world_cell = None
+
+    def _entity_moved(self, entity):
+        """called by entities in this world whenever their position changes."""
+        c_xy = entity.center()
+        cell = (c_xy[0] // CELLSIZE, c_xy[1] // CELLSIZE)
+        old_cell = entity._world_cell
+        if cell == old_cell:
+            return
+
+        self._pathing_version += 1
+
+        if old_cell is not None:
+            ents_in_old_cell = self._entities_by_cell[old_cell]
+            del ents_in_old_cell[entity]
+            if len(ents_in_old_cell) == 0:
+                del self._entities_by_cell[old_cell]
+
+        if cell not in self._entities_by_cell:
+            self._entities_by_cell[cell] = {entity: None}
+        else:
+            self._entities_by_cell[cell][entity] = None
+
+        entity._world_cell = cell
+
+    def _entities_in_cells(self, min_x, min_y, max_x, max_y, ordered=True):
+        """
+            returns: list of the entities in the (inclusive) range of cells.
+            ordered: whether the result needs to be in the same order as self._entities
+        """
+        res = []
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._entities_by_cell):
+            for cell in self._entities_by_cell:
+                if min_x <= cell[0] <= max_x and min_y <= cell[1] <= max_y:
+                    res.extend(self._entities_by_cell[cell])
+        else:
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    if (x, y) in self._entities_by_cell:
+                        res.extend(self._entities_by_cell[(x, y)])
+
+        if ordered and len(res) > 1:
+            res.sort(key=lambda e: e._world_add_order)
+
+        return res
         
     def get_player(self):
-        for e in self.entities:
-            if e.is_player():
-                return e
-        return None
+        return self._player
 
     def get_npc(self, npc_id):
-        for e in self.entities:
-            if e.is_npc() and e.get_id() == npc_id:
-                return e
-        return None
+        npcs_with_id = self._npcs_by_id.get(npc_id)
+        return npcs_with_id[0] if npcs_with_id else None
     
     def entities_in_circle(self, center, radius, onscreen=True, cond=None):
         """
@@ -147,16 +244,20 @@ class World:
         """
         r2 = radius*radius
         res = []
-        search_space = self._onscreen_entities if onscreen else self.entities
-        for e in search_space:
+        min_x, min_y = self.to_grid_coords(center[0] - radius, center[1] - radius)
+        max_x, max_y = self.to_grid_coords(center[0] + radius, center[1] + radius)
+        for e in self._entities_in_cells(int(min_x), int(min_y), int(max_x), int(max_y), ordered=False):
+            if onscreen and e not in self._onscreen_entities:
+                continue
             if cond is None or cond(e):
                 e_c = e.center()
                 dx = e_c[0] - center[0]
                 dy = e_c[1] - center[1]
                 if dx*dx + dy*dy <= r2:
                     res.append(e)
-        
-        res.sort(key=lambda e: Utils.dist(center, e.center()))
+
+        # ties are broken the same way as a stable sort over self._entities would
+        res.sort(key=lambda e: (Utils.dist(center, e.center()), e._world_add_order))
         
         return res
 
@@ -173,27 +274,22 @@ class World:
             return None
 
     def get_entity(self, uid, onscreen=True):
-        if onscreen:
-            for e in self._onscreen_entities:
-                if e.get_uid() == uid:
-                    return e
-        else:
-            for e in self.entities:
-                if e.get_uid() == uid:
-                    return e
-        return None
+        e = self._entities.get(uid)
+        if e is not None and onscreen and e not in self._onscreen_entities:
+            return None
+        return e
 
     def all_entities(self, onscreen=False):
         if onscreen:
             for e in self._onscreen_entities:
                 yield e
         else:
-            for e in self.entities:
+            for e in self._entities.values():
                 yield e
 
     def get_light_sources(self, onscreen=True):
         """returns: set of (grid_x, grid_y, int: light_range)"""
-        search_domain = self._onscreen_entities if onscreen else self.entities
+        search_domain = self._onscreen_entities if onscreen else self._entities.values()
         res = set()
         for e in search_domain:
             if e.get_light_level() > 0:
@@ -262,6 +358,8 @@ class World:
             self._level_geo[grid_x][grid_y] = geo_id
 
             if old_geo_id != geo_id:
+                self._pathing_version += 1
+                self._lighting.set_geo(grid_x, grid_y, geo_id in World.SOLIDS, geo_id in (World.FLOOR, World.DOOR))
                 self._dirty_geo.add((grid_x, grid_y))
                 for n in World.ALL_NEIGHBORS:
                     self._dirty_geo.add((grid_x + n[0], grid_y + n[1]))
@@ -270,6 +368,39 @@ class World:
             raise ValueError("Cannot set out of bounds grid cell to " + 
                     "non-empty: ({}, {}) <- {}".format(grid_x, grid_y, geo_id))
 
+    def set_all_geo(self, geo, floor_types=None, wall_types=None):
+        """
+            replaces the geo of every cell (and all the per-cell art overrides) at once, without tracking which
+            cells changed. the world view gets fully rebuilt instead.
+
+            geo: width x height array of geo ids, indexed by [x][y].
+            floor_types, wall_types: width x height arrays of art ids (or None for no override), indexed by [x][y].
+        """
+        geo = numpy.asarray(geo)
+        if geo.shape != self._size:
+            raise ValueError("geo has the wrong dimensions: expected {}, got {}".format(self._size, geo.shape))
+
+        self._level_geo = geo.tolist()
+        self._lighting.set_all_geo(numpy.isin(geo, World.SOLIDS), numpy.isin(geo, (World.FLOOR, World.DOOR)))
+
+        self._floor_art_overrides = World._art_overrides(floor_types)
+        self._wall_art_overrides = World._art_overrides(wall_types)
+
+        self._dirty_geo.clear()
+        self._needs_full_geo_rebuild = True
+        self._pathing_version += 1
+
+    @staticmethod
+    def _art_overrides(art_types):
+        res = {}
+        if art_types is not None:
+            for x in range(0, len(art_types)):
+                column = art_types[x]
+                for y in range(0, len(column)):
+                    if column[y] is not None:
+                        res[(x, y)] = column[y]
+        return res
+
     def to_grid_coords(self, pixel_x, pixel_y):
         return (pixel_x // CELLSIZE, pixel_y // CELLSIZE)
 
@@ -310,81 +441,15 @@ class World:
         if not self.is_valid(grid_x, grid_y):
             return 0.0
         else:
-            return self._level_lighting[grid_x][grid_y]
-
-    def _set_lighting(self, grid_x, grid_y, val):
-        if val < 0 or val > 1:
-            raise ValueError("light value out of range: {}".format(val))
-
-        if not self.is_valid(grid_x, grid_y):
-            return
-        elif self._level_lighting[grid_x][grid_y] == val:
-            return
-        elif self.get_geo(grid_x, grid_y) in (World.FLOOR, World.DOOR):
-            self._dirty_geo.add((grid_x, grid_y))
-            self._level_lighting[grid_x][grid_y] = val
+            return self._lighting.get(grid_x, grid_y)
 
     def _recalc_lighting(self, old_lighting, new_lighting):
         """
         :param old_lighting: set of (grid_x, grid_y, int: light range)
         :param new_lighting: set of (grid_x, grid_y, int: light range)
         """
-
-        deleted = []
-        for src in old_lighting:
-            if src not in new_lighting:
-                deleted.append(src)
-
-        for d_src in deleted:
-            grid_x = d_src[0]
-            grid_y = d_src[1]
-            dist = d_src[2]
-
-            for x in range(grid_x - dist, grid_x + dist + 1):
-                for y in range(grid_y - dist, grid_y + dist + 1):
-                    self._set_lighting(x, y, 0.0)
-
-        if len(deleted) == 0:
-            to_add = []
-            for src in new_lighting:
-                if src not in old_lighting:
-                    to_add.append(src)
-        else:
-            to_add = new_lighting
-
-        for src in to_add:
-            grid_x = src[0]
-            grid_y = src[1]
-            max_dist = src[2]
-
-            processed = set()
-            q = [(grid_x, grid_y)]
-            processed.add(q[0])
-            rect = [grid_x - max_dist,
-                    grid_y - max_dist,
-                    2 * max_dist + 1,
-                    2 * max_dist + 1]
-
-            while len(q) > 0:
-                x, y = q.pop()
-
-                xy_dist = Utils.dist((x, y), (grid_x, grid_y))
-                if xy_dist <= max_dist:
-                    mult = Utils.bound((max_dist / 6) ** (2 / 3), 0, 1)
-                    level = mult * (1 - (xy_dist / max_dist) ** 1.5)
-                    if level > self.get_lighting(x, y):
-                        self._set_lighting(x, y, level)
-
-                    # it's sometimes expected to have light sources embedded inside solid blocks
-                    # (like when the player is walking through a door that's opening...)
-                    if (x, y) != (grid_x, grid_y) and self.is_solid(x, y):
-                        continue
-
-                    for n in Utils.neighbors(x, y):
-                        if n not in processed:
-                            if rect[0] <= n[0] < rect[0] + rect[2] and rect[1] <= n[1] < rect[1] + rect[3]:
-                                processed.add(n)
-                                q.append(n)
+        for xy in self._lighting.recalc(old_lighting, new_lighting):
+            self._dirty_geo.add(xy)
 
     def set_bg_color(self, color):
         self._bg_color = color
@@ -430,14 +495,26 @@ class World:
 
         return False
 
+    def is_passable(self, grid_x, grid_y):
+        """returns: whether an actor could move into the cell. same as not is_solid(including_entities=True)"""
+        if not self.is_valid(grid_x, grid_y) or self._level_geo[grid_x][grid_y] in World.SOLIDS:
+            return False
+
+        ents_in_cell = self._entities_by_cell.get((grid_x, grid_y))
+        if ents_in_cell is not None:
+            for e in ents_in_cell:
+                if e.is_solid(self):
+                    return False
+
+        return True
+
     def get_actor_in_cell(self, grid_x, grid_y):
         """returns: an ActorEntity, if there's an actor entity in the specified cell"""
-        for e in self.entities:
-            if e.is_actor():
-                grid_pos = self.to_grid_coords(e.center()[0], e.center()[1])
-                if grid_x == grid_pos[0] and grid_y == grid_pos[1]:
-                    return e
-        return None
+        actors = self.get_entities_in_cell(grid_x, grid_y, cond=lambda e: e.is_actor())
+        if len(actors) == 0:
+            return None
+        else:
+            return actors[0]
 
     def get_door_in_cell(self, grid_x, grid_y):
         doors = self.get_entities_in_cell(grid_x, grid_y, cond=lambda e: e.is_door())
@@ -458,12 +535,13 @@ class World:
             return ents[0]
 
     def get_entities_in_cell(self, grid_x, grid_y, cond=None):
-        res = []
-        for e in self.entities:
-            if cond is None or cond(e):
-                grid_pos = self.to_grid_coords(e.center()[0], e.center()[1])
-                if grid_x == grid_pos[0] and grid_y == grid_pos[1]:
-                    res.append(e)
+        ents_in_cell = self._entities_by_cell.get((grid_x, grid_y))
+        if ents_in_cell is None:
+            return []
+
+        res = [e for e in ents_in_cell if cond is None or cond(e)]
+        if len(res) > 1:
+            res.sort(key=lambda e: e._world_add_order)
         return res
 
     def get_map_text_for_cells(self, grid_rect, ignore_visiblity=False):
@@ -524,55 +602,47 @@ class World:
         return res
 
     def get_path_between(self, p1, p2, max_length=-1, cond=None):
+        """
+            p1, p2: (grid_x, grid_y)
+            max_length: max number of steps in the path, or -1 for no limit.
+            cond: lambda (grid_x, grid_y) -> bool, for whether a cell can be on the path (p1 is never checked,
+                  unless it's also p2).
+            returns: one of the shortest paths from p1 to p2 (inclusive), or None if there isn't one.
+        """
         if p1 == p2:
             if cond is None or cond(p1):
                 return [p1]
             else:
                 return None
 
-        if -1 < max_length < Utils.dist_manhattan(p1, p2):
-            return None
+        return pathfinding.find_path(p1, p2, lambda xy: self.is_valid(*xy) and (cond is None or cond(xy)),
+                                     max_length=max_length)
 
-        # it's just djikstra's
-        dists = {p1: 0}        # pos -> dist
-        backrefs = {p1: None}  # pos -> pos
+    def get_distance_field_to_player(self, max_dist):
+        """
+            the field is shared by everything that asks for it, and only recomputed when the player moves to another
+            cell, when geo or solid things move around, or once per tick (since entities can become solid in place).
+            the player's cell is at distance 0, and the only cells in the field are ones an actor could move into.
 
-        q = [p1]
-        while len(q) > 0:
-            cur = q.pop(0)  # O(n) but i ~don't~ care
+            max_dist: max number of steps from the player.
+            returns: DistanceField of the steps from each cell to the player, or None if there's no player.
+        """
+        p = self.get_player()
+        if p is None:
+            return None
 
-            n_dist = dists[cur] + 1
-            if n_dist > max_length > -1:
-                continue
+        p_pos = self.to_grid_coords(*p.center())
+        key = (p_pos, max_dist, self._pathing_version, gs.get_instance().tick_counter)
 
-            neighbors = list(Utils.neighbors(cur[0], cur[1]))
-            random.shuffle(neighbors)
-
-            for n in neighbors:
-                if n in dists:
-                    continue
-                dists[n] = n_dist
-                if self.is_valid(*n) and (cond is None or cond(n)):
-                    backrefs[n] = cur
-                    q.append(n)
-
-            if p2 in backrefs:
-                break
-
-        if p2 in backrefs:
-            res = [p2]  # building the list in reverse
-            temp = backrefs[p2]
-            while temp is not None:
-                res.append(temp)
-                temp = backrefs[temp]
-            res.reverse()
-            return res
-        else:
-            return None
+        if self._player_dist_field is None or self._player_dist_field[0] != key:
+            field = pathfinding.compute_distance_field(p_pos, lambda xy: self.is_passable(*xy), max_dist=max_dist)
+            self._player_dist_field = (key, field)
+
+        return self._player_dist_field[1]
 
     def get_actors(self):
         res = []
-        for e in self.entities:
+        for e in self._entities.values():
             if e.is_actor():
                 res.append(e)
         res.sort(key=lambda a: a.get_uid())
@@ -592,7 +662,7 @@ class World:
 
     def flush_new_entity_additions(self):
         for e in self._ents_to_add:
-            self.entities.append(e)
+            self._index_entity(e)
             e._alive = True
         self._ents_to_add.clear()
 
@@ -603,7 +673,7 @@ class World:
 
         for e in self._ents_to_remove:
             e.cleanup()
-            self.entities.remove(e)  # n^2 but whatever
+            self._unindex_entity(e)
             e._alive = False
             if e in self._onscreen_entities:
                 self._onscreen_entities.remove(e)
@@ -622,7 +692,7 @@ class World:
         else:
             player_xy = self.to_grid_coords(*Utils.rect_center(cam_rect))
 
-        for e in self.entities:
+        for e in self._entities.values():
             on_camera = Utils.rect_contains(cam_rect, e.center())
 
             e_xy = self.to_grid_coords(*e.center())
@@ -0,0 +1,60 @@
+import os
+import traceback
+import multiprocessing
+import concurrent.futures
+
+from src.worldgen.pregen import TileGridBlueprint
+
+
+"""
+Generates lots of TileGrids at once, spread across all the CPU's cores (e.g. to test worldgen over many seeds).
+Each grid depends only on its seed, so any result can be replayed exactly with TileGridBlueprint.generate_dangerously.
+"""
+
+
+class BatchResult:
+
+    def __init__(self, blueprint, t_grid, error):
+        self.blueprint = blueprint
+        self.t_grid = t_grid  # None if generation failed
+        self.error = error    # the formatted exception if generation failed, else None
+
+    def seed(self):
+        return self.blueprint.seed
+
+    def is_ok(self):
+        return self.error is None
+
+
+def _generate_chunk(blueprints):
+    res = []
+    for blueprint in blueprints:
+        try:
+            res.append(BatchResult(blueprint, blueprint.generate_dangerously(), None))
+        except Exception:
+            res.append(BatchResult(blueprint, None, traceback.format_exc()))
+    return res
+
+
+def generate_tile_grids(level, dims, seeds, zone_id=None, n_story_npcs=0, n_workers=None, chunk_size=8):
+    """
+        generates a TileGrid for each seed, with no retries.
+
+        n_workers: number of worker processes (defaults to one per core). 1 means generate them in this process.
+        yields: a BatchResult for each seed, in the same order as the seeds, as soon as it's ready.
+    """
+    blueprints = [TileGridBlueprint(zone_id, level, dims, n_story_npcs, seed) for seed in seeds]
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers <= 1:
+        for blueprint in blueprints:
+            yield _generate_chunk([blueprint])[0]
+        return
+
+    chunks = [blueprints[i:i + chunk_size] for i in range(0, len(blueprints), chunk_size)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers,
+                                                mp_context=multiprocessing.get_context("spawn")) as executor:
+        for chunk_results in executor.map(_generate_chunk, chunks):
+            for result in chunk_results:
+                yield result
@@ -0,0 +1,146 @@
+import os
+import json
+
+import numpy
+
+import src.game.pathutils as pathutils
+
+
+"""
+Handbuilt zones are drawn as PNGs, which are slow to decode pixel by pixel. Each image gets compiled once into a
+CompiledBlueprint (which doesn't depend on the zone using it), and saved in the save data dir so that entering
+the zone again (even in a later session) only has to read that.
+"""
+
+# bump this whenever the compiled format (or the way images get compiled) changes
+_FORMAT_VERSION = 1
+
+_CACHE_SUBPATH = "cache/blueprints"
+
+_LOADED = {}  # source path -> (source key, CompiledBlueprint)
+
+
+class CompiledBlueprint:
+    """
+        geo: w x h array of World geo values, indexed by [x, y].
+        alt_art: w x h array of alt art ids, or -1 for none.
+        spawns: str kind -> n x 2 array of (x, y), in x-major order.
+        unknown_colors: n x 3 array of (r, g, b) for each color the compiler didn't recognize.
+        unknowns: n x 3 array of (x, y, index into unknown_colors), in x-major order.
+    """
+
+    def __init__(self, geo, alt_art, spawns, unknown_colors, unknowns):
+        self.geo = geo
+        self.alt_art = alt_art
+        self.spawns = spawns
+        self.unknown_colors = unknown_colors
+        self.unknowns = unknowns
+
+    def size(self):
+        return self.geo.shape
+
+    def get_spawns(self, kind):
+        """returns: list of (int x, int y)"""
+        if kind in self.spawns:
+            return [(x, y) for (x, y) in self.spawns[kind].tolist()]
+        else:
+            return []
+
+    def get_unknowns(self):
+        """returns: dict: (r, g, b) -> list of (int x, int y)"""
+        colors = [tuple(c) for c in self.unknown_colors.tolist()]
+        res = {}
+        for (x, y, idx) in self.unknowns.tolist():
+            if colors[idx] not in res:
+                res[colors[idx]] = []
+            res[colors[idx]].append((x, y))
+        return res
+
+    def to_arrays(self):
+        res = {"geo": self.geo,
+               "alt_art": self.alt_art,
+               "unknown_colors": self.unknown_colors,
+               "unknowns": self.unknowns}
+        for kind in self.spawns:
+            res["spawns_" + kind] = self.spawns[kind]
+        return res
+
+    @staticmethod
+    def from_arrays(arrays):
+        spawns = {}
+        for name in arrays:
+            if name.startswith("spawns_"):
+                spawns[name[len("spawns_"):]] = arrays[name]
+        return CompiledBlueprint(arrays["geo"], arrays["alt_art"], spawns,
+                                 arrays["unknown_colors"], arrays["unknowns"])
+
+
+def _source_key(source_path):
+    stat = os.stat(source_path)
+    return [_FORMAT_VERSION, stat.st_mtime_ns, stat.st_size]
+
+
+def _cache_path(cache_name):
+    return pathutils.get_save_data_path(with_subpath="{}/{}.bin".format(_CACHE_SUBPATH, cache_name))
+
+
+def _to_bytes(source_key, compiled):
+    """the format is one line of json describing the arrays, followed by the arrays' raw bytes (in that order)."""
+    arrays = compiled.to_arrays()
+    header = {"source_key": source_key,
+              "arrays": [[name, arrays[name].dtype.str, list(arrays[name].shape)] for name in arrays]}
+    chunks = [json.dumps(header).encode("utf-8"), b"\n"]
+    chunks.extend(numpy.ascontiguousarray(arrays[name]).tobytes() for name in arrays)
+    return b"".join(chunks)
+
+
+def _from_bytes(data, source_key):
+    """returns: the CompiledBlueprint, or None if it was compiled from a different version of the image."""
+    header_end = data.index(b"\n")
+    header = json.loads(data[:header_end].decode("utf-8"))
+    if header["source_key"] != source_key:
+        return None
+
+    arrays = {}
+    offs = header_end + 1
+    for (name, dtype, shape) in header["arrays"]:
+        count = int(numpy.prod(shape))
+        arrays[name] = numpy.frombuffer(data, dtype=dtype, count=count, offset=offs).reshape(shape)
+        offs += count * arrays[name].itemsize
+
+    return CompiledBlueprint.from_arrays(arrays)
+
+
+def _read_from_disk(cache_path, source_key):
+    return pathutils.read_cache_file(cache_path, lambda data: _from_bytes(data, source_key), "compiled blueprint")
+
+
+def _write_to_disk(cache_path, source_key, compiled):
+    pathutils.write_cache_file(cache_path, _to_bytes(source_key, compiled), "compiled blueprint")
+
+
+def get_compiled(source_path, cache_name, compiler, use_disk=True):
+    """
+        source_path: path to the image.
+        cache_name: name of the compiled file (should be unique per image).
+        compiler: lambda: str source_path -> CompiledBlueprint
+        returns: the CompiledBlueprint, recompiling it only if the image has changed since it was last compiled.
+    """
+    source_key = _source_key(source_path)
+    if source_path in _LOADED and _LOADED[source_path][0] == source_key:
+        return _LOADED[source_path][1]
+
+    cache_path = _cache_path(cache_name)
+    compiled = _read_from_disk(cache_path, source_key) if use_disk else None
+
+    if compiled is None:
+        compiled = compiler(source_path)
+        if use_disk:
+            _write_to_disk(cache_path, source_key, compiled)
+
+    _LOADED[source_path] = (source_key, compiled)
+    return compiled
+
+
+def clear_memory_cache():
+    _LOADED.clear()
@@ -0,0 +1,140 @@
+import random
+import time
+import traceback
+import multiprocessing
+import concurrent.futures
+
+
+"""
+Generates the next zone's TileGrid in a background process while the player is still in the current zone,
+so that walking through an exit door doesn't have to wait for worldgen.
+"""
+
+_instance = None
+
+
+def get_instance():
+    global _instance
+    if _instance is None:
+        _instance = ZonePregenerator()
+
+    return _instance
+
+
+class TileGridBlueprint:
+    """everything needed to generate a zone's TileGrid. it gets sent to another process, so keep it picklable."""
+
+    def __init__(self, zone_id, level, dims, n_story_npcs, seed):
+        self.zone_id = zone_id
+        self.level = level
+        self.dims = dims
+        self.n_story_npcs = n_story_npcs
+        self.seed = seed
+
+    def generate(self):
+        """returns: the TileGrid, which is always the same for the same blueprint."""
+        import src.worldgen.zones as zones
+        return zones.ZoneBuilder.generate_tile_grid(self.zone_id, self.level, dims=self.dims,
+                                                    n_story_npcs=self.n_story_npcs, rng=random.Random(self.seed))
+
+    def generate_dangerously(self):
+        """returns: the TileGrid, or raises an error if the seed doesn't produce a valid one."""
+        import src.worldgen.zones as zones
+        return zones.ZoneBuilder.generate_tile_grid_dangerously(self.zone_id, self.level, dims=self.dims,
+                                                                n_story_npcs=self.n_story_npcs,
+                                                                rng=random.Random(self.seed))
+
+    def __repr__(self):
+        return "{}[zone_id={}, level={}, dims={}, n_story_npcs={}, seed={}]".format(
+            type(self).__name__, self.zone_id, self.level, self.dims, self.n_story_npcs, self.seed)
+
+
+def _generate_in_worker(blueprint):
+    start_time = time.perf_counter()
+    t_grid = blueprint.generate()
+    return t_grid, time.perf_counter() - start_time
+
+
+class ZonePregenerator:
+
+    def __init__(self):
+        self._enabled = False
+        self._executor = None
+
+        # zone_id -> (TileGridBlueprint, Future). a job that's already running can't be cancelled, so it stays
+        # in here until it's taken or it finishes, in case the game ends up needing that zone after all.
+        self._jobs = {}
+
+    def is_enabled(self):
+        return self._enabled
+
+    def set_enabled(self, val):
+        self._enabled = val
+        if not val:
+            self.shutdown()
+
+    def request(self, zone_id):
+        """starts generating the zone's TileGrid in the background, if it's a generated zone."""
+        if not self._enabled:
+            return
+
+        if zone_id in self._jobs:
+            return  # already on it
+
+        self.cancel()
+
+        import src.worldgen.zones as zones
+        zone = zones.get_zone(zone_id, or_else=None) if zone_id is not None else None
+        blueprint = zone.get_tile_grid_blueprint() if zone is not None else None
+        if blueprint is None:
+            return
+
+        if self._executor is None:
+            # spawning (rather than forking) so the worker doesn't inherit our window and GL context
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+        print("INFO: pregenerating {}".format(blueprint))
+        self._jobs[zone_id] = (blueprint, self._executor.submit(_generate_in_worker, blueprint))
+
+    def take(self, zone_id):
+        """
+            returns: the zone's pregenerated TileGrid, or None if it wasn't requested or hasn't started yet. if it's
+                     in the middle of being generated, this waits for it, which is never slower than starting over.
+        """
+        if zone_id not in self._jobs:
+            return None
+
+        blueprint, future = self._jobs.pop(zone_id)
+
+        if not future.done() and future.cancel():
+            print("INFO: pregenerated tile grid for zone {} wasn't ready".format(zone_id))
+            return None
+
+        try:
+            t_grid, secs = future.result()
+        except concurrent.futures.CancelledError:
+            return None
+        except Exception:
+            print("WARN: failed to pregenerate tile grid for zone {}".format(zone_id))
+            traceback.print_exc()
+            return None
+
+        print("INFO: using pregenerated tile grid for zone {} (took {:.1f}ms in the background)".format(
+            zone_id, secs * 1000))
+        return t_grid
+
+    def cancel(self):
+        """cancels the jobs that haven't started, and forgets the finished ones. running jobs are kept."""
+        for zone_id in list(self._jobs.keys()):
+            future = self._jobs[zone_id][1]
+            if future.done() or future.cancel():
+                del self._jobs[zone_id]
+
+    def shutdown(self):
+        self.cancel()
+        self._jobs.clear()
+        if self._executor is not None:
+            # anything still running gets to finish in the background, but nothing waits on it
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -303,10 +303,12 @@ class WorldBlueprint:
 
     def build_world(self):
         w = World(*self.size)
+        floor_types = [[None] * self.size[1] for _ in range(0, self.size[0])]
+        wall_types = [[None] * self.size[1] for _ in range(0, self.size[0])]
+
         for x in range(0, self.size[0]):
             for y in range(0, self.size[1]):
                 xy_geo = self.geo[x][y]
-                w.set_geo(x, y, xy_geo)
 
                 alt_art = self.geo_alt_art[x][y]
                 if alt_art is None:
@@ -317,11 +319,11 @@ class WorldBlueprint:
 
                 if alt_art is not None:
                     if xy_geo == World.WALL:
-                        w.set_wall_type(alt_art, xy=(x, y))
+                        wall_types[x][y] = alt_art
                     elif xy_geo == World.FLOOR:
-                        w.set_floor_type(alt_art, xy=(x, y))
+                        floor_types[x][y] = alt_art
 
-                if self.geo[x][y] == World.DOOR:
+                if xy_geo == World.DOOR:
                     if (x, y) in self.sensor_doors:
                         door_ent = entities.SensorDoorEntity(x, y)
                     else:
@@ -333,6 +335,8 @@ class WorldBlueprint:
                                                        lambda _: music.play_song(door_music_id))
                     w.add(door_ent)
 
+        w.set_all_geo(self.geo, floor_types=floor_types, wall_types=wall_types)
+
         for spawn_pos in self.enemy_spawns:
             if self.enemy_supplier is None:
                 enemy = EnemyFactory.gen_enemy(None, self.level)
@@ -2,7 +2,10 @@ import re
 import random
 from sys import platform
 
+import numpy
+
 from src.utils.util import Utils
+import src.utils.profiling as profiling
 
 
 class TileType:
@@ -60,6 +63,13 @@ class Tileish:
     def is_valid(self, x, y):
         return 0 <= x < self.w() and 0 <= y < self.h()
 
+    def codes(self):
+        """returns: w x h array of the tiles' values as character codes (i.e. ord(val)), indexed by [x, y]."""
+        res = numpy.empty((self.w(), self.h()), dtype=numpy.uint8)
+        for (x, y) in self.coords():
+            res[x, y] = ord(self.get(x, y))
+        return res
+
     def __str__(self):
         res = []
         for y in range(0, self.h()):
@@ -249,32 +259,68 @@ class PartitionGrid:
         return str(self.partitions)
 
 
+_CODE_TO_VAL = [chr(i) for i in range(0, 256)]
+
+
+class TileView(Tileish):
+    """a tile-sized window into a TileGrid. reads and writes go straight through to the grid."""
+
+    def __init__(self, tile_grid, x_offs, y_offs):
+        self.tile_grid = tile_grid
+        self.x_offs = x_offs
+        self.y_offs = y_offs
+
+    def w(self):
+        return self.tile_grid.tile_size[0]
+
+    def h(self):
+        return self.tile_grid.tile_size[1]
+
+    def get(self, x, y):
+        if self.is_valid(x, y):
+            return self.tile_grid.get(self.x_offs + x, self.y_offs + y)
+        else:
+            return TileType.EMPTY
+
+    def set(self, x, y, val):
+        self.tile_grid.set(self.x_offs + x, self.y_offs + y, val)
+
+
 class TileGrid(Tileish):
+    """
+        all the tiles' cells are kept in a single array of character codes (i.e. ord(val)), indexed by [x, y].
+        tiles are copied in by set_tile, and only the first tile_size cells of each are used.
+    """
 
     def __init__(self, grid_w, grid_h, tile_size=(16, 16)):
         Tileish.__init__(self)
         self.tile_size = tile_size
-        self.tiles = [None] * grid_w
-        for i in range(0, len(self.tiles)):
-            self.tiles[i] = [None] * grid_h
+        self._grid_size = (grid_w, grid_h)
+        self._size = (tile_size[0] * grid_w, tile_size[1] * grid_h)
+
+        self._codes = numpy.full(self._size, ord(TileType.EMPTY), dtype=numpy.uint8)
+        self._has_tile = numpy.zeros(self._size, dtype=bool)  # cells that haven't had a tile set can only be empty
 
     def w(self):
-        return self.tile_size[0] * self.grid_w()
+        return self._size[0]
 
     def h(self):
-        return self.tile_size[1] * self.grid_h()
+        return self._size[1]
 
     def grid_w(self):
-        return len(self.tiles)
+        return self._grid_size[0]
 
     def grid_h(self):
-        return len(self.tiles[0])
+        return self._grid_size[1]
 
     def get_tile(self, grid_x, grid_y):
+        """returns: a TileView of the tile, or None if there's no tile there."""
         if 0 <= grid_x < self.grid_w() and 0 <= grid_y < self.grid_h():
-            return self.tiles[grid_x][grid_y]
-        else:
-            return None
+            x_offs = grid_x * self.tile_size[0]
+            y_offs = grid_y * self.tile_size[1]
+            if self._has_tile[x_offs, y_offs]:
+                return TileView(self, x_offs, y_offs)
+        return None
 
     def tile_at(self, x, y):
         if x < 0 or y < 0:
@@ -283,12 +329,10 @@ class TileGrid(Tileish):
             return self.get_tile(int(x / self.tile_size[0]), int(y / self.tile_size[1]))
 
     def get(self, x, y):
-        t = self.tile_at(x, y)
-        if t is None:
-            return TileType.EMPTY
+        if 0 <= x < self._size[0] and 0 <= y < self._size[1]:
+            return _CODE_TO_VAL[self._codes.item(x, y)]
         else:
-            rel_x, rel_y = self.rel_coords(x, y)
-            return t.get(rel_x, rel_y)
+            return TileType.EMPTY
 
     def rel_coords(self, x, y):
         rel_x = x % self.tile_size[0]
@@ -296,30 +340,48 @@ class TileGrid(Tileish):
         return (rel_x, rel_y)
 
     def set_tile(self, grid_x, grid_y, tile):
-        self.tiles[grid_x][grid_y] = tile
+        """copies the tile's values into the grid (so later changes to the tile won't show up here)."""
+        tw, th = self.tile_size
+        region = (slice(grid_x * tw, (grid_x + 1) * tw), slice(grid_y * th, (grid_y + 1) * th))
+        self._codes[region] = ord(TileType.EMPTY)
+        self._has_tile[region] = tile is not None
+
+        if tile is not None:
+            for x in range(0, min(tw, tile.w())):
+                for y in range(0, min(th, tile.h())):
+                    self._codes[grid_x * tw + x, grid_y * th + y] = ord(tile.get(x, y))
 
     def set(self, x, y, val):
-        t = self.tile_at(x, y)
-        if t is None:
-            if val is not TileType.EMPTY:
+        if 0 <= x < self._size[0] and 0 <= y < self._size[1] and self._has_tile.item(x, y):
+            self._codes[x, y] = ord(val)
+        elif val != TileType.EMPTY:
+            raise ValueError("tile is None at ({}, {})".format(x, y))
+
+    def set_where(self, mask, val):
+        """sets every cell where mask is True to val, as if by calling set on each (in x, then y order)."""
+        if val != TileType.EMPTY:
+            bad = mask & ~self._has_tile
+            if bad.any():
+                x, y = numpy.argwhere(bad)[0]
                 raise ValueError("tile is None at ({}, {})".format(x, y))
-            else:
-                return
-        else:
-            rel_x, rel_y = self.rel_coords(x, y)
-            t.set(rel_x, rel_y, val)
+        self._codes[mask] = ord(val)
+
+    def codes(self):
+        """note: the returned array is the grid's actual storage, not a copy."""
+        return self._codes
 
 
 class GridBuilder:
 
     @staticmethod
-    def random_path_between(p1, p2, w, h):
+    def random_path_between(p1, p2, w, h, rng=None):
+        rng = rng if rng is not None else random
         path = [p1]
         bad = []
         while path[-1] != p2:
             cur = path[-1]
             neighbors = list(Utils.neighbors(cur[0], cur[1]))
-            random.shuffle(neighbors)
+            rng.shuffle(neighbors)
 
             added_n = False
             while not added_n and len(neighbors) > 0:
@@ -337,13 +399,17 @@ class GridBuilder:
         return path
 
     @staticmethod
-    def random_partition_grid(w, h, start=None, end=None, fully_connected=True):
-        """returns: (path, partition_grid)"""
-        start = start if start is not None else (random.randint(0, w - 1), random.randint(0, h - 1))
-        end = end if end is not None else (random.randint(0, w - 1), random.randint(0, h - 1))
+    def random_partition_grid(w, h, start=None, end=None, fully_connected=True, rng=None):
+        """
+            rng: the random.Random to use (defaults to the global one).
+            returns: (path, partition_grid)
+        """
+        rng = rng if rng is not None else random
+        start = start if start is not None else (rng.randint(0, w - 1), rng.randint(0, h - 1))
+        end = end if end is not None else (rng.randint(0, w - 1), rng.randint(0, h - 1))
 
         p_grid = PartitionGrid(w, h)
-        path = GridBuilder.random_path_between(start, end, w, h)
+        path = GridBuilder.random_path_between(start, end, w, h, rng=rng)
 
         entry_door = None
         for path_idx in range(0, len(path)):
@@ -363,7 +429,7 @@ class GridBuilder:
             if path_idx < len(path) - 1:
                 next_path = path[path_idx + 1]
                 direction = (next_path[0] - cur_path[0], next_path[1] - cur_path[1])
-                exit_door = random.choice(Tile.doors_on_side(direction))
+                exit_door = rng.choice(Tile.doors_on_side(direction))
                 force_enabled.append(exit_door)
                 if entry_door is not None:
                     force_connected = [entry_door, exit_door]
@@ -373,12 +439,13 @@ class GridBuilder:
             p = Partition.random_partition(force_valid=True,
                                            force_doors=force_enabled,
                                            force_not_doors=force_disabled,
-                                           force_connected=force_connected)
+                                           force_connected=force_connected,
+                                           rng=rng)
 
             p_grid.set(cur_path[0], cur_path[1], p)
 
         empty_coords = [xy for xy in RectUtils.coords_in_rect([0, 0, w, h]) if p_grid.get(xy[0], xy[1]) is None]
-        random.shuffle(empty_coords)
+        rng.shuffle(empty_coords)
 
         for (x, y) in empty_coords:
             door_req = p_grid.needed_doors(x, y)
@@ -391,7 +458,8 @@ class GridBuilder:
                     force_disabled.append(i)
             p = Partition.random_partition(force_valid=True,
                                            force_doors=force_enabled,
-                                           force_not_doors=force_disabled)
+                                           force_not_doors=force_disabled,
+                                           rng=rng)
             p_grid.set(x, y, p)
 
         if fully_connected:
@@ -506,6 +574,118 @@ class RectUtils:
         return True
 
 
+class TileBits:
+    """
+        encodes which cells of a Tile are passable (floor or door) as the bits of an int (bit x + y * w),
+        so connectivity can be checked with a handful of big int operations instead of a flood fill.
+    """
+
+    _ALL = {}  # (w, h, door_offs, door_len) -> TileBits
+
+    def __init__(self, w, h, door_coords):
+        self.w = w
+        self.h = h
+        self.full = (1 << (w * h)) - 1
+
+        first_col = sum(1 << (y * w) for y in range(0, h))
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~(first_col << (w - 1))
+
+        self.door_bits = [self.bit(*door_coords[d]) for d in range(0, 8)]
+
+    @staticmethod
+    def for_tile(tile):
+        key = (tile.w(), tile.h(), tile._door_offs, tile._door_length)
+        if key not in TileBits._ALL:
+            TileBits._ALL[key] = TileBits(tile.w(), tile.h(), [tile.door_coords(d)[0] for d in range(0, 8)])
+        return TileBits._ALL[key]
+
+    def bit(self, x, y):
+        if 0 <= x < self.w and 0 <= y < self.h:
+            return 1 << (x + y * self.w)
+        else:
+            return 0
+
+    def coords_to_bits(self, xy_coords):
+        res = 0
+        for (x, y) in xy_coords:
+            res |= self.bit(x, y)
+        return res
+
+    def rect_bits(self, rect):
+        x1 = max(0, rect[0])
+        x2 = min(self.w, rect[0] + rect[2])
+        if x2 <= x1:
+            return 0
+
+        row = ((1 << (x2 - x1)) - 1) << x1
+        res = 0
+        for y in range(max(0, rect[1]), min(self.h, rect[1] + rect[3])):
+            res |= row << (y * self.w)
+        return res
+
+    def tile_to_bits(self, tile):
+        res = 0
+        for x in range(0, self.w):
+            col = tile.grid[x]
+            for y in range(0, self.h):
+                if col[y] == TileType.FLOOR or col[y] == TileType.DOOR:
+                    res |= 1 << (x + y * self.w)
+        return res
+
+    def flood(self, bits, start):
+        """returns: the bits reachable from start (which must be a subset of bits)."""
+        w = self.w
+        reach = start
+        while True:
+            grown = (reach | ((reach << 1) & self.not_first_col) | ((reach >> 1) & self.not_last_col)
+                     | (reach << w) | (reach >> w)) & bits
+            if grown == reach:
+                return reach
+            reach = grown
+
+    def partition_groups(self, bits):
+        """returns: the doors grouped by which ones are connected, sorted the same way as Partition.p"""
+        res = []
+        remaining = [d for d in range(0, 8) if bits & self.door_bits[d]]
+        while len(remaining) > 0:
+            reach = self.flood(bits, self.door_bits[remaining[0]])
+            group = [d for d in remaining if reach & self.door_bits[d]]
+            remaining = [d for d in remaining if not reach & self.door_bits[d]]
+            res.append(group)
+        res.sort()
+        return res
+
+
+class _FloorTemplate:
+    """
+        the results of basic_floor_fill for a single partition: the tile before any of the toggle zones are
+        applied, and which combinations of toggle zones give the right partition.
+    """
+
+    def __init__(self, base_grid, toggle_zones, valid):
+        self.base_grid = base_grid
+        self.toggle_zones = toggle_zones  # list of lists of (x, y)
+        self.valid = valid  # set of ints, where bit i means toggle zone i is filled with floor
+        self._layouts = {}  # int -> grid
+
+    def n_combos(self):
+        return 2 ** len(self.toggle_zones)
+
+    def get_layout(self, combo):
+        if combo not in self._layouts:
+            grid = [list(col) for col in self.base_grid]
+            for i in range(0, len(self.toggle_zones)):
+                val = TileType.FLOOR if (combo >> i) & 1 else TileType.EMPTY
+                for (x, y) in self.toggle_zones[i]:
+                    grid[x][y] = val
+            self._layouts[combo] = grid
+        return self._layouts[combo]
+
+
+_FLOOR_TEMPLATES = {}  # (tile w, tile h, door_offs, door_len, partition groups) -> _FloorTemplate
+
+
 class TileFiller:
 
     @staticmethod
@@ -559,7 +739,7 @@ class TileFiller:
                     tile.set(x, y, TileType.EMPTY)
 
     @staticmethod
-    def basic_floor_fill(tile, partition):
+    def _build_floor_template(tile, partition):
         TileFiller.basic_door_fill(tile, partition)
         unfilled_hubs = [0, 2, 4, 6]
         for i in range(0, 8):
@@ -577,42 +757,71 @@ class TileFiller:
         for hub in unfilled_hubs:
             toggle_zones.append([xy for xy in tile.hub_coords(hub)])
 
-        enabled = []
-        for i in range(0, 2**len(toggle_zones)):  # very nice efficiency!
-            enabled.append([min(2**j & i, 1) for j in range(0, len(toggle_zones))])
-        random.shuffle(enabled)
-        enabled.sort(key=lambda v: sum(v))
+        tile_bits = TileBits.for_tile(tile)
+        base_bits = tile_bits.tile_to_bits(tile)
+        zone_bits = [tile_bits.coords_to_bits(zone) for zone in toggle_zones]
 
-        for zone_toggle in enabled:
+        valid = set()
+        for combo in range(0, 2 ** len(toggle_zones)):
+            bits = base_bits
             for i in range(0, len(toggle_zones)):
-                for (x, y) in toggle_zones[i]:
-                    if zone_toggle[i]:
-                        tile.set(x, y, TileType.FLOOR)
-                    else:
-                        tile.set(x, y, TileType.EMPTY)
-            if TileFiller.calculate_partition(tile) == partition:
-                return
+                if (combo >> i) & 1:
+                    bits |= zone_bits[i]
+                else:
+                    bits &= ~zone_bits[i]
+            if tile_bits.partition_groups(bits) == partition.p:
+                valid.add(combo)
+
+        return _FloorTemplate([list(col) for col in tile.grid], toggle_zones, valid)
+
+    @staticmethod
+    def basic_floor_fill(tile, partition, rng=None):
+        """fills in the fewest toggle zones that connect the tile's doors into the given partition."""
+        rng = rng if rng is not None else random
+
+        key = (tile.w(), tile.h(), tile._door_offs, tile._door_length, tuple(tuple(g) for g in partition.p))
+        if key not in _FLOOR_TEMPLATES:
+            _FLOOR_TEMPLATES[key] = TileFiller._build_floor_template(tile, partition)
+        template = _FLOOR_TEMPLATES[key]
+
+        # combos are tried in a random order, smallest first
+        combos = [i for i in range(0, template.n_combos())]
+        rng.shuffle(combos)
+        combos.sort(key=lambda c: bin(c).count("1"))
+
+        chosen = combos[-1]  # if nothing works, the tile is left with the last combo that was tried
+        for combo in combos:
+            if combo in template.valid:
+                chosen = combo
+                break
+
+        tile.grid = [list(col) for col in template.get_layout(chosen)]
 
     @staticmethod
     def basic_room_fill(tile, partition, min_rooms=1, max_rooms=4, iter_limit=300,
-                        min_size=3, max_size=6, disjoint_rooms=True, connected_rooms=True):
+                        min_size=3, max_size=6, disjoint_rooms=True, connected_rooms=True, rng=None):
         """
         disjoint_rooms: if True, forces rooms to be non-overlapping
         connected_rooms: if True, forces rooms to be touching existing floor tiles
+        rng: the random.Random to use (defaults to the global one)
         returns: list of room rectangles"""
-        TileFiller.basic_floor_fill(tile, partition)
+        rng = rng if rng is not None else random
+        TileFiller.basic_floor_fill(tile, partition, rng=rng)
 
-        n = random.randint(min_rooms, max_rooms)
+        tile_bits = TileBits.for_tile(tile)
+        cur_bits = tile_bits.tile_to_bits(tile)
+
+        n = rng.randint(min_rooms, max_rooms)
         iteration = 0
 
         rooms_placed = []
 
         while n > 0 and iteration < iter_limit:
             iteration += 1
-            w = random.randint(min_size, max_size)
-            h = random.randint(min_size, max_size)
-            x = random.randint(1, tile.w() - w - 2)
-            y = random.randint(1, tile.h() - h - 2)
+            w = rng.randint(min_size, max_size)
+            h = rng.randint(min_size, max_size)
+            x = rng.randint(1, tile.w() - w - 2)
+            y = rng.randint(1, tile.h() - h - 2)
 
             room_rect = [x, y, w, h]
 
@@ -625,33 +834,63 @@ class TileFiller:
                 if bad_intersect:
                     continue
 
+            # (at this point, the tile's only non-empty cells are floors and doors)
+            room_bits = tile_bits.rect_bits(room_rect)
+
             if connected_rooms:
-                not_connected = True
-                for (x, y) in RectUtils.coords_around_rect(room_rect):
-                    if tile.get(x, y) != TileType.EMPTY:
-                        not_connected = False
-                        break
-                if not_connected:
+                around_bits = tile_bits.coords_to_bits(RectUtils.coords_around_rect(room_rect))
+                if cur_bits & around_bits == 0:
                     continue
 
-            was_empty = []
-            for xy in RectUtils.coords_in_rect(room_rect):
-                if tile.get(xy[0], xy[1]) == TileType.EMPTY:
-                    was_empty.append(xy)
-                    tile.set(xy[0], xy[1], TileType.FLOOR)
-
-            if TileFiller.calculate_partition(tile) == partition:
+            new_bits = cur_bits | room_bits
+            if tile_bits.partition_groups(new_bits) == partition.p:
                 # added a room successfully!
+                for xy in RectUtils.coords_in_rect(room_rect):
+                    tile.replace(xy[0], xy[1], TileType.EMPTY, TileType.FLOOR)
+                cur_bits = new_bits
                 rooms_placed.append(room_rect)
                 n -= 1
-            else:
-                for xy in was_empty:
-                    tile.set(xy[0], xy[1], TileType.EMPTY)
+
+        stats = profiling.get_worldgen_stats()
+        stats.count("room_fill.calls")
+        stats.count("room_fill.iterations", iteration)
+        if n > 0:
+            stats.count("room_fill.hit_iter_limit")
 
         return rooms_placed
 
 
+def _neighbor_views(arr, fill, and_diags=False):
+    """returns: list of arrays the same shape as arr, holding each cell's neighbor (or fill, past the edges)."""
+    w, h = arr.shape
+    padded = numpy.pad(arr, 1, constant_values=fill)
+    offsets = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+    if and_diags:
+        offsets.extend([(1, 1), (-1, 1), (-1, -1), (1, -1)])
+    return [padded[1 + dx:1 + dx + w, 1 + dy:1 + dy + h] for (dx, dy) in offsets]
+
+
+def _label_regions(mask):
+    """
+        labels the 4-connected regions of mask, without scipy.
+        returns: int array the same shape as mask, with a distinct label for each region (and -1 outside mask).
+    """
+    n = mask.size
+    idxs = numpy.arange(0, n).reshape(mask.shape)
+    labels = numpy.where(mask, idxs, n)
+
+    while True:
+        # every cell takes the smallest label around it, then jumps to whatever that cell's label is
+        new_labels = numpy.minimum.reduce([labels] + _neighbor_views(labels, n))
+        new_labels = numpy.where(mask, new_labels, n)
+        new_labels = numpy.where(mask, numpy.append(new_labels.ravel(), n)[new_labels], n)
+        if numpy.array_equal(new_labels, labels):
+            return numpy.where(mask, labels, -1)
+        labels = new_labels
+
+
 class TileGridBuilder:
+    """note: the whole-grid passes work directly on a TileGrid's array of codes."""
 
     @staticmethod
     def is_dangly(x, y, tile_grid):
@@ -666,18 +905,27 @@ class TileGridBuilder:
 
     @staticmethod
     def clean_up_dangly_bits(tile_grid, source_xy=None):
+        """repeatedly empties non-empty cells that have at most one non-empty neighbor."""
         if source_xy is not None:
-            if TileGridBuilder.is_dangly(source_xy[0], source_xy[1], tile_grid):
-                tile_grid.set(source_xy[0], source_xy[1], TileType.EMPTY)
-                for n in Utils.neighbors(source_xy[0], source_xy[1]):
-                    TileGridBuilder.clean_up_dangly_bits(tile_grid, source_xy=n)
-            else:
-                return
+            q = [source_xy]
+            while len(q) > 0:
+                x, y = q.pop()
+                if TileGridBuilder.is_dangly(x, y, tile_grid):
+                    tile_grid.set(x, y, TileType.EMPTY)
+                    q.extend(Utils.neighbors(x, y))
         else:
-            for x in range(0, tile_grid.w()):
-                for y in range(0, tile_grid.h()):
-                    if TileGridBuilder.is_dangly(x, y, tile_grid):
-                        TileGridBuilder.clean_up_dangly_bits(tile_grid, source_xy=(x, y))
+            # removing a cell can only make its neighbors danglier, so the order cells get removed in doesn't matter
+            codes = tile_grid.codes()
+            was_filled = codes != ord(TileType.EMPTY)
+            filled = was_filled.copy()
+            while True:
+                n_neighbors = sum(n.astype(numpy.int8) for n in _neighbor_views(filled, False))
+                dangly = filled & (n_neighbors <= 1)
+                if not dangly.any():
+                    break
+                filled &= ~dangly
+
+            tile_grid.set_where(was_filled & ~filled, TileType.EMPTY)
 
     @staticmethod
     def is_valid_door_coord(x, y, tile_grid):
@@ -690,23 +938,30 @@ class TileGridBuilder:
 
     @staticmethod
     def clean_up_doors(tile_grid):
-        for x in range(0, tile_grid.w()):
-            for y in range(0, tile_grid.h()):
-                if tile_grid.get(x, y) == TileType.DOOR and not TileGridBuilder.is_valid_door_coord(x, y, tile_grid):
-                    tile_grid.set(x, y, TileType.FLOOR)
+        """turns doors that aren't between two floors (and two empties) into floors."""
+        codes = tile_grid.codes()
+        doors = codes == ord(TileType.DOOR)
+        right, down, left, up = _neighbor_views(codes, ord(TileType.EMPTY))
+        floor, empty = ord(TileType.FLOOR), ord(TileType.EMPTY)
+
+        horz_door = (left == floor) & (right == floor) & (up == empty) & (down == empty)
+        vert_door = (up == floor) & (down == floor) & (left == empty) & (right == empty)
+        invalid = doors & (horz_door == vert_door)
+
+        # a door next to another door depends on whether that one got changed first, so those are done in order
+        touching_doors = doors & numpy.logical_or.reduce(_neighbor_views(doors, False))
+        tile_grid.set_where(invalid & ~touching_doors, TileType.FLOOR)
+
+        for (x, y) in numpy.argwhere(touching_doors):
+            if not TileGridBuilder.is_valid_door_coord(x, y, tile_grid):
+                tile_grid.set(x, y, TileType.FLOOR)
 
     @staticmethod
     def add_walls(tile_grid):
-        needs_walls = []
-        for x in range(0, tile_grid.w()):
-            for y in range(0, tile_grid.h()):
-                if (tile_grid.get(x, y) == TileType.EMPTY):
-                    for n in Utils.neighbors(x, y, and_diags=True):
-                        if tile_grid.get(n[0], n[1]) != TileType.EMPTY:
-                            needs_walls.append((x, y))
-                            continue
-        for (x, y) in needs_walls:
-            tile_grid.set(x, y, TileType.WALL)
+        codes = tile_grid.codes()
+        filled = codes != ord(TileType.EMPTY)
+        touches_filled = numpy.logical_or.reduce(_neighbor_views(filled, False, and_diags=True))
+        tile_grid.set_where(~filled & touches_filled, TileType.WALL)
 
     @staticmethod
     def flood_search(tile_grid, x, y, on_values):
@@ -729,27 +984,24 @@ class TileGridBuilder:
 
     @staticmethod
     def fill_empty_islands_with_walls(tile_grid, smaller_than=16):
-        seen = set()
-        for x in range(0, tile_grid.w()):
-            for y in range(0, tile_grid.h()):
-                if (x, y) in seen:
-                    continue
-                island = TileGridBuilder.flood_search(tile_grid, x, y, (TileType.EMPTY))
-                seen.update(island)
-                if 0 < len(island) < smaller_than:
-                    for pos in island:
-                        tile_grid.set(pos[0], pos[1], TileType.WALL)
+        empty = tile_grid.codes() == ord(TileType.EMPTY)
+        if not empty.any():
+            return
+
+        labels = _label_regions(empty)
+        sizes = numpy.bincount(labels[empty])
+        tile_grid.set_where(empty & (sizes[numpy.maximum(labels, 0)] < smaller_than), TileType.WALL)
 
     @staticmethod
     def search(tile_grid, for_values):
         """returns: all coordinates in the tile grid with the given values"""
-        res = set()
-
-        for xy in tile_grid.coords():
-            if for_values is None or tile_grid.get(xy[0], xy[1]) in for_values:
-                res.add(xy)
+        codes = tile_grid.codes()
+        if for_values is None:
+            found = numpy.ones(codes.shape, dtype=bool)
+        else:
+            found = numpy.isin(codes, [ord(val) for val in for_values])
 
-        return res
+        return set((int(x), int(y)) for (x, y) in numpy.argwhere(found))
 
 
 _ALL_FEATURES = {}  # feat_id -> Feature
@@ -773,6 +1025,9 @@ class Feature(Tileish):
 
         self._validate()
 
+        self._rotations = {}  # rots -> Feature
+        self._compiled = None
+
         # don't overwrite a feature when we're producing a rotated version~
         if self.feat_id not in _ALL_FEATURES:
             _ALL_FEATURES[self.feat_id] = self
@@ -835,6 +1090,11 @@ class Feature(Tileish):
         elif not self.can_rotate:
             return ValueError("can't rotate feature: {}".format(self.feat_id))
 
+        if rots not in self._rotations:
+            self._rotations[rots] = self._rotated_once().rotated(rots=rots-1)
+        return self._rotations[rots]
+
+    def _rotated_once(self):
         replace = ["" for _ in range(0, self.w())]
         place = ["" for _ in range(0, self.w())]
 
@@ -848,7 +1108,28 @@ class Feature(Tileish):
                        max_level=self._max_level,
                        min_level=self._min_level,
                        max_per_zone=self._max_per_zone,
-                       on_critical_path=self._on_critical_path_only).rotated(rots=rots-1)
+                       on_critical_path=self._on_critical_path_only)
+
+    def compiled(self):
+        """
+            returns: (codes, wildcard_mask, cells), where codes is a w x h array of the replace values as character
+                     codes, wildcard_mask is True where the feature doesn't care, and cells is a list of
+                     (x, y, code) for the cells it does care about.
+        """
+        if self._compiled is None:
+            codes = numpy.zeros((self.w(), self.h()), dtype=numpy.uint8)
+            wildcard_mask = numpy.zeros((self.w(), self.h()), dtype=bool)
+            cells = []
+            for feat_x in range(0, self.w()):
+                for feat_y in range(0, self.h()):
+                    feat_val = self.get(feat_x, feat_y)
+                    if feat_val == "?":
+                        wildcard_mask[feat_x, feat_y] = True
+                    else:
+                        codes[feat_x, feat_y] = ord(feat_val)
+                        cells.append((feat_x, feat_y, ord(feat_val)))
+            self._compiled = (codes, wildcard_mask, cells)
+        return self._compiled
 
     def can_place_at(self, tilish, x, y):
         for feat_x in range(0, self.w()):
@@ -870,31 +1151,55 @@ class FeatureUtils:
 
     @staticmethod
     def all_possible_placements_overlapping_rect(feature, tilish, rect):
-        """returns: list of valid feature placements (x, y)"""
-        res = []
-        for x in range(rect[0] - feature.w() + 1, rect[0] + rect[2]):
-            for y in range(rect[1] - feature.h(), rect[1] + rect[3]):
-                if feature.can_place_at(tilish, x, y):
-                    res.append((x, y))
-        return res
+        """returns: list of valid feature placements (x, y), in the same order as checking each with can_place_at."""
+        x1, x2 = rect[0] - feature.w() + 1, rect[0] + rect[2]
+        y1, y2 = rect[1] - feature.h(), rect[1] + rect[3]
+        if x2 <= x1 or y2 <= y1:
+            return []
+
+        # the part of the grid the feature could touch, where 0 (which matches nothing) means out of bounds
+        codes = tilish.codes()
+        win_w = x2 - x1 + feature.w() - 1
+        win_h = y2 - y1 + feature.h() - 1
+        window = numpy.zeros((win_w, win_h), dtype=numpy.uint8)
+        cx1, cy1 = max(0, x1), max(0, y1)
+        cx2, cy2 = min(codes.shape[0], x1 + win_w), min(codes.shape[1], y1 + win_h)
+        if cx1 < cx2 and cy1 < cy2:
+            window[cx1 - x1:cx2 - x1, cy1 - y1:cy2 - y1] = codes[cx1:cx2, cy1:cy2]
+
+        n_x, n_y = x2 - x1, y2 - y1
+        matches = numpy.ones((n_x, n_y), dtype=bool)
+        for (feat_x, feat_y, code) in feature.compiled()[2]:
+            matches &= window[feat_x:feat_x + n_x, feat_y:feat_y + n_y] == code
+
+        return [(x1 + int(i), y1 + int(j)) for (i, j) in numpy.argwhere(matches)]
 
     @staticmethod
-    def try_to_place_feature_into_rect(feature, tilish, rect):
+    def try_to_place_feature_into_rect(feature, tilish, rect, rng=None):
+        rng = rng if rng is not None else random
         rots = [0]
         if feature.can_rotate:
             rots.extend([1, 2, 3])
 
-        random.shuffle(rots)
+        rng.shuffle(rots)
         for rot in rots:
             rotated_feature = feature.rotated(rot)
             possible_placements = FeatureUtils.all_possible_placements_overlapping_rect(rotated_feature, tilish, rect)
             if len(possible_placements) > 0:
-                placement = random.choice(possible_placements)
+                placement = rng.choice(possible_placements)
                 FeatureUtils.write_into(rotated_feature, tilish, placement[0], placement[1])
+                FeatureUtils._count_placement(feature, True)
                 return True
 
+        FeatureUtils._count_placement(feature, False)
         return False
 
+    @staticmethod
+    def _count_placement(feature, did_place):
+        stats = profiling.get_worldgen_stats()
+        if stats.is_enabled():
+            stats.count("feature_placement.{}.{}".format(feature.feat_id, "placed" if did_place else "failed"))
+
     @staticmethod
     def write_into(feature, tile_grid, x, y):
         for feat_x in range(0, feature.w()):
@@ -988,7 +1293,8 @@ class Features:
                         min_level=3, max_per_zone=3)
 
     @staticmethod
-    def get_random_feature(at_level=None, current_counts=None):
+    def get_random_feature(at_level=None, current_counts=None, rng=None):
+        rng = rng if rng is not None else random
         weighted_feats = []
         for feat_id in _ALL_FEATURES:
             cur_count = 0
@@ -1000,7 +1306,7 @@ class Features:
                 weighted_feats.append(feat_id)
 
         if len(weighted_feats) > 0:
-            return _ALL_FEATURES[random.choice(weighted_feats)]
+            return _ALL_FEATURES[rng.choice(weighted_feats)]
         else:
             print("WARN: no valid features for level: {}" + at_level)
             return None
@@ -1093,7 +1399,9 @@ class Partition:
             return Partition(new_p)
 
     @staticmethod
-    def random_partition(force_valid=True, min_doors=0, max_doors=8, force_doors=[], force_not_doors=[], force_connected=[]):
+    def random_partition(force_valid=True, min_doors=0, max_doors=8, force_doors=[], force_not_doors=[], force_connected=[],
+                         rng=None):
+        rng = rng if rng is not None else random
 
         p = None
         while p is None or (force_valid and not p.is_valid()):
@@ -1101,13 +1409,13 @@ class Partition:
             doors = [i for i in range(0, 8) if i in force_doors or i in force_connected]
             optional_doors = [i for i in range(0, 8) if (i not in doors and i not in force_not_doors)]
 
-            to_choose = random.randint(min_doors - len(doors), max_doors - len(doors))
+            to_choose = rng.randint(min_doors - len(doors), max_doors - len(doors))
             if to_choose < 0:
                 to_choose = 0
             elif to_choose > len(optional_doors):
                 to_choose = len(optional_doors)
 
-            doors.extend(random.sample(optional_doors, to_choose))
+            doors.extend(rng.sample(optional_doors, to_choose))
 
             if len(doors) == 0:
                 return Partition([])
@@ -1124,17 +1432,17 @@ class Partition:
                 else:
                     return Partition([])
 
-            n_groups = 1 + int((len(doors) - 1) * random.random())
-            random.shuffle(doors)
+            n_groups = 1 + int((len(doors) - 1) * rng.random())
+            rng.shuffle(doors)
             for i in range(0, n_groups):
                 res.append([doors[i]])
 
             if n_groups < len(doors):
                 for i in range(n_groups, len(doors)):
-                    res[int(n_groups * random.random())].append(doors[i])
+                    res[int(n_groups * rng.random())].append(doors[i])
 
             if len(force_connected) > 0:
-                i = random.randint(0, n_groups)
+                i = rng.randint(0, n_groups)
                 if i == n_groups:
                     res.append(list(force_connected))
                 else:
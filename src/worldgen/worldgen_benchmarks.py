@@ -0,0 +1,312 @@
+import random
+import time
+
+import src.worldgen.worldgen2 as worldgen2
+from src.worldgen.worldgen2 import TileType, TileFiller, RectUtils
+from src.utils.util import Utils
+
+
+"""
+Benchmarks for worldgen, checked against the original (slower) implementations.
+
+Run with: python -m src.worldgen.worldgen_benchmarks
+"""
+
+
+def _reference_basic_floor_fill(tile, partition, rng):
+    TileFiller.basic_door_fill(tile, partition)
+    unfilled_hubs = [0, 2, 4, 6]
+    for i in range(0, 8):
+        if partition.has_door(i):
+            door_coords = tile.door_coords(i)
+            hub_coords = tile.hub_coords(i)
+            full_rect = RectUtils.rect_containing(door_coords + hub_coords)
+            for (x, y) in RectUtils.coords_in_rect(full_rect):
+                tile.replace(x, y, TileType.EMPTY, TileType.FLOOR)
+
+            if int(i/2) in unfilled_hubs:
+                unfilled_hubs.remove((i + i % 2) % 8)
+
+    toggle_zones = [tile.hub_connection_coords(i) for i in range(0, 4)]
+    for hub in unfilled_hubs:
+        toggle_zones.append([xy for xy in tile.hub_coords(hub)])
+
+    enabled = []
+    for i in range(0, 2**len(toggle_zones)):
+        enabled.append([min(2**j & i, 1) for j in range(0, len(toggle_zones))])
+    rng.shuffle(enabled)
+    enabled.sort(key=lambda v: sum(v))
+
+    for zone_toggle in enabled:
+        for i in range(0, len(toggle_zones)):
+            for (x, y) in toggle_zones[i]:
+                if zone_toggle[i]:
+                    tile.set(x, y, TileType.FLOOR)
+                else:
+                    tile.set(x, y, TileType.EMPTY)
+        if TileFiller.calculate_partition(tile) == partition:
+            return
+
+
+def _reference_basic_room_fill(tile, partition, rng, min_rooms=1, max_rooms=4, iter_limit=300,
+                               min_size=3, max_size=6):
+    _reference_basic_floor_fill(tile, partition, rng)
+
+    n = rng.randint(min_rooms, max_rooms)
+    iteration = 0
+    rooms_placed = []
+
+    while n > 0 and iteration < iter_limit:
+        iteration += 1
+        w = rng.randint(min_size, max_size)
+        h = rng.randint(min_size, max_size)
+        x = rng.randint(1, tile.w() - w - 2)
+        y = rng.randint(1, tile.h() - h - 2)
+        room_rect = [x, y, w, h]
+
+        if any(RectUtils.rects_intersect(room_rect, r) for r in rooms_placed):
+            continue
+        if all(tile.get(x, y) == TileType.EMPTY for (x, y) in RectUtils.coords_around_rect(room_rect)):
+            continue
+
+        was_empty = []
+        for xy in RectUtils.coords_in_rect(room_rect):
+            if tile.get(xy[0], xy[1]) == TileType.EMPTY:
+                was_empty.append(xy)
+                tile.set(xy[0], xy[1], TileType.FLOOR)
+
+        if TileFiller.calculate_partition(tile) == partition:
+            rooms_placed.append(room_rect)
+            n -= 1
+        else:
+            for xy in was_empty:
+                tile.set(xy[0], xy[1], TileType.EMPTY)
+
+    return rooms_placed
+
+
+def _random_partitions(n, seed):
+    rng = random.Random(seed)
+    res = []
+    for _ in range(0, n):
+        forced = rng.sample(range(0, 8), rng.randint(1, 3))
+        res.append(worldgen2.Partition.random_partition(force_valid=True, force_doors=forced, rng=rng))
+    return res
+
+
+def bench_room_fill(n_tiles=300, t_size=12, seed=404):
+    """fills tiles with rooms for a bunch of random partitions, the way zones do it."""
+    partitions = _random_partitions(n_tiles, seed)
+
+    # make sure the cached fill produces exactly the same tiles (and uses the rng the same way)
+    for i in range(0, n_tiles):
+        ref_tile = worldgen2.Tile(t_size + 1, door_len=1, door_offs=3)
+        ref_rng = random.Random(seed + i)
+        ref_rooms = _reference_basic_room_fill(ref_tile, partitions[i], ref_rng)
+
+        tile = worldgen2.Tile(t_size + 1, door_len=1, door_offs=3)
+        rng = random.Random(seed + i)
+        rooms = TileFiller.basic_room_fill(tile, partitions[i], rng=rng)
+
+        if ref_tile.grid != tile.grid or ref_rooms != rooms or ref_rng.getstate() != rng.getstate():
+            raise ValueError("room fill mismatch for {}\nexpected:\n{}\ngot:\n{}".format(partitions[i], ref_tile, tile))
+
+    def run(fill_func, seed_offset):
+        start = time.perf_counter()
+        for i in range(0, n_tiles):
+            fill_func(worldgen2.Tile(t_size + 1, door_len=1, door_offs=3), partitions[i],
+                      random.Random(seed + seed_offset + i))
+        return (time.perf_counter() - start) / n_tiles
+
+    cold_templates = len(worldgen2._FLOOR_TEMPLATES)
+    ref_time = run(_reference_basic_room_fill, n_tiles)
+    cached_time = run(lambda t, p, r: TileFiller.basic_room_fill(t, p, rng=r), n_tiles)
+
+    print("INFO: basic_room_fill ({} tiles, {} distinct partitions):\treference={:.2f}ms\t"
+          "cached={:.3f}ms\t({:.1f}x)".format(n_tiles, cold_templates, ref_time * 1000, cached_time * 1000,
+                                              ref_time / max(cached_time, 1e-9)))
+
+    start = time.perf_counter()
+    worldgen2._FLOOR_TEMPLATES.clear()
+    for p in partitions:
+        TileFiller.basic_floor_fill(worldgen2.Tile(t_size + 1, door_len=1, door_offs=3), p, rng=random.Random(0))
+    print("INFO: building floor templates from scratch:\t{:.2f}ms per partition".format(
+        (time.perf_counter() - start) * 1000 / len(worldgen2._FLOOR_TEMPLATES)))
+
+
+def _reference_try_to_place_feature_into_rect(feature, tilish, rect, rng=None):
+    rots = [0]
+    if feature.can_rotate:
+        rots.extend([1, 2, 3])
+
+    rng.shuffle(rots)
+    for rot in rots:
+        rotated_feature = feature
+        for _ in range(0, rot):
+            rotated_feature = rotated_feature._rotated_once()
+
+        possible_placements = []
+        for x in range(rect[0] - rotated_feature.w() + 1, rect[0] + rect[2]):
+            for y in range(rect[1] - rotated_feature.h(), rect[1] + rect[3]):
+                if rotated_feature.can_place_at(tilish, x, y):
+                    possible_placements.append((x, y))
+
+        if len(possible_placements) > 0:
+            placement = rng.choice(possible_placements)
+            worldgen2.FeatureUtils.write_into(rotated_feature, tilish, placement[0], placement[1])
+            return True
+
+    return False
+
+
+class _ReferenceTileGrid(worldgen2.Tileish):
+    """the original TileGrid, which stores its tiles and reads through them for every cell."""
+
+    def __init__(self, grid_w, grid_h, tile_size=(16, 16)):
+        worldgen2.Tileish.__init__(self)
+        self.tile_size = tile_size
+        self.tiles = [[None] * grid_h for _ in range(0, grid_w)]
+
+    def w(self):
+        return self.tile_size[0] * len(self.tiles)
+
+    def h(self):
+        return self.tile_size[1] * len(self.tiles[0])
+
+    def tile_at(self, x, y):
+        grid_x, grid_y = int(x / self.tile_size[0]), int(y / self.tile_size[1])
+        if x < 0 or y < 0 or grid_x >= len(self.tiles) or grid_y >= len(self.tiles[0]):
+            return None
+        return self.tiles[grid_x][grid_y]
+
+    def get(self, x, y):
+        t = self.tile_at(x, y)
+        if t is None:
+            return TileType.EMPTY
+        return t.get(x % self.tile_size[0], y % self.tile_size[1])
+
+    def set_tile(self, grid_x, grid_y, tile):
+        self.tiles[grid_x][grid_y] = tile
+
+    def set(self, x, y, val):
+        t = self.tile_at(x, y)
+        if t is None:
+            if val is not TileType.EMPTY:
+                raise ValueError("tile is None at ({}, {})".format(x, y))
+        else:
+            t.set(x % self.tile_size[0], y % self.tile_size[1], val)
+
+
+def _reference_clean_up_dangly_bits(tile_grid, source_xy=None):
+    if source_xy is not None:
+        if worldgen2.TileGridBuilder.is_dangly(source_xy[0], source_xy[1], tile_grid):
+            tile_grid.set(source_xy[0], source_xy[1], TileType.EMPTY)
+            for n in Utils.neighbors(source_xy[0], source_xy[1]):
+                _reference_clean_up_dangly_bits(tile_grid, source_xy=n)
+    else:
+        for x in range(0, tile_grid.w()):
+            for y in range(0, tile_grid.h()):
+                if worldgen2.TileGridBuilder.is_dangly(x, y, tile_grid):
+                    _reference_clean_up_dangly_bits(tile_grid, source_xy=(x, y))
+
+
+def _reference_clean_up_doors(tile_grid):
+    for x in range(0, tile_grid.w()):
+        for y in range(0, tile_grid.h()):
+            if tile_grid.get(x, y) == TileType.DOOR and not worldgen2.TileGridBuilder.is_valid_door_coord(x, y, tile_grid):
+                tile_grid.set(x, y, TileType.FLOOR)
+
+
+def _reference_add_walls(tile_grid):
+    needs_walls = []
+    for x in range(0, tile_grid.w()):
+        for y in range(0, tile_grid.h()):
+            if tile_grid.get(x, y) == TileType.EMPTY:
+                if any(tile_grid.get(n[0], n[1]) != TileType.EMPTY for n in Utils.neighbors(x, y, and_diags=True)):
+                    needs_walls.append((x, y))
+    for (x, y) in needs_walls:
+        tile_grid.set(x, y, TileType.WALL)
+
+
+def _reference_fill_empty_islands_with_walls(tile_grid, smaller_than=16):
+    seen = set()
+    for x in range(0, tile_grid.w()):
+        for y in range(0, tile_grid.h()):
+            if (x, y) in seen:
+                continue
+            island = worldgen2.TileGridBuilder.flood_search(tile_grid, x, y, (TileType.EMPTY))
+            seen.update(island)
+            if 0 < len(island) < smaller_than:
+                for pos in island:
+                    tile_grid.set(pos[0], pos[1], TileType.WALL)
+
+
+def _reference_search(tile_grid, for_values):
+    return set(xy for xy in tile_grid.coords() if for_values is None or tile_grid.get(xy[0], xy[1]) in for_values)
+
+
+class _ReferenceWorldgen:
+    """temporarily swaps the original implementations back into worldgen2."""
+
+    _SWAPS = [(worldgen2.FeatureUtils, "try_to_place_feature_into_rect", _reference_try_to_place_feature_into_rect),
+              (worldgen2.TileFiller, "basic_room_fill",
+               lambda tile, partition, rng=None, **kwargs: _reference_basic_room_fill(tile, partition, rng)),
+              (worldgen2.TileGridBuilder, "clean_up_dangly_bits", _reference_clean_up_dangly_bits),
+              (worldgen2.TileGridBuilder, "clean_up_doors", _reference_clean_up_doors),
+              (worldgen2.TileGridBuilder, "add_walls", _reference_add_walls),
+              (worldgen2.TileGridBuilder, "fill_empty_islands_with_walls", _reference_fill_empty_islands_with_walls),
+              (worldgen2.TileGridBuilder, "search", _reference_search)]
+
+    def __enter__(self):
+        self._originals = [(cls, name, cls.__dict__[name]) for (cls, name, _) in self._SWAPS]
+        for (cls, name, func) in self._SWAPS:
+            setattr(cls, name, staticmethod(func))
+        self._tile_grid = worldgen2.TileGrid
+        worldgen2.TileGrid = _ReferenceTileGrid
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for (cls, name, original) in self._originals:
+            setattr(cls, name, original)
+        worldgen2.TileGrid = self._tile_grid
+        return False
+
+
+def bench_generate_tile_grid(levels=(0, 5, 10), dims=(3, 3), n_seeds=20, seed=505):
+    """times ZoneBuilder.generate_tile_grid_dangerously, with the original worldgen code and the current code."""
+    import src.worldgen.zones as zones
+
+    def gen_all(level):
+        res = []
+        for i in range(0, n_seeds):
+            rng = random.Random(seed + i)
+            try:
+                t_grid = zones.ZoneBuilder.generate_tile_grid_dangerously(None, level, dims=dims, n_story_npcs=0,
+                                                                          rng=rng)
+                res.append((str(t_grid), rng.getstate()))
+            except ValueError as e:
+                res.append((str(e), rng.getstate()))
+        return res
+
+    for level in levels:
+        start = time.perf_counter()
+        with _ReferenceWorldgen():
+            expected = gen_all(level)
+        ref_time = (time.perf_counter() - start) / n_seeds
+
+        start = time.perf_counter()
+        actual = gen_all(level)
+        cur_time = (time.perf_counter() - start) / n_seeds
+
+        for i in range(0, n_seeds):
+            if expected[i] != actual[i]:
+                raise ValueError("generated different grids for level={}, seed={}:\nexpected:\n{}\ngot:\n{}".format(
+                    level, seed + i, expected[i][0], actual[i][0]))
+
+        print("INFO: generate_tile_grid_dangerously (level={}, dims={}):\toriginal={:.2f}ms\tcurrent={:.2f}ms\t"
+              "({:.1f}x)".format(level, dims, ref_time * 1000, cur_time * 1000, ref_time / max(cur_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    bench_room_fill()
+    bench_generate_tile_grid()
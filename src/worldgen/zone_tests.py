@@ -1,49 +1,89 @@
-import src.worldgen.zones as zones
+import argparse
+
 import src.worldgen.worldgen2 as worldgen2
+import src.worldgen.batchgen as batchgen
+from src.worldgen.pregen import TileGridBlueprint
 
 
-def test_grids_are_possible(n, level, dims=(3, 3)):
+def check_grid(t_grid):
     """
         possible just means 1 start tile, at least one exit tile, and all exits are reachable from the start.
 
-        returns: an invalid tile grid if one is found, else None
+        returns: a description of what's wrong with the tile grid, or None if it's possible.
     """
-    for _ in range(0, n):
+    player_coords = worldgen2.TileGridBuilder.search(t_grid, worldgen2.TileType.PLAYER)
+
+    if len(player_coords) != 1:
+        return "more than one player spawn"
+
+    start = list(player_coords)[0]
+
+    exit_coords = worldgen2.TileGridBuilder.search(t_grid, worldgen2.TileType.EXIT)
+    if len(exit_coords) == 0:
+        return "no exit"
+
+    # whitelisting tiles instead of blacklisting so that we err on the side of false test failures
+    # instead of false passes when new tiletypes are added and we forget to update the test.
+    can_traverse = (worldgen2.TileType.PLAYER,
+                    worldgen2.TileType.EXIT,
+                    worldgen2.TileType.SIGN,
+                    worldgen2.TileType.DECORATION,
+                    worldgen2.TileType.CHEST,
+                    worldgen2.TileType.FLOOR,
+                    worldgen2.TileType.DOOR,
+                    worldgen2.TileType.MONSTER,
+                    worldgen2.TileType.STRAY_ITEM)
+
+    reachable_by_player = worldgen2.TileGridBuilder.flood_search(t_grid, start[0], start[1], can_traverse)
+    for ex in exit_coords:
+        if ex not in reachable_by_player:
+            return "unreachable exit: {}".format(ex)
 
-        t_grid = zones.ZoneBuilder.generate_tile_grid_dangerously(None, level, dims=dims)
-        player_coords = worldgen2.TileGridBuilder.search(t_grid, worldgen2.TileType.PLAYER)
+    return None
 
-        if len(player_coords) != 1:
-            print("FAIL: more than one player spawn (level={})".format(level))
-            return t_grid
 
-        start = list(player_coords)[0]
+def test_grids_are_possible(n, level, dims=(3, 3), first_seed=0, n_workers=None):
+    """
+        generates tile grids for seeds first_seed, first_seed + 1, ..., first_seed + n - 1 and checks them.
+
+        returns: (seed, tile grid) for the first invalid tile grid found (the grid is None if generation
+                 itself failed), else None
+    """
+    for result in batchgen.generate_tile_grids(level, dims, range(first_seed, first_seed + n), n_workers=n_workers):
+        if not result.is_ok():
+            print(result.error)
+            print("FAIL: failed to generate (level={}, dims={}, seed={})".format(level, dims, result.seed()))
+            return result.seed(), None
 
-        exit_coords = worldgen2.TileGridBuilder.search(t_grid, worldgen2.TileType.EXIT)
-        if len(exit_coords) == 0:
-            print("FAIL: no exit (level={})".format(level))
-            return t_grid
+        problem = check_grid(result.t_grid)
+        if problem is not None:
+            print("FAIL: {} (level={}, dims={}, seed={})".format(problem, level, dims, result.seed()))
+            return result.seed(), result.t_grid
 
-        # whitelisting tiles instead of blacklisting so that we err on the side of false test failures
-        # instead of false passes when new tiletypes are added and we forget to update the test.
-        can_traverse = (worldgen2.TileType.PLAYER,
-                        worldgen2.TileType.EXIT,
-                        worldgen2.TileType.SIGN,
-                        worldgen2.TileType.DECORATION,
-                        worldgen2.TileType.CHEST,
-                        worldgen2.TileType.FLOOR,
-                        worldgen2.TileType.DOOR,
-                        worldgen2.TileType.MONSTER,
-                        worldgen2.TileType.STRAY_ITEM)
+    return None
 
-        reachable_by_player = worldgen2.TileGridBuilder.flood_search(t_grid, start[0], start[1], can_traverse)
-        for ex in exit_coords:
-            if ex not in reachable_by_player:
-                print("FAIL: unreachable exit: {} (level={})".format(ex, level))
-                return t_grid
+
+def replay(level, dims, seed):
+    """regenerates (and re-checks) the exact tile grid a test produced for the given seed."""
+    t_grid = TileGridBlueprint(None, level, dims, 0, seed).generate_dangerously()
+    print(t_grid)
+    print("INFO: level={}, dims={}, seed={}: {}".format(level, dims, seed, check_grid(t_grid) or "ok"))
+    return t_grid
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that generated zones are possible to complete.")
+    parser.add_argument("--seed", type=int, default=0, help="the first seed to test")
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the number of seeds per test case")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (defaults to one per core)")
+    parser.add_argument("--replay", type=str, default=None, metavar="LEVEL,DIM_X,DIM_Y,SEED",
+                        help="regenerates and prints the grid for a single seed")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        lvl, dim_x, dim_y, replay_seed = [int(v) for v in args.replay.split(",")]
+        replay(lvl, (dim_x, dim_y), replay_seed)
+        quit(0)
 
     class _ZoneGenTestCase:
         def __init__(self, level, n, dims):
@@ -64,7 +104,7 @@ if __name__ == "__main__":
                 else:
                     n = 20
 
-                test_cases.append(_ZoneGenTestCase(lvl, n, (x, y)))
+                test_cases.append(_ZoneGenTestCase(lvl, n * args.scale, (x, y)))
 
     for i in range(0, len(test_cases)):
         test = test_cases[i]
@@ -72,9 +112,9 @@ if __name__ == "__main__":
         print("INFO: testing level={},\tn={},\tdims={}\t({:.1f}% complete)".format(
             test.level, test.n, test.dims, (100 * i / len(test_cases))))
 
-        err = test_grids_are_possible(test.level, test.n, dims=test.dims)
+        err = test_grids_are_possible(test.n, test.level, dims=test.dims, first_seed=args.seed, n_workers=args.workers)
         if err is not None:
-            print(err)
+            if err[1] is not None:
+                print(err[1])
+            print("INFO: replay with --replay {},{},{},{}".format(test.level, test.dims[0], test.dims[1], err[0]))
             quit(1)
-
-
@@ -0,0 +1,195 @@
+import src.game.simulation as simulation  # must be imported before pygame is initialized
+
+import io
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+import contextlib
+
+import numpy
+
+import src.utils.profiling as profiling
+
+
+"""
+Builds every generated storyline zone and every loot zone a bunch of times (with fixed seeds), and writes
+a JSON report of how long each phase of worldgen took, how many tries it needed, how often rooms and features
+failed to fit, and how much memory it peaked at. Reports from different builds can be diffed directly.
+
+Run with: python -m src.worldgen.zonegen_benchmarks --samples 20 --out zonegen_report.json
+"""
+
+
+def _summary_ms(samples):
+    """returns: map of stat name -> milliseconds"""
+    samples = sorted(samples)
+    if len(samples) == 0:
+        return {"mean": 0, "p50": 0, "p95": 0, "max": 0}
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+    return {"mean": round(1000 * sum(samples) / len(samples), 3),
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "max": round(samples[-1] * 1000, 3)}
+
+
+def _rate(n, total):
+    return round(n / total, 4) if total > 0 else 0
+
+
+def _zones_to_benchmark():
+    """returns: list of (zone_id, str: kind) for every zone that gets built out of generated or repeated parts."""
+    import src.worldgen.zones as zones
+
+    res = []
+    for zone_id in zones.all_storyline_zone_ids():
+        if zones.get_zone(zone_id).get_tile_grid_blueprint() is not None:
+            res.append((zone_id, "generated"))
+    for zone_id in zones.all_loot_zone_ids():
+        res.append((zone_id, "loot"))
+    return res
+
+
+def _build_quietly(zone):
+    """returns: the World, and whatever worldgen printed while building it."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        world = zone.build_world()
+    return world, out.getvalue()
+
+
+def bench_zone(zone_id, n_samples, seed):
+    """returns: a json blob of the zone's worldgen stats."""
+    import src.worldgen.zones as zones
+
+    zone = zones.get_zone(zone_id)
+    stats = profiling.get_worldgen_stats()
+
+    phase_times = {}   # phase -> list of secs, one per sample
+    total_times = []
+    counts = {}        # counter name -> total over all samples
+    attempts = []      # tile grid attempts per sample
+    world_sizes = set()
+
+    for i in range(0, n_samples):
+        random.seed(seed + i)
+        stats.reset()
+        stats.set_enabled(True)
+        try:
+            start = time.perf_counter()
+            world, _ = _build_quietly(zone)
+            total_times.append(time.perf_counter() - start)
+        finally:
+            stats.set_enabled(False)
+
+        world_sizes.add(world.size())
+        for (phase, secs) in stats.times().items():
+            phase_times.setdefault(phase, []).append(secs)
+        for (name, n) in stats.counts().items():
+            counts[name] = counts.get(name, 0) + n
+        attempts.append(stats.counts().get("tile_grid.attempts", 0))
+
+    # measured separately, since tracing allocations slows everything down
+    random.seed(seed)
+    tracemalloc.start()
+    try:
+        _build_quietly(zone)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    features = {}
+    for name in counts:
+        if name.startswith("feature_placement."):
+            feat_id, result = name[len("feature_placement."):].rsplit(".", 1)
+            features.setdefault(feat_id, {"placed": 0, "failed": 0})[result] = counts[name]
+    for feat_id in features:
+        feat = features[feat_id]
+        feat["failure_rate"] = _rate(feat["failed"], feat["placed"] + feat["failed"])
+
+    room_fills = counts.get("room_fill.calls", 0)
+
+    res = {
+        "level": zone.get_level(),
+        "n_samples": n_samples,
+        "world_sizes": sorted(list(s) for s in world_sizes),
+        "total_ms": _summary_ms(total_times),
+        "phases_ms": {phase: _summary_ms(phase_times[phase]) for phase in phase_times},
+        "peak_memory_kb": round(peak_bytes / 1024, 1)
+    }
+
+    if len(attempts) > 0 and max(attempts) > 0:
+        res["tile_grid"] = {
+            "attempts_mean": round(sum(attempts) / len(attempts), 3),
+            "attempts_max": max(attempts),
+            "failed_attempts": counts.get("tile_grid.failed_attempts", 0)
+        }
+        res["room_fill"] = {
+            "calls": room_fills,
+            "iterations_mean": round(counts.get("room_fill.iterations", 0) / max(1, room_fills), 2),
+            "hit_iter_limit": counts.get("room_fill.hit_iter_limit", 0),
+            "hit_iter_limit_rate": _rate(counts.get("room_fill.hit_iter_limit", 0), room_fills)
+        }
+        res["feature_placement"] = features
+
+    return res
+
+
+def run(n_samples=10, seed=0, zone_ids=None):
+    """returns: the whole report, as a json blob."""
+    if zone_ids is None:
+        to_bench = _zones_to_benchmark()
+    else:
+        to_bench = [(zone_id, None) for zone_id in zone_ids]
+
+    report = {
+        "environment": {"python": platform.python_version(),
+                        "numpy": numpy.__version__,
+                        "platform": sys.platform},
+        "n_samples": n_samples,
+        "seed": seed,
+        "zones": {}
+    }
+
+    for (zone_id, kind) in to_bench:
+        zone_stats = bench_zone(zone_id, n_samples, seed)
+        if kind is not None:
+            zone_stats["kind"] = kind
+        report["zones"][zone_id] = zone_stats
+
+        print("INFO: zone={:<12} level={:<3} total={:.2f}ms (p95={:.2f}ms)\tpeak_mem={:.0f}KB{}".format(
+            zone_id, zone_stats["level"], zone_stats["total_ms"]["mean"], zone_stats["total_ms"]["p95"],
+            zone_stats["peak_memory_kb"],
+            "\tattempts={:.2f}".format(zone_stats["tile_grid"]["attempts_mean"]) if "tile_grid" in zone_stats else ""))
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks worldgen for every generated and loot zone.")
+    parser.add_argument("--samples", type=int, default=10, help="number of times to build each zone")
+    parser.add_argument("--seed", type=int, default=0, help="the first seed (each sample uses the next one)")
+    parser.add_argument("--zones", type=str, default=None, help="comma-separated zone ids (defaults to all of them)")
+    parser.add_argument("--out", type=str, default=None, help="where to write the json report")
+    args = parser.parse_args()
+
+    simulation.init()
+
+    import src.worldgen.zones as zones
+    simulation.start_new_game(zones.first_zone_id())  # npcs and such expect a game to be in progress
+
+    zone_id_list = args.zones.split(",") if args.zones is not None else None
+    json_report = run(n_samples=args.samples, seed=args.seed, zone_ids=zone_id_list)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(json_report, f, indent=2, sort_keys=True)
+        print("INFO: wrote report to {}".format(args.out))
+    else:
+        print(json.dumps(json_report, indent=2, sort_keys=True))
@@ -2,6 +2,8 @@ import random
 import pygame
 import traceback
 
+import numpy
+
 from src.world.worldstate import World
 from src.worldgen.worldgen import WorldFactory, WorldBlueprint, RoomFactory, BuilderUtils
 from src.utils.util import Utils
@@ -18,6 +20,9 @@ import src.game.decoration as decoration
 import src.utils.colors as colors
 import src.game.debug as debug
 import src.game.constants as constants
+import src.worldgen.pregen as pregen
+import src.worldgen.blueprintcache as blueprintcache
+import src.utils.profiling as profiling
 
 _FIRST_ZONE_ID = None
 _ZONE_TRANSITIONS = {}
@@ -222,6 +227,66 @@ class ZoneLoader:
     EXIT = (255, 0, 0)
     RETURN_EXIT = (255, 50, 50)
 
+    # color -> (geo, alt art id, spawn kind), for every color the compiler recognizes.
+    COMPILED_COLORS = {EMPTY: (World.EMPTY, None, None),
+                       WALL: (World.WALL, None, None),
+                       WALL_CRACKED: (World.WALL, spriteref.WALL_CRACKED_ID, None),
+                       FLOOR: (World.FLOOR, None, None),
+                       FLOOR_CRACKED: (World.FLOOR, FLOOR_ID_LOOKUP[FLOOR_CRACKED], None),
+                       FLOOR_FANCY: (World.FLOOR, FLOOR_ID_LOOKUP[FLOOR_FANCY], None),
+                       FLOOR_SWAMP: (World.FLOOR, FLOOR_ID_LOOKUP[FLOOR_SWAMP], None),
+                       HOLE: (World.HOLE, None, None),
+                       DOOR: (World.DOOR, None, None),
+                       SENSOR_DOOR: (World.DOOR, None, "sensor_door"),
+                       MUSIC_DOOR: (World.DOOR, None, "music_door"),
+                       RETURN_EXIT: (World.FLOOR, None, "return_exit"),
+                       EXIT: (World.FLOOR, None, "exit"),
+                       CHEST_SPAWN: (World.FLOOR, None, "chest"),
+                       MONSTER_SPAWN: (World.FLOOR, None, "monster"),
+                       PLAYER_SPAWN: (World.FLOOR, None, "player"),
+                       SAVE_STATION: (World.FLOOR, None, "save_station")}
+
+    @staticmethod
+    def compile_blueprint_image(filepath):
+        """
+            decodes the whole image at once. nothing here can depend on the zone, because the result is cached.
+            returns: CompiledBlueprint
+        """
+        raw_img = pygame.image.load(filepath)
+        rgb = pygame.surfarray.array3d(raw_img).astype(numpy.int32)  # indexed by [x, y, channel]
+        packed = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+
+        geo = numpy.full(packed.shape, World.EMPTY, dtype=numpy.uint8)
+        alt_art = numpy.full(packed.shape, -1, dtype=numpy.int8)
+        known = numpy.zeros(packed.shape, dtype=bool)
+        spawns = {}
+
+        for color in ZoneLoader.COMPILED_COLORS:
+            geo_val, alt_art_id, kind = ZoneLoader.COMPILED_COLORS[color]
+            is_color = packed == ((color[0] << 16) | (color[1] << 8) | color[2])
+            known |= is_color
+            geo[is_color] = geo_val
+            if alt_art_id is not None:
+                alt_art[is_color] = alt_art_id
+            if kind is not None:
+                spawns[kind] = numpy.argwhere(is_color).astype(numpy.int32)
+
+        # unknown colors are still partially readable from their red channel
+        unknown = ~known
+        red = rgb[:, :, 0]
+        for color in ZoneLoader.FLOOR_ID_LOOKUP:
+            is_floorish = unknown & (red == color[0])
+            geo[is_floorish] = World.FLOOR
+            alt_art[is_floorish] = ZoneLoader.FLOOR_ID_LOOKUP[color]
+        geo[unknown & (red == ZoneLoader.WALL[0])] = World.WALL
+
+        unknown_xys = numpy.argwhere(unknown)
+        unknown_packed, unknown_idxs = numpy.unique(packed[unknown], return_inverse=True)
+        unknown_colors = numpy.stack([unknown_packed >> 16, (unknown_packed >> 8) & 0xFF, unknown_packed & 0xFF], axis=-1)
+        unknowns = numpy.column_stack([unknown_xys, unknown_idxs.reshape(-1, 1)]).astype(numpy.int32)
+
+        return blueprintcache.CompiledBlueprint(geo, alt_art, spawns, unknown_colors.astype(numpy.int32), unknowns)
+
     @staticmethod
     def load_blueprint_from_file(zone_id, filename, level):
         """
@@ -229,79 +294,42 @@ class ZoneLoader:
         """
         try:
             filepath = "assets/zones/" + filename
-            raw_img = pygame.image.load(Utils.resource_path(filepath))
-            img_size = (raw_img.get_width(), raw_img.get_height())
-            bp = WorldBlueprint(img_size, level)
+            compiled = blueprintcache.get_compiled(Utils.resource_path(filepath), filename.replace(".", "_"),
+                                                   ZoneLoader.compile_blueprint_image)
+            bp = WorldBlueprint(compiled.size(), level)
 
             exit_id = next_storyline_zone(zone_id)  # will be None if this isn't a storyline zone
 
             bp.geo_color = get_zone(zone_id).get_color()
 
-            unknowns = {}
-
-            for x in range(0, img_size[0]):
-                for y in range(0, img_size[1]):
-                    color = raw_img.get_at((x, y))
-                    color = (color[0], color[1], color[2])
-
-                    if color == ZoneLoader.EMPTY:
-                        continue
-                    elif color == ZoneLoader.WALL:
-                        bp.set(x, y, World.WALL)
-                    elif color == ZoneLoader.WALL_CRACKED:
-                        bp.set(x, y, World.WALL)
-                        bp.set_alt_art(x, y, spriteref.WALL_CRACKED_ID)
-                    elif color == ZoneLoader.FLOOR:
-                        bp.set(x, y, World.FLOOR)
-                    elif color in ZoneLoader.FLOOR_ID_LOOKUP:
-                        bp.set(x, y, World.FLOOR)
-                        bp.set_alt_art(x, y, ZoneLoader.FLOOR_ID_LOOKUP[color])
-                    elif color == ZoneLoader.HOLE:
-                        bp.set(x, y, World.HOLE)
-                    elif color == ZoneLoader.DOOR:
-                        bp.set(x, y, World.DOOR)
-                    elif color == ZoneLoader.SENSOR_DOOR:
-                        bp.set_sensor_door(x, y)
-                    elif color == ZoneLoader.MUSIC_DOOR:
-                        music_id = get_zone(zone_id).get_special_door_music_id()
-                        if music_id is None:
-                            print("WARN: no song exists for music door at ({}, {})".format(x, y))
-                            bp.set(x, y, World.DOOR)
-                        else:
-                            bp.set_music_door(x, y, music_id)
-                    elif color == ZoneLoader.RETURN_EXIT:
-                        bp.set(x, y, World.FLOOR)
-                        bp.return_exit_spawns.append((x, y))
-                    elif color == ZoneLoader.EXIT:
-                        bp.set(x, y, World.FLOOR)
-                        bp.add_exit_door(x, y, exit_id)
-                    elif color == ZoneLoader.CHEST_SPAWN:
-                        bp.set(x, y, World.FLOOR)
-                        bp.chest_spawns.append((x, y))
-                    elif color == ZoneLoader.MONSTER_SPAWN:
-                        bp.set(x, y, World.FLOOR)
-                        bp.enemy_spawns.append((x, y))
-                    elif color == ZoneLoader.PLAYER_SPAWN:
-                        bp.set(x, y, World.FLOOR)
-                        bp.player_spawn = (x, y)
-                    elif color == ZoneLoader.SAVE_STATION:
-                        bp.set(x, y, World.FLOOR)
-                        bp.save_station = (x, y, get_zone(zone_id).get_save_id())
-                    else:
-                        mock_color = (color[0], color[0], color[0])
-                        if mock_color in ZoneLoader.FLOOR_ID_LOOKUP:
-                            bp.set(x, y, World.FLOOR)
-                            bp.set_alt_art(x, y, ZoneLoader.FLOOR_ID_LOOKUP[mock_color])
-                        elif color[0] == ZoneLoader.WALL[0]:
-                            bp.set(x, y, World.WALL)
+            bp.geo = compiled.geo.tolist()
+            bp.geo_alt_art = [[None if a < 0 else a for a in column] for column in compiled.alt_art.tolist()]
+
+            for (x, y) in compiled.get_spawns("sensor_door"):
+                bp.set_sensor_door(x, y)
+
+            for (x, y) in compiled.get_spawns("music_door"):
+                music_id = get_zone(zone_id).get_special_door_music_id()
+                if music_id is None:
+                    print("WARN: no song exists for music door at ({}, {})".format(x, y))
+                else:
+                    bp.set_music_door(x, y, music_id)
+
+            bp.return_exit_spawns.extend(compiled.get_spawns("return_exit"))
+
+            for (x, y) in compiled.get_spawns("exit"):
+                bp.add_exit_door(x, y, exit_id)
 
-                        pos = (x, y)
-                        if color in unknowns:
-                            unknowns[color].append(pos)
-                        else:
-                            unknowns[color] = [pos]
+            bp.chest_spawns.extend(compiled.get_spawns("chest"))
+            bp.enemy_spawns.extend(compiled.get_spawns("monster"))
 
-            return bp, unknowns
+            for (x, y) in compiled.get_spawns("player"):
+                bp.player_spawn = (x, y)
+
+            for (x, y) in compiled.get_spawns("save_station"):
+                bp.save_station = (x, y, get_zone(zone_id).get_save_id())
+
+            return bp, compiled.get_unknowns()
 
         except Exception as e:
             print("failed to load " + str(filename))
@@ -373,6 +401,9 @@ def build_world(zone_id, spawn_at_save_point=None, spawn_at_door_with_zone_id=No
         w.set_hidden(*grid_xy, False, and_fill_adj_floors=True)
         gs.get_instance().set_camera_center_in_world(*p.center())
 
+    if zone_id in _STORYLINE_ZONES:
+        pregen.get_instance().request(next_storyline_zone(zone_id))
+
     return w
 
 
@@ -429,6 +460,10 @@ class Zone:
     def build_world(self):
         pass
 
+    def get_tile_grid_blueprint(self):
+        """returns: a TileGridBlueprint, if the zone is generated from one (which means it can be pregenerated)."""
+        return None
+
     def is_boss_zone(self):
         return False
 
@@ -502,26 +537,29 @@ class ZoneBuilder:
         convo_npc_coords = []
         trade_npc_coords = []
 
-        for x in range(0, w):
-            for y in range(0, h):
-                tile_type = t_grid.get(x, y)
-                if tile_type == worldgen2.TileType.EMPTY:
-                    world.set_geo(x, y, World.EMPTY)
-                elif tile_type == worldgen2.TileType.WALL:
-                    world.set_geo(x, y, World.WALL)
-                elif tile_type == worldgen2.TileType.DOOR:
-                    world.set_geo(x, y, World.DOOR)
-                else:
-                    world.set_geo(x, y, World.FLOOR)
-                    if random.random() < 0.25:
-                        world.set_floor_type(spriteref.FLOOR_CRACKED_ID, xy=(x, y))
-
-                if tile_type == worldgen2.TileType.NPC:
-                    convo_npc_coords.append((x, y))
-                elif tile_type == worldgen2.TileType.TRADE_NPC:
-                    trade_npc_coords.append((x, y))
-                else:
-                    ZoneBuilder._add_entities_for_tile(zone_id, level, x, y, tile_type, world)
+        codes = t_grid.codes()
+        geo = numpy.full(codes.shape, World.FLOOR, dtype=numpy.uint8)
+        geo[codes == ord(worldgen2.TileType.EMPTY)] = World.EMPTY
+        geo[codes == ord(worldgen2.TileType.WALL)] = World.WALL
+        geo[codes == ord(worldgen2.TileType.DOOR)] = World.DOOR
+        floor_types = [[None] * h for _ in range(0, w)]
+
+        # empty and wall cells don't have anything else in them (but the rest still need to be visited in order,
+        # because they use the global rng).
+        for (x, y) in numpy.argwhere((geo != World.EMPTY) & (geo != World.WALL)).tolist():
+            tile_type = t_grid.get(x, y)
+            if tile_type != worldgen2.TileType.DOOR:
+                if random.random() < 0.25:
+                    floor_types[x][y] = spriteref.FLOOR_CRACKED_ID
+
+            if tile_type == worldgen2.TileType.NPC:
+                convo_npc_coords.append((x, y))
+            elif tile_type == worldgen2.TileType.TRADE_NPC:
+                trade_npc_coords.append((x, y))
+            else:
+                ZoneBuilder._add_entities_for_tile(zone_id, level, x, y, tile_type, world)
+
+        world.set_all_geo(geo, floor_types=floor_types)
 
         # distribute bonus decorations into valid positions
         if len(bonus_decorations) > 0:
@@ -560,10 +598,13 @@ class ZoneBuilder:
         return world
 
     @staticmethod
-    def generate_tile_grid(zone_id, level, dims=(3, 3), num_tries=100):
+    def generate_tile_grid(zone_id, level, dims=(3, 3), num_tries=100, n_story_npcs=None, rng=None):
+        stats = profiling.get_worldgen_stats()
         for i in range(0, num_tries):
+            stats.count("tile_grid.attempts")
             try:
-                res = ZoneBuilder.generate_tile_grid_dangerously(zone_id, level, dims=dims)
+                res = ZoneBuilder.generate_tile_grid_dangerously(zone_id, level, dims=dims, n_story_npcs=n_story_npcs,
+                                                                 rng=rng)
 
                 # looks like we did it
                 if res is not None:
@@ -572,6 +613,7 @@ class ZoneBuilder:
                     raise ValueError("got a null level...? level={}, dims={}".format(level, dims))
 
             except Exception as e:
+                stats.count("tile_grid.failed_attempts")
                 print("WARN: failed to generate tile grid {} time(s): level={}, dims={}".format(i+1, level, dims))
                 if debug.is_dev():
                     # y'all better fix this
@@ -583,130 +625,163 @@ class ZoneBuilder:
                          "after {} tries, crashing...".format(level, dims, num_tries))
 
     @staticmethod
-    def generate_tile_grid_dangerously(zone_id, level, dims=(3, 3)):
-        """dangerously = nonzero chance of failing to generate a valid level, and throwing an exception."""
+    def get_n_story_npcs(zone_id):
+        actual_zone = get_zone(zone_id, or_else=None)
+        if actual_zone is not None and len(actual_zone.get_conversation_ids()) > 0:
+            return min(len(actual_zone.get_conversation_ids()), actual_zone.get_max_n_conversations())
+        else:
+            return 0
+
+    @staticmethod
+    def generate_tile_grid_dangerously(zone_id, level, dims=(3, 3), n_story_npcs=None, rng=None):
+        """
+            dangerously = nonzero chance of failing to generate a valid level, and throwing an exception.
+            n_story_npcs: how many story npcs to try to add (defaults to what the zone allows).
+            rng: the random.Random to use (defaults to the global one). the same seed gives the same TileGrid.
+        """
+        rng = rng if rng is not None else random
+
         if dims[0] < 1 or dims[1] < 1 or dims[0] + dims[1] < 3:
             raise ValueError("dims are too small: ({}, {})".format(dims[0], dims[1]))
 
         start = (0, 0)
         end = (dims[0] - 1, dims[1] - 1)
         t_size = 12
-        path, p_grid = worldgen2.GridBuilder.random_partition_grid(dims[0], dims[1],
-                                                                   start=start, end=end, fully_connected=True)
-
-        t_grid = worldgen2.TileGrid(dims[0], dims[1], tile_size=(t_size, t_size))
-
-        room_map = {}  # (grid_x, grid_y) -> list of room_rects
-        empty_rooms = []
-
-        for x in range(0, dims[0]):
-            for y in range(0, dims[1]):
-                part = p_grid.get(x, y)
-                if part is not None:
-                    tile = worldgen2.Tile(t_size + 1, door_len=1, door_offs=3)
-                    rooms_in_tile = worldgen2.TileFiller.basic_room_fill(tile, part, disjoint_rooms=True,
-                                                                         connected_rooms=True)
-                    rooms = [[x * t_size + r[0], y * t_size + r[1], r[2], r[3]] for r in rooms_in_tile]
-
-                    if len(rooms) > 0:
-                        room_map[(x, y)] = rooms
-                        empty_rooms.extend(rooms)
-
-                    t_grid.set_tile(x, y, tile)
-
-        worldgen2.TileGridBuilder.clean_up_dangly_bits(t_grid)
-        worldgen2.TileGridBuilder.clean_up_doors(t_grid)
-        worldgen2.TileGridBuilder.add_walls(t_grid)
-        worldgen2.TileGridBuilder.fill_empty_islands_with_walls(t_grid)
+        stats = profiling.get_worldgen_stats()
+        with stats.section("partition_grid"):
+            path, p_grid = worldgen2.GridBuilder.random_partition_grid(dims[0], dims[1],
+                                                                       start=start, end=end, fully_connected=True,
+                                                                       rng=rng)
+
+        with stats.section("room_fill"):
+            t_grid = worldgen2.TileGrid(dims[0], dims[1], tile_size=(t_size, t_size))
+
+            room_map = {}  # (grid_x, grid_y) -> list of room_rects
+            empty_rooms = []
+
+            for x in range(0, dims[0]):
+                for y in range(0, dims[1]):
+                    part = p_grid.get(x, y)
+                    if part is not None:
+                        tile = worldgen2.Tile(t_size + 1, door_len=1, door_offs=3)
+                        rooms_in_tile = worldgen2.TileFiller.basic_room_fill(tile, part, disjoint_rooms=True,
+                                                                             connected_rooms=True, rng=rng)
+                        rooms = [[x * t_size + r[0], y * t_size + r[1], r[2], r[3]] for r in rooms_in_tile]
+
+                        if len(rooms) > 0:
+                            room_map[(x, y)] = rooms
+                            empty_rooms.extend(rooms)
+
+                        t_grid.set_tile(x, y, tile)
+
+        with stats.section("cleanup"):
+            worldgen2.TileGridBuilder.clean_up_dangly_bits(t_grid)
+            worldgen2.TileGridBuilder.clean_up_doors(t_grid)
+            worldgen2.TileGridBuilder.add_walls(t_grid)
+            worldgen2.TileGridBuilder.fill_empty_islands_with_walls(t_grid)
 
         if len(empty_rooms) <= 2:
             raise ValueError("no rooms..? n={}".format(len(empty_rooms)))
 
-        feature_counts = {}  # feat_id -> int count
-
-        # list of (Feature, ..., Feature, bool).
-        #
-        # the features represent a feature (and optional backups) to try to place
-        # if bool is True, will try to place the feature near the start. False will try near the end,
-        # and None will place the feature randomly.
-        required_path_features = [(worldgen2.Features.START, worldgen2.Features.BACKUP_START, True),
-                                  (worldgen2.Features.EXIT, False)]
-        optional_path_features = []
-
-        actual_zone = get_zone(zone_id, or_else=None)
-        if actual_zone is not None and len(actual_zone.get_conversation_ids()) > 0:
-            convos = [c for c in actual_zone.get_conversation_ids()]
-            n_to_add = min(len(convos), actual_zone.get_max_n_conversations())
-            for _ in range(0, n_to_add):
+        with stats.section("feature_placement"):
+            feature_counts = {}  # feat_id -> int count
+
+            # list of (Feature, ..., Feature, bool).
+            #
+            # the features represent a feature (and optional backups) to try to place
+            # if bool is True, will try to place the feature near the start. False will try near the end,
+            # and None will place the feature randomly.
+            required_path_features = [(worldgen2.Features.START, worldgen2.Features.BACKUP_START, True),
+                                      (worldgen2.Features.EXIT, False)]
+            optional_path_features = []
+
+            if n_story_npcs is None:
+                n_story_npcs = ZoneBuilder.get_n_story_npcs(zone_id)
+            for _ in range(0, n_story_npcs):
                 optional_path_features.append((worldgen2.Features.STORY_NPC, None))
 
-        all_path_features = required_path_features + optional_path_features
+            all_path_features = required_path_features + optional_path_features
 
-        for i in range(0, len(all_path_features)):
-            feat_spec = all_path_features[i]
-            required = i < len(required_path_features)
-            near_start = feat_spec[-1]
-            feats = [feat_spec[i] for i in range(0, len(feat_spec)-1)]
+            for i in range(0, len(all_path_features)):
+                feat_spec = all_path_features[i]
+                required = i < len(required_path_features)
+                near_start = feat_spec[-1]
+                feats = [feat_spec[i] for i in range(0, len(feat_spec)-1)]
 
-            candidate_rooms = []
+                candidate_rooms = []
 
-            for p in path:
-                rooms_in_p = list(room_map.get(p))
-                random.shuffle(rooms_in_p)
-                for r in rooms_in_p:
-                    if r not in empty_rooms:
-                        continue
-                    candidate_rooms.append(r)
+                for p in path:
+                    rooms_in_p = list(room_map.get(p))
+                    rng.shuffle(rooms_in_p)
+                    for r in rooms_in_p:
+                        if r not in empty_rooms:
+                            continue
+                        candidate_rooms.append(r)
 
-            if near_start is None:
-                random.shuffle(candidate_rooms)
-            elif near_start is False:
-                candidate_rooms.reverse()
+                if near_start is None:
+                    rng.shuffle(candidate_rooms)
+                elif near_start is False:
+                    candidate_rooms.reverse()
 
-            feat_added, to_room = ZoneBuilder._try_to_add_a_feature_to_any_room(t_grid, feats, candidate_rooms)
-            if to_room is not None:
-                empty_rooms.remove(to_room)
+                feat_added, to_room = ZoneBuilder._try_to_add_a_feature_to_any_room(t_grid, feats, candidate_rooms,
+                                                                                    rng=rng)
+                if to_room is not None:
+                    empty_rooms.remove(to_room)
 
-                if feat_added.feat_id not in feature_counts:
-                    feature_counts[feat_added.feat_id] = 1
-                else:
-                    feature_counts[feat_added.feat_id] += 1
+                    if feat_added.feat_id not in feature_counts:
+                        feature_counts[feat_added.feat_id] = 1
+                    else:
+                        feature_counts[feat_added.feat_id] += 1
 
-            elif required:
-                raise ValueError("failed to add feature {} to world".format(feat_spec[0].feat_id))
+                elif required:
+                    raise ValueError("failed to add feature {} to world".format(feat_spec[0].feat_id))
 
-        while len(empty_rooms) > 0:
-            r = empty_rooms.pop()
-            if random.random() < 0.95:
-                feat = worldgen2.Features.get_random_feature(at_level=level, current_counts=feature_counts)
-                if feat is not None:
-                    did_place = worldgen2.FeatureUtils.try_to_place_feature_into_rect(feat, t_grid, r)
+            while len(empty_rooms) > 0:
+                r = empty_rooms.pop()
+                if rng.random() < 0.95:
+                    feat = worldgen2.Features.get_random_feature(at_level=level, current_counts=feature_counts,
+                                                                 rng=rng)
+                    if feat is not None:
+                        did_place = worldgen2.FeatureUtils.try_to_place_feature_into_rect(feat, t_grid, r, rng=rng)
 
-                    if did_place:
-                        if feat.feat_id not in feature_counts:
-                            feature_counts[feat.feat_id] = 1
-                        else:
-                            feature_counts[feat.feat_id] += 1
+                        if did_place:
+                            if feat.feat_id not in feature_counts:
+                                feature_counts[feat.feat_id] = 1
+                            else:
+                                feature_counts[feat.feat_id] += 1
 
         return t_grid
 
     @staticmethod
-    def _try_to_add_a_feature_to_any_room(t_grid, features, rooms):
+    def _try_to_add_a_feature_to_any_room(t_grid, features, rooms, rng=None):
         for feat in features:
             for r in rooms:
-                if worldgen2.FeatureUtils.try_to_place_feature_into_rect(feat, t_grid, r):
+                if worldgen2.FeatureUtils.try_to_place_feature_into_rect(feat, t_grid, r, rng=rng):
                     return (feat, r)
         return (None, None)
 
     @staticmethod
-    def generate_new_world(zone, dims=None, min_dims=(3, 3), max_dims=(3, 3), bonus_decorations=()):
+    def _choose_dims(dims, min_dims, max_dims):
         if dims is not None:
-            grid_dims = dims
+            return dims
         else:
-            grid_dims = (random.choice([x for x in range(min(max_dims[0], min_dims[0]), max_dims[0] + 1)]),
-                         random.choice([y for y in range(min(min_dims[1], max_dims[1]), max_dims[1] + 1)]))
+            return (random.choice([x for x in range(min(max_dims[0], min_dims[0]), max_dims[0] + 1)]),
+                    random.choice([y for y in range(min(min_dims[1], max_dims[1]), max_dims[1] + 1)]))
 
-        t_grid = ZoneBuilder.generate_tile_grid(zone.get_id(), zone.get_level(), dims=grid_dims)
+    @staticmethod
+    def make_tile_grid_blueprint(zone, dims=None, min_dims=(3, 3), max_dims=(3, 3)):
+        grid_dims = ZoneBuilder._choose_dims(dims, min_dims, max_dims)
+        return pregen.TileGridBlueprint(zone.get_id(), zone.get_level(), grid_dims,
+                                        ZoneBuilder.get_n_story_npcs(zone.get_id()), random.getrandbits(32))
+
+    @staticmethod
+    def generate_new_world(zone, dims=None, min_dims=(3, 3), max_dims=(3, 3), bonus_decorations=()):
+        t_grid = pregen.get_instance().take(zone.get_id())
+        if t_grid is not None:
+            grid_dims = (t_grid.grid_w(), t_grid.grid_h())
+        else:
+            grid_dims = ZoneBuilder._choose_dims(dims, min_dims, max_dims)
+            t_grid = ZoneBuilder.generate_tile_grid(zone.get_id(), zone.get_level(), dims=grid_dims)
 
         print("INFO: generated world: zone={}, dims={}, level={}".format(zone.get_id(), grid_dims, zone.get_level()))
 
@@ -714,8 +789,9 @@ class ZoneBuilder:
             print(t_grid)
             print("\n")
 
-        w = ZoneBuilder._tile_grid_to_world(zone.get_id(), zone.get_level(), t_grid,
-                                            bonus_decorations=bonus_decorations)
+        with profiling.get_worldgen_stats().section("tile_grid_to_world"):
+            w = ZoneBuilder._tile_grid_to_world(zone.get_id(), zone.get_level(), t_grid,
+                                                bonus_decorations=bonus_decorations)
         w.set_geo_color(zone.get_color())
 
         return w
@@ -745,6 +821,9 @@ class ZoneBuilder:
         zone.build_world = lambda: ZoneBuilder.generate_new_world(zone, dims=dims,
                                                                   min_dims=min_dims, max_dims=max_dims,
                                                                   bonus_decorations=bonus_decorations)
+        zone.get_tile_grid_blueprint = lambda: ZoneBuilder.make_tile_grid_blueprint(zone, dims=dims,
+                                                                                    min_dims=min_dims,
+                                                                                    max_dims=max_dims)
         return zone
 
 
@@ -754,9 +833,12 @@ class LootZoneBuilder:
 
     @staticmethod
     def generate_new_world(zone):
-        bp, unknowns = ZoneLoader.load_blueprint_from_file(zone.get_id(), zone.get_file(), zone.get_level())
+        stats = profiling.get_worldgen_stats()
+        with stats.section("load_blueprint"):
+            bp, unknowns = ZoneLoader.load_blueprint_from_file(zone.get_id(), zone.get_file(), zone.get_level())
 
-        w = bp.build_world()
+        with stats.section("blueprint_to_world"):
+            w = bp.build_world()
 
         all_temps = [t for t in npc.all_templates()]
         if LootZoneBuilder.TRADE_NPC in unknowns: